@@ -4,21 +4,39 @@
 # %%
 """Configuration loading functionality for FFmpeg video quality evaluations."""
 
+from collections.abc import Iterator
+from concurrent.futures import FIRST_EXCEPTION
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import wait
+from copy import deepcopy
+from functools import cache
 import hashlib
 import json
 from pathlib import Path
+import threading
 from typing import Any
 from uuid import uuid4
 
-import requests
-from tqdm import tqdm
-
-from ffvqe.encoding.encoder import get_versions
-from ffvqe.encoding.encoder import getprobe
+from ffvqe.data.job_store import JobStore
+from ffvqe.data.job_store import read_encodes
+from ffvqe.data.job_store import store_path
+from ffvqe.data.result_cache import ResultCache
+from ffvqe.data.result_cache import is_completed
+from ffvqe.encoding.abort import AbortRules
+from ffvqe.utils.cache import FileHashCache
 from ffvqe.utils.exceptions import VQEError
 from ffvqe.utils.file_operations import getfilehash
 from ffvqe.utils.yaml_handler import create_yaml_handler
 
+# Number of references downloaded at once
+REFERENCE_DOWNLOAD_WORKERS: int = 3
+
+# Number of references verified at once
+REFERENCE_VERIFY_WORKERS: int = 4
+
+# Number of references hashed at once; hashing is bound by disk I/O
+REFERENCE_HASH_CONCURRENCY: int = 2
+
 
 def _get_default_patterns() -> list[dict[str, Any]]:
     """Get default encoding patterns.
@@ -256,23 +274,46 @@ def is_default_reference(ref_name: str, ref_file: str, ref_hash: str) -> bool:
     return False
 
 
-def download_reference_file(ref_file: str, ref_hash: str) -> bool:
+@cache
+def _latest_release() -> dict[str, Any]:
+    """GitHub の最新リリース情報を取得する (プロセス内で 1 回だけ).
+
+    Returns:
+        dict: GitHub API のリリース情報
+    """
+    import requests
+
+    api_url = "https://api.github.com/repos/naa0yama/ffvqe/releases/latest"
+    response = requests.get(api_url, timeout=30)
+    response.raise_for_status()
+    release: dict[str, Any] = response.json()
+    return release
+
+
+def download_reference_file(ref_file: str, ref_hash: str, position: int = 0) -> bool:
     """GitHub リリースからリファレンスファイルをダウンロードする.
 
+    ファイルは複数の Range リクエストで並列にダウンロードされ、中断しても次回は
+    続きから再開する。ハッシュ値はダウンロード中に計算され、ハッシュキャッシュに
+    登録されるため、検証時にファイルを読み直さない。
+
     Args:
         ref_file: ダウンロード先のファイルパス
         ref_hash: 期待されるハッシュ値
+        position: プログレスバーの位置
 
     Returns:
         bool: ダウンロードが成功したかどうか
     """
-    api_url = "https://api.github.com/repos/naa0yama/ffvqe/releases/latest"
+    # requests と tqdm はダウンロード時にだけ読み込む
+    import requests
+    from tqdm import tqdm
+
+    from ffvqe.utils.downloader import download_file
 
     try:
         # リリース情報を取得
-        response = requests.get(api_url, timeout=30)
-        response.raise_for_status()
-        release = response.json()
+        release = _latest_release()
 
         # ファイル名を取得
         file_name = Path(ref_file).name
@@ -284,43 +325,36 @@ def download_reference_file(ref_file: str, ref_hash: str) -> bool:
                 download_url = asset["browser_download_url"]
                 print(f"Downloading {file_name} from {download_url}...")  # noqa: T201
 
-                # ディレクトリが存在しない場合は作成
-                Path(ref_file).parent.mkdir(parents=True, exist_ok=True)
-
                 # ファイルサイズを取得
                 file_size = int(asset["size"])
 
-                with (
-                    requests.get(download_url, stream=True, timeout=30) as r,
-                    Path(ref_file).open(
-                        "wb",
-                    ) as f,
-                    tqdm(
-                        total=file_size,
-                        unit="B",
-                        unit_scale=True,
-                        desc=f"Downloading {file_name}",
-                        bar_format="{desc:92}{percentage:5.0f}%|{bar:20}{r_bar}",
-                    ) as pbar,
-                ):
-                    r.raise_for_status()
-                    for chunk in r.iter_content(chunk_size=8192):
-                        if chunk:
-                            f.write(chunk)
-                            pbar.update(len(chunk))
-
-                # ハッシュ値を検証
-                downloaded_hash = getfilehash(ref_file)
-                if downloaded_hash != ref_hash:
-                    print(  # noqa: T201
-                        f"Error: Downloaded file hash {downloaded_hash} "
-                        f"does not match expected hash {ref_hash}",
+                with tqdm(
+                    total=file_size,
+                    unit="B",
+                    unit_scale=True,
+                    desc=f"Downloading {file_name}",
+                    position=position,
+                    bar_format="{desc:92}{percentage:5.0f}%|{bar:20}{r_bar}",
+                ) as pbar:
+                    # ハッシュ値を検証
+                    download_file(
+                        download_url,
+                        Path(ref_file),
+                        size=file_size,
+                        sha256=ref_hash,
+                        progress=pbar.update,
                     )
-                    return False
+
+                # ダウンロード中に計算したハッシュ値をキャッシュする
+                __cache = FileHashCache()
+                try:
+                    __cache.put(Path(ref_file), ref_hash)
+                finally:
+                    __cache.close()
                 print(f"Successfully downloaded {file_name}")  # noqa: T201
                 return True
 
-    except (OSError, requests.RequestException) as e:
+    except (OSError, requests.RequestException, VQEError) as e:
         print(f"Error downloading reference file: {e}")  # noqa: T201
         return False
 
@@ -429,7 +463,7 @@ def _find_references_to_download(
 def _download_references(
     download_required: list[tuple[int, dict[str, Any]]],
 ) -> None:
-    """リファレンスファイルをダウンロードする.
+    """リファレンスファイルを並列にダウンロードする.
 
     Args:
         download_required: List of tuples containing (index, reference) for references to download.
@@ -442,50 +476,143 @@ def _download_references(
 
     print(f"Downloading {len(download_required)} reference files...")  # noqa: T201
 
-    for i, (_index, _ref) in enumerate(download_required):
-        print(f"[{i + 1}/{len(download_required)}] Processing {_ref['name']}...")  # noqa: T201
-
+    # 中断されても再開できるので、失敗があっても他のダウンロードは最後まで続ける
+    with ThreadPoolExecutor(
+        max_workers=min(REFERENCE_DOWNLOAD_WORKERS, len(download_required)),
+        thread_name_prefix="ffvqe-download",
+    ) as pool:
+        futures = [
+            pool.submit(download_reference_file, _ref["basefile"], _ref["basehash"], i)
+            for i, (_index, _ref) in enumerate(download_required)
+        ]
+
+    for future, (_index, _ref) in zip(futures, download_required, strict=True):
         # GitHub からダウンロード
-        if not download_reference_file(
-            _ref["basefile"],
-            _ref["basehash"],
-        ):
+        if not future.result():
             download_error_msg: str = f"Error: Failed to download reference file: {_ref['name']}"
             raise VQEError(download_error_msg)
 
 
-def _verify_references(configs: dict[str, Any]) -> None:
-    """リファレンスファイルのハッシュ値を検証する.
+class _VerifyCancelledError(Exception):
+    """Raised inside a verification worker after another reference failed."""
+
+
+def _verify_reference(
+    ref: dict[str, Any],
+    position: int,
+    io_slots: threading.Semaphore,
+    cancelled: threading.Event,
+) -> None:
+    """リファレンスファイル 1 つのハッシュ値を検証して FFprobe を実行する.
 
     Args:
-        configs: Configuration dictionary.
+        ref: Reference entry of the configuration.
+        position: Position of the progress bar.
+        io_slots: Semaphore bounding the number of files hashed at once.
+        cancelled: Set when another reference failed; aborts hashing.
 
     Raises:
-        VQEError: If reference file hash doesn't match.
+        VQEError: If the reference file is missing or its hash doesn't match.
     """
-    for _index, _ref in enumerate(configs["configs"]["references"]):
-        ref_file_path = Path(_ref["basefile"])
-        probe_file_path = Path(
-            f"{_ref['basefile'].replace(ref_file_path.suffix, '_ffprobe.json', 1)}",
+    from tqdm import tqdm
+
+    from ffvqe.encoding.encoder import getprobe
+    from ffvqe.encoding.reference_probe import cache_probe
+    from ffvqe.encoding.reference_probe import probe_file
+    from ffvqe.encoding.reference_probe import restore_probe
+
+    ref_file_path = Path(ref["basefile"])
+    probe_file_path = probe_file(ref["basefile"])
+    if probe_file_path.exists():
+        return
+
+    # リファレンスファイルが存在するか確認
+    if not ref_file_path.exists():
+        not_default_msg: str = (
+            f"Error: Reference file not found: {ref['name']} (not a default reference)"
         )
+        raise VQEError(not_default_msg)
+
+    with (
+        io_slots,
+        tqdm(
+            total=ref_file_path.stat().st_size,
+            unit="B",
+            unit_scale=True,
+            desc=f"[VERIFY] {ref['name']}",
+            position=position,
+            bar_format="{desc:92}{percentage:5.0f}%|{bar:20}{r_bar}",
+        ) as pbar,
+    ):
 
-        if not probe_file_path.exists():
-            # リファレンスファイルが存在するか確認
-            if not ref_file_path.exists():
-                not_default_msg: str = (
-                    f"Error: Reference file not found: {_ref['name']} (not a default reference)"
-                )
-                raise VQEError(not_default_msg)
+        def _progress(size: int) -> None:
+            if cancelled.is_set():
+                raise _VerifyCancelledError
+            pbar.update(size)
 
-            # ハッシュ値を検証
-            if configs["configs"]["references"][_index]["basehash"] != getfilehash(
-                _ref["basefile"],
-            ):
-                __msg: str = f"Error: references name: {_ref['name']}, basehash not match."
-                raise VQEError(__msg)
+        # ハッシュ値を検証
+        __hash: str = getfilehash(ref["basefile"], cache=True, progress=_progress)
+
+    if ref["basehash"] != __hash:
+        __msg: str = f"Error: references name: {ref['name']}, basehash not match."
+        raise VQEError(__msg)
+
+    print(f"References name: {ref['name']}, basehash successful.")  # noqa: T201
+    if cancelled.is_set():
+        return
+
+    # 同じ内容のリファレンスを別のパスで FFprobe 済みならキャッシュから復元する
+    if restore_probe(ref["basefile"], ref["basehash"]):
+        print(f"[CACHE ] ffprobe: {ref['name']}")  # noqa: T201
+        return
 
-            print(f"References name: {_ref['name']}, basehash successful.")  # noqa: T201
-            getprobe(videofile=_ref["basefile"])
+    getprobe(videofile=ref["basefile"])
+    if probe_file_path.exists():
+        with probe_file_path.open("r") as file:
+            cache_probe(ref["basehash"], json.load(file))
+
+
+def _verify_references(configs: dict[str, Any]) -> None:
+    """リファレンスファイルのハッシュ値を並列に検証する.
+
+    Up to ``REFERENCE_VERIFY_WORKERS`` references are verified at once, of which
+    at most ``REFERENCE_HASH_CONCURRENCY`` are hashed at the same time so that
+    the references do not compete for disk bandwidth. The first failure
+    cancels the references that have not finished yet.
+
+    Args:
+        configs: Configuration dictionary.
+
+    Raises:
+        VQEError: If reference file hash doesn't match.
+    """
+    references: list[dict[str, Any]] = configs["configs"]["references"]
+    if not references:
+        return
+
+    io_slots = threading.Semaphore(REFERENCE_HASH_CONCURRENCY)
+    cancelled = threading.Event()
+    with ThreadPoolExecutor(
+        max_workers=min(REFERENCE_VERIFY_WORKERS, len(references)),
+        thread_name_prefix="ffvqe-verify",
+    ) as pool:
+        futures = [
+            pool.submit(_verify_reference, _ref, _index, io_slots, cancelled)
+            for _index, _ref in enumerate(references)
+        ]
+        _, pending = wait(futures, return_when=FIRST_EXCEPTION)
+        if pending:
+            # 最初の失敗で残りの検証を中止する
+            cancelled.set()
+            for future in pending:
+                future.cancel()
+
+    # 設定ファイルの順で最初のエラーを報告する
+    for future in futures:
+        if future.done() and not future.cancelled():
+            __error = future.exception()
+            if __error is not None and not isinstance(__error, _VerifyCancelledError):
+                raise __error
 
 
 def _validate_references(configs: dict[str, Any], args: object, configfile: str) -> None:
@@ -556,10 +683,13 @@ def _get_datafile_path(
     if datafile == "":
         datafile = f"{Path(configfile).parent}/data{str(uuid4())[24:]}.json"
         configs["configs"]["datafile"] = datafile
-    elif Path(datafile).exists() and not getattr(args, "overwrite", False):
-        # __datafile がある and --overwrite フラグがない
-        with Path(datafile).open("r") as file:
-            encode_cfg = json.load(file)
+    elif (store_path(datafile).exists() or Path(datafile).exists()) and not getattr(
+        args,
+        "overwrite",
+        False,
+    ):
+        # __datafile (job store) がある and --overwrite フラグがない
+        encode_cfg = read_encodes(datafile)
 
     return datafile, encode_cfg
 
@@ -693,27 +823,134 @@ def _create_result_template(params: ResultTemplateParams) -> dict[str, Any]:
     }
 
 
-def _generate_encoding_configs(
-    configs: dict[str, Any],
+def _apply_abort_rules(encode: dict[str, Any], pattern: dict[str, Any]) -> dict[str, Any]:
+    """Copy the early-abort rules of a pattern to an encode configuration.
+
+    The rules are not part of the job ``id``; a pruned job is queued again
+    when the rules of its pattern have changed.
+
+    Args:
+        encode: Encode configuration generated from the pattern.
+        pattern: Encoding pattern, with optional ``abort`` rules.
+
+    Returns:
+        ``encode`` itself if its rules are unchanged, otherwise an updated copy,
+        so that the existing entry still compares unequal and is written.
+    """
+    __rules: dict[str, Any] = pattern.get("abort") or {}
+    AbortRules(__rules)
+    if encode.get("abort", {}) == __rules:
+        return encode
+    __encode: dict[str, Any] = deepcopy(encode)
+    __encode.pop("pruned", None)
+    if __rules:
+        __encode["abort"] = __rules
+    else:
+        __encode.pop("abort", None)
+    return __encode
+
+
+def _relabel_commandline(commandline: str, result: dict[str, Any], encode: dict[str, Any]) -> str:
+    """Rewrite the paths of another experiment in a command line.
+
+    Args:
+        commandline: Command line recorded by the other experiment.
+        result: Completed encode configuration of the other experiment.
+        encode: Encode configuration generated for this configuration.
+
+    Returns:
+        The command line with the reference and output paths of ``encode``.
+    """
+    # 出力ファイルは拡張子を除いて置換し、チャンクや VMAF ログのパスも書き換える
+    __outputs: tuple[str, str] = (
+        f"{Path(result['outfile']['filename']).with_suffix('')}",
+        f"{Path(encode['outfile']['filename']).with_suffix('')}",
+    )
+    return commandline.replace(*__outputs).replace(
+        result["infile"]["filename"],
+        encode["infile"]["filename"],
+    )
+
+
+def _reuse_result(encode: dict[str, Any], result: dict[str, Any]) -> dict[str, Any]:
+    """Fill in an encode configuration with the result of the same job from another experiment.
+
+    The encoded output is not copied: it stays where the other experiment wrote
+    it, or in the output store under its hash. The paths in the recorded
+    command lines are rewritten to the ones of this configuration.
+
+    Args:
+        encode: Encode configuration generated for this configuration.
+        result: Completed encode configuration with the same ``result_key``.
+
+    Returns:
+        A copy of ``result`` labelled like ``encode``.
+    """
+    __encode: dict[str, Any] = deepcopy(result)
+    # id, 入出力のパスと id に含まれないラベルはこの設定ファイルの値にする
+    __encode["id"] = encode["id"]
+    __encode["comments"] = encode["comments"]
+    __encode["infile"]["name"] = encode["infile"]["name"]
+    __encode["infile"]["type"] = encode["infile"]["type"]
+    __encode["infile"]["filename"] = encode["infile"]["filename"]
+    __encode["outfile"]["filename"] = encode["outfile"]["filename"]
+    if "commandline" in __encode:
+        __encode["commandline"] = _relabel_commandline(__encode["commandline"], result, encode)
+    __vmaf: dict[str, Any] = __encode.get("results", {}).get("vmaf", {})
+    if "commandline" in __vmaf:
+        __vmaf["commandline"] = _relabel_commandline(__vmaf["commandline"], result, encode)
+    __encode.pop("stages", None)
+    return __encode
+
+
+def _reuse_datafile_results(
     encode_cfg: list[dict[str, Any]],
+    basehashes: dict[str, str],
+    result_cache: ResultCache,
+) -> list[dict[str, Any]]:
+    """Fill in the unfinished entries of a datafile completed by another configuration.
+
+    Completed entries of the datafile are not stored in the cache: the
+    environment they were produced in is not recorded, so only jobs finished by
+    ``main_encode`` are shared.
+
+    Args:
+        encode_cfg: Existing encoding configurations.
+        basehashes: Basehash of each reference keyed by its ``basefile``.
+        result_cache: Results of every experiment.
+
+    Returns:
+        Copy of ``encode_cfg`` with the filled in entries replaced.
+    """
+    results_list = list(encode_cfg)
+    for position, encode in enumerate(encode_cfg):
+        if is_completed(encode):
+            continue
+        cached = result_cache.get(basehashes.get(encode["infile"]["filename"], ""), encode)
+        if cached is not None:
+            results_list[position] = _reuse_result(encode, cached)
+    return results_list
+
+
+def _result_templates(
+    configs: dict[str, Any],
     configfile: str,
     args: object,
-) -> list[dict[str, Any]]:
-    """Generate encoding configurations.
+) -> Iterator[tuple[dict[str, Any], dict[str, Any], dict[str, Any]]]:
+    """Create the result template of every pattern, preset, option and reference.
 
     Args:
         configs: Configuration dictionary.
-        encode_cfg: Existing encoding configurations.
         configfile: Path to the configuration file.
         args: Command line arguments.
 
-    Returns:
-        List of encoding configurations.
+    Yields:
+        Pattern, reference and result template of each job.
+
+    Raises:
+        VQEError: If ``outfile.options`` of a pattern is not a list.
     """
     distdir: Path = Path(f"./videos/dist/{Path(configfile).name.replace('.yml', '')}")
-    existing_encodes = {encode["id"]: encode for encode in encode_cfg}
-    results_list = list(encode_cfg)
-
     for pattern in configs["configs"]["patterns"]:
         presets: list[str] = pattern["presets"]
         for preset in presets:
@@ -731,19 +968,68 @@ def _generate_encoding_configs(
                         args=args,
                         distdir=distdir,
                     )
-                    result_template = _create_result_template(params)
-
-                    # 既存の encodes と比較して削除または追加
-                    if result_template["id"] not in existing_encodes:
-                        results_list.append(result_template)
-                        print(  # noqa: T201
-                            "encode new ...",
-                            f"basefile: {ref['name']:12}",
-                            f"preset: {result_template['preset']:8}",
-                            f"codec: {result_template['codec']:12}",
-                            f"type: {result_template['type']:24}",
-                            f"options: {result_template['outfile']['options']}",
-                        )
+                    yield pattern, ref, _create_result_template(params)
+
+
+def _generate_encoding_configs(
+    configs: dict[str, Any],
+    encode_cfg: list[dict[str, Any]],
+    configfile: str,
+    args: object,
+) -> list[dict[str, Any]]:
+    """Generate encoding configurations.
+
+    Completed results are shared with other configurations through the
+    ``ResultCache``: jobs that another configuration has already completed (on
+    the same reference content, at any path, with the same FFmpeg and library
+    builds as ``configs.environment``) are filled in from it instead of being
+    queued, unless ``--no-result-cache`` is given.
+
+    Args:
+        configs: Configuration dictionary.
+        encode_cfg: Existing encoding configurations.
+        configfile: Path to the configuration file.
+        args: Command line arguments.
+
+    Returns:
+        List of encoding configurations.
+    """
+    existing_positions = {encode["id"]: position for position, encode in enumerate(encode_cfg)}
+    reuse: bool = not getattr(args, "no_result_cache", False)
+    basehashes: dict[str, str] = {
+        ref["basefile"]: ref["basehash"] for ref in configs["configs"]["references"]
+    }
+
+    with ResultCache(configs["configs"].get("environment", {})) as result_cache:
+        results_list = (
+            _reuse_datafile_results(encode_cfg, basehashes, result_cache)
+            if reuse
+            else list(encode_cfg)
+        )
+
+        for pattern, ref, template in _result_templates(configs, configfile, args):
+            # 既存の encodes と比較して削除または追加
+            existing = existing_positions.get(template["id"])
+            if existing is not None:
+                # 流用した結果で置き換えた場合も、置き換え後の設定に適用する
+                results_list[existing] = _apply_abort_rules(results_list[existing], pattern)
+                continue
+
+            # 他の実験で完了済みのジョブはキューに入れず結果を流用する
+            cached = result_cache.get(ref["basehash"], template) if reuse else None
+            result_template = _apply_abort_rules(
+                template if cached is None else _reuse_result(template, cached),
+                pattern,
+            )
+            results_list.append(result_template)
+            print(  # noqa: T201
+                "encode new ..." if cached is None else "encode cached",
+                f"basefile: {ref['name']:12}",
+                f"preset: {result_template['preset']:8}",
+                f"codec: {result_template['codec']:12}",
+                f"type: {result_template['type']:24}",
+                f"options: {result_template['outfile']['options']}",
+            )
 
     return results_list
 
@@ -760,6 +1046,8 @@ def _add_environment_info(configs: dict[str, Any], configfile: str) -> dict[str,
     """
     # テスト時にはget_versionsをスキップ
     if configfile != "test_config.yml":
+        from ffvqe.encoding.encoder import get_versions
+
         configs["configs"]["environment"] = get_versions(configfile=configfile)
     else:
         configs["configs"]["environment"] = {
@@ -816,16 +1104,54 @@ def _save_configs(params: SaveConfigsParams) -> None:
     with Path(params.configfile).open("w") as file:
         yaml.dump(params.configs, file)
 
-    if len(params.existing_encodes) == len(params.results_list):
+    if list(params.existing_encodes.values()) == params.results_list:
         print(f"Exitst {params.datafile} no updated.")  # noqa: T201
-    elif params.config_flag is True:
-        print(f"Create datafile is {params.datafile} write.")  # noqa: T201
-        with Path(params.datafile).open("w") as file:
-            json.dump([], file)
-    else:
-        print(f"{len(params.results_list)} pattern is {params.datafile} write.")  # noqa: T201
-        with Path(params.datafile).open("w") as file:
-            json.dump(params.results_list, file)
+        return
+
+    # job store に書き込み、互換性のため JSON にもエクスポートする
+    with JobStore(params.datafile) as store:
+        if params.config_flag is True:
+            print(f"Create datafile is {params.datafile} write.")  # noqa: T201
+            store.replace([])
+        else:
+            print(f"{len(params.results_list)} pattern is {params.datafile} write.")  # noqa: T201
+            store.replace(params.results_list)
+        store.export_json()
+
+
+def read_config(configfile: str) -> dict[str, Any]:
+    """Read an existing configuration without validating or updating anything.
+
+    Only the YAML file is parsed: references are not hashed or probed, no
+    FFmpeg process is run and nothing is written. Used by the commands that
+    only read the results (``--summary``, ``--archive``).
+
+    Args:
+        configfile: Path to the configuration file.
+
+    Returns:
+        Dictionary containing configuration settings and data file path.
+
+    Raises:
+        VQEError: If the configuration file or its datafile entry is missing.
+    """
+    if not Path(configfile).exists():
+        __not_found_msg: str = f"Config file not found: {configfile}"
+        raise VQEError(__not_found_msg)
+
+    yaml = create_yaml_handler()
+    with Path(configfile).open("r") as file:
+        configs = yaml.load(file)
+
+    __datafile = configs.get("configs", {}).get("datafile") if isinstance(configs, dict) else None
+    if not isinstance(__datafile, str) or __datafile == "":
+        __datafile_msg: str = f"datafile is not specified in the config: {configfile}"
+        raise VQEError(__datafile_msg)
+
+    return {
+        "configs": configs["configs"],
+        "datafile": __datafile,
+    }
 
 
 def load_config(configfile: str, args: object) -> dict[str, Any]:
@@ -860,13 +1186,13 @@ def load_config(configfile: str, args: object) -> dict[str, Any]:
     # Get datafile path and load existing encode configurations
     datafile, encode_cfg = _get_datafile_path(configs, configfile, args)
 
+    # Add environment information (results are shared only within the same environment)
+    configs = _add_environment_info(configs, configfile)
+
     # Generate encoding configurations
     existing_encodes = {encode["id"]: encode for encode in encode_cfg}
     results_list = _generate_encoding_configs(configs, encode_cfg, configfile, args)
 
-    # Add environment information
-    configs = _add_environment_info(configs, configfile)
-
     # Save configurations
     save_params = SaveConfigsParams(
         configs=configs,
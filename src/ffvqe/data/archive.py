@@ -4,17 +4,19 @@
 # %%
 """Archive functionality for FFmpeg video quality evaluations."""
 
-import json
 from pathlib import Path
 import shutil
 from typing import Any
 
-from ffvqe.config.loader import load_config
+from ffvqe.config.loader import read_config
+from ffvqe.data.job_store import JobStore
+from ffvqe.data.job_store import read_encodes
+from ffvqe.data.job_store import store_path
 from ffvqe.utils.file_operations import compress_files
 from ffvqe.utils.yaml_handler import create_yaml_handler
 
 
-def archive(config_path: str, args: object) -> None:
+def archive(config_path: str, args: object) -> None:  # noqa: ARG001
     """Archive encoding results and data files.
 
     Compresses log files, moves data files to the assets directory,
@@ -24,7 +26,7 @@ def archive(config_path: str, args: object) -> None:
         config_path: Path to the configuration file.
         args: Command line arguments.
     """
-    __configs: dict[str, Any] = load_config(configfile=config_path, args=args)
+    __configs: dict[str, Any] = read_config(configfile=config_path)
     __configfile: Path = Path(config_path)
     __basedir: Path = Path(f"./videos/dist/{__configfile.name.replace('.yml', '')}")
     __datafile: Path = Path(f"{__configs['configs']['datafile']}")
@@ -34,8 +36,7 @@ def archive(config_path: str, args: object) -> None:
     __assetdir: Path = Path(f"./assets/{__basedir.name}/logs")
     __assetdir.mkdir(parents=True, exist_ok=True)
 
-    with Path(f"{__datafile}").open("r") as __file:
-        __data = json.load(__file)
+    __data = read_encodes(__datafile)
 
     __hashs: int = len(
         [encode["outfile"]["hash"] for encode in __data if encode["outfile"]["hash"] != ""],
@@ -61,9 +62,14 @@ def archive(config_path: str, args: object) -> None:
     compress_files(dst=__assetdir, files=__archive_files)
 
     """move to configfile, csv datafile"""
+    if store_path(__datafile).exists():
+        with JobStore(__datafile) as __store:
+            __store.export_json()
+
     for file in [
         __configfile,
         __datafile,
+        store_path(__datafile),
         __datafilecsv_all,
         __datafilecsv_gby_option,
         __datafilecsv_gby_type,
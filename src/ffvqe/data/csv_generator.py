@@ -4,15 +4,16 @@
 # %%
 """CSV generation functionality for FFmpeg video quality evaluations."""
 
-import json
-from pathlib import Path
 import sys
 
 import duckdb
 
+from ffvqe.data.job_store import exported_json
+from ffvqe.data.job_store import read_encodes
+
 
 def check_json_data(datafile: str) -> bool:
-    """Check if JSON data file exists and contains data.
+    """Check if JSON data file (or its job store) exists and contains data.
 
     Args:
         datafile: Path to the JSON data file.
@@ -22,8 +23,7 @@ def check_json_data(datafile: str) -> bool:
     """
     data: list[dict] = []
     try:
-        with Path(f"{datafile}").open("r") as file:
-            data = json.load(file)
+        data = read_encodes(datafile)
     except FileNotFoundError:
         return False
 
@@ -42,6 +42,11 @@ def create_duckdb_connection() -> duckdb.DuckDBPyConnection:
 def create_temporary_table(connection: duckdb.DuckDBPyConnection, datafile: str) -> None:
     """Create a temporary table from JSON data.
 
+    A ``single_pass`` column marks the jobs scored in the encode pass
+    (``results.encode.includes_vmaf``), whose encode time includes libvmaf.
+    The flag is read through JSON so datafiles without any single-pass job
+    (and no such field) load too.
+
     Args:
         connection: DuckDB connection object.
         datafile: Path to the JSON data file.
@@ -49,7 +54,9 @@ def create_temporary_table(connection: duckdb.DuckDBPyConnection, datafile: str)
     connection.execute(
         f"""
             CREATE TEMPORARY TABLE encodes AS
-            SELECT *
+            SELECT
+                *,
+                COALESCE(to_json(results.encode)->>'includes_vmaf' = 'true', false) AS single_pass
             FROM read_json('{datafile}')
         """,  # noqa: S608
     )
@@ -58,11 +65,16 @@ def create_temporary_table(connection: duckdb.DuckDBPyConnection, datafile: str)
 def getcsv(datafile: str, db_connection: duckdb.DuckDBPyConnection | None = None) -> None:
     """Generate CSV files from JSON data.
 
-    Processes the JSON data file and generates three CSV files:
+    Processes the job store of the datafile (or the JSON data file if there is
+    no store) and generates three CSV files:
     - _all.csv: Contains all data points
     - _gby_type.csv: Data grouped by reference type
     - _gby_option.csv: Data grouped by encoding options
 
+    Single-pass jobs are marked by the ``single_pass`` column and grouped
+    apart; their ``enc_sec`` and ``enc_time`` are left NULL since the encode
+    time includes libvmaf.
+
     Args:
         datafile: Path to the JSON data file.
         db_connection: Optional DuckDB connection for testing.
@@ -72,9 +84,10 @@ def getcsv(datafile: str, db_connection: duckdb.DuckDBPyConnection | None = None
 
     print(f"[CSV   ] load {datafile} ....")  # noqa: T201
 
-    # Create a temporary table from the JSON data
+    # Create a temporary table from the job store (or the JSON data)
     con = db_connection if db_connection else create_duckdb_connection()
-    create_temporary_table(con, datafile)
+    with exported_json(datafile) as jsonfile:
+        create_temporary_table(con, jsonfile)
 
     # Generate CSV files if data exists
     __csvfile_all: str = f"{datafile}".replace(".json", "_all.csv", 1)
@@ -91,6 +104,7 @@ def getcsv(datafile: str, db_connection: duckdb.DuckDBPyConnection | None = None
             type                                                   AS type,
             preset                                                 AS preset,
             threads                                                AS threads,
+            single_pass                                            AS single_pass,
             outfile.stream.gop                                     AS gop,
             outfile.stream.has_b_frames                            AS has_b_frames,
             outfile.stream.refs                                    AS refs,
@@ -105,8 +119,8 @@ def getcsv(datafile: str, db_connection: duckdb.DuckDBPyConnection | None = None
             outfile.size_kbyte                                     AS outfile_size_kbyte,
             outfile.bit_rate_kbs                                   AS outfile_bit_rate_kbs,
             outfile.options                                        AS outfile_options,
-            results.encode.second                                  AS enc_sec,
-            results.encode.time                                    AS enc_time,
+            IF(single_pass, NULL, results.encode.second)           AS enc_sec,
+            IF(single_pass, NULL, results.encode.time)             AS enc_time,
             results.compression_ratio_persent                      AS comp_ratio_persent,
             results.encode.speed                                   AS enc_speed,
             results.vmaf.pooled_metrics.float_ssim.min             AS ssim_min,
@@ -125,6 +139,7 @@ def getcsv(datafile: str, db_connection: duckdb.DuckDBPyConnection | None = None
             type                                                       AS type,
             preset                                                     AS preset,
             threads                                                    AS threads,
+            single_pass                                                AS single_pass,
             MAX(outfile.stream.gop)                                    AS gop,
             MAX(outfile.stream.has_b_frames)                           AS has_b_frames,
             MAX(outfile.stream.refs)                                   AS refs,
@@ -136,7 +151,7 @@ def getcsv(datafile: str, db_connection: duckdb.DuckDBPyConnection | None = None
             AVG(outfile.size_kbyte)                                    AS outfile_size_kbyte,
             AVG(outfile.bit_rate_kbs)                                  AS outfile_bit_rate_kbs,
             outfile.options                                            AS outfile_options,
-            AVG(results.encode.second)                                 AS enc_sec,
+            AVG(IF(single_pass, NULL, results.encode.second))          AS enc_sec,
             AVG(results.compression_ratio_persent)                     AS comp_ratio_persent,
             AVG(results.encode.speed)                                  AS enc_speed,
             AVG(results.vmaf.pooled_metrics.float_ssim.min)            AS ssim_min,
@@ -144,7 +159,7 @@ def getcsv(datafile: str, db_connection: duckdb.DuckDBPyConnection | None = None
             AVG(results.vmaf.pooled_metrics.vmaf.min)                  AS vmaf_min,
             AVG(results.vmaf.pooled_metrics.vmaf.harmonic_mean)        AS vmaf_mean
         FROM encodes
-        GROUP BY codec, type, preset, threads, ref_type, outfile_options
+        GROUP BY codec, type, preset, threads, single_pass, ref_type, outfile_options
     """
     con.sql(type_query).write_csv(__csvfile_type)
 
@@ -156,6 +171,7 @@ def getcsv(datafile: str, db_connection: duckdb.DuckDBPyConnection | None = None
             type                                                       AS type,
             preset                                                     AS preset,
             threads                                                    AS threads,
+            single_pass                                                AS single_pass,
             MAX(outfile.stream.gop)                                    AS gop,
             MAX(outfile.stream.has_b_frames)                           AS has_b_frames,
             MAX(outfile.stream.refs)                                   AS refs,
@@ -166,7 +182,7 @@ def getcsv(datafile: str, db_connection: duckdb.DuckDBPyConnection | None = None
             AVG(outfile.size_kbyte)                                    AS outfile_size_kbyte,
             AVG(outfile.bit_rate_kbs)                                  AS outfile_bit_rate_kbs,
             outfile.options                                            AS outfile_options,
-            AVG(results.encode.second)                                 AS enc_sec,
+            AVG(IF(single_pass, NULL, results.encode.second))          AS enc_sec,
             AVG(results.compression_ratio_persent)                     AS comp_ratio_persent,
             AVG(results.encode.speed)                                  AS enc_speed,
             AVG(results.vmaf.pooled_metrics.float_ssim.min)            AS ssim_min,
@@ -174,7 +190,7 @@ def getcsv(datafile: str, db_connection: duckdb.DuckDBPyConnection | None = None
             AVG(results.vmaf.pooled_metrics.vmaf.min)                  AS vmaf_min,
             AVG(results.vmaf.pooled_metrics.vmaf.harmonic_mean)        AS vmaf_mean
         FROM encodes
-        GROUP BY codec, type, preset, threads, outfile_options
+        GROUP BY codec, type, preset, threads, single_pass, outfile_options
     """
     con.sql(option_query).write_csv(__csvfile_option)
 
@@ -0,0 +1,292 @@
+#!/usr/bin/env python3
+# To add a new cell, type '# %%'
+# To add a new markdown cell, type '# %% [markdown]'
+# %%
+"""Transactional job store for FFmpeg video quality evaluations."""
+
+from collections.abc import Iterator
+from contextlib import contextmanager
+import hashlib
+import json
+import os
+from pathlib import Path
+import sqlite3
+import tempfile
+import threading
+from types import TracebackType
+from typing import Any
+from typing import Self
+
+
+def store_path(datafile: str | Path) -> Path:
+    """Get the path of the job store that belongs to a JSON datafile.
+
+    Args:
+        datafile: Path to the JSON datafile.
+
+    Returns:
+        Path of the SQLite job store next to the datafile.
+    """
+    return Path(datafile).with_suffix(".sqlite3")
+
+
+class JobStore:
+    """SQLite (WAL mode) store with one row per datafile entry.
+
+    Finishing a job stage only rewrites that job's row, in its own transaction,
+    instead of the whole JSON datafile. The JSON datafile is kept as an export
+    for compatibility: ``export_json`` writes the store back to it atomically,
+    and the store records the SHA-256 of the JSON datafile it was seeded from
+    or exported to. When the JSON datafile no longer matches (edited, restored
+    or updated by ``git pull``) the store is seeded from it again, so a stale
+    store never overrides it.
+
+    The connection may be shared by worker threads; writes are serialized by a
+    lock.
+    """
+
+    def __init__(self, datafile: str | Path) -> None:
+        """Open (and create or seed from the JSON datafile if needed) the store of a datafile.
+
+        Args:
+            datafile: Path to the JSON datafile.
+        """
+        self.datafile = Path(datafile)
+        self.path = store_path(datafile)
+        self._lock = threading.Lock()
+        self._con = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        self._con.execute("PRAGMA journal_mode=WAL")
+        self._con.execute("PRAGMA synchronous=NORMAL")
+        self._con.execute(
+            "CREATE TABLE IF NOT EXISTS encodes"
+            " (position INTEGER PRIMARY KEY, id TEXT NOT NULL, data TEXT NOT NULL)",
+        )
+        self._con.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+        if self.datafile.is_file():
+            self._sync_datafile()
+
+    def _sync_datafile(self) -> None:
+        """Seed the store from the JSON datafile unless it holds its entries already."""
+        __content: bytes = self.datafile.read_bytes()
+        __digest: str = hashlib.sha256(__content).hexdigest()
+        __recorded: str | None = self._meta("datafile_sha256")
+        if __recorded == __digest:
+            return
+        # ハッシュを記録していない既存の store は、 JSON の方が新しい場合だけ置き換える
+        if __recorded is not None or self.count() == 0 or self._json_is_newer():
+            self.replace(json.loads(__content))
+        self._set_meta("datafile_sha256", __digest)
+
+    def _json_is_newer(self) -> bool:
+        """Check whether the JSON datafile was modified after the store.
+
+        Returns:
+            True if the datafile is newer than the store and its WAL file.
+        """
+        __wal: Path = self.path.with_name(f"{self.path.name}-wal")
+        __store_mtime: float = max(
+            __path.stat().st_mtime for __path in (self.path, __wal) if __path.exists()
+        )
+        return self.datafile.stat().st_mtime > __store_mtime
+
+    def _meta(self, key: str) -> str | None:
+        """Get a value of the store metadata.
+
+        Args:
+            key: Name of the value.
+
+        Returns:
+            The value, or None if it is not set.
+        """
+        with self._lock:
+            row = self._con.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return None if row is None else str(row[0])
+
+    def _set_meta(self, key: str, value: str) -> None:
+        """Set a value of the store metadata.
+
+        Args:
+            key: Name of the value.
+            value: Value to store.
+        """
+        with self._lock:
+            self._con.execute(
+                "INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)",
+                (key, value),
+            )
+
+    def __enter__(self) -> Self:
+        """Enter the runtime context.
+
+        Returns:
+            The store itself.
+        """
+        return self
+
+    def __exit__(
+        self,
+        exc_type: type[BaseException] | None,
+        exc_value: BaseException | None,
+        traceback: TracebackType | None,
+    ) -> None:
+        """Close the store when leaving the runtime context."""
+        self.close()
+
+    def close(self) -> None:
+        """Close the connection (checkpointing the WAL into the store file)."""
+        with self._lock:
+            self._con.close()
+
+    def count(self) -> int:
+        """Get the number of stored entries.
+
+        Returns:
+            Number of rows in the store.
+        """
+        with self._lock:
+            row = self._con.execute("SELECT count(*) FROM encodes").fetchone()
+        return int(row[0])
+
+    def load(self) -> list[dict[str, Any]]:
+        """Load all entries in datafile order.
+
+        Returns:
+            List of encode configurations.
+        """
+        with self._lock:
+            rows = self._con.execute("SELECT data FROM encodes ORDER BY position").fetchall()
+        return [json.loads(data) for (data,) in rows]
+
+    def replace(self, encode_cfg: list[dict[str, Any]]) -> None:
+        """Replace all entries in a single transaction.
+
+        Args:
+            encode_cfg: Encode configurations in datafile order.
+        """
+        rows = [
+            (position, encode.get("id", ""), json.dumps(encode))
+            for position, encode in enumerate(encode_cfg)
+        ]
+        with self._lock:
+            self._con.execute("BEGIN IMMEDIATE")
+            try:
+                self._con.execute("DELETE FROM encodes")
+                self._con.executemany(
+                    "INSERT INTO encodes (position, id, data) VALUES (?, ?, ?)",
+                    rows,
+                )
+            except BaseException:
+                self._con.execute("ROLLBACK")
+                raise
+            self._con.execute("COMMIT")
+
+    def update(self, position: int, encode: dict[str, Any]) -> None:
+        """Write a single entry.
+
+        Args:
+            position: Index of the entry in the datafile.
+            encode: Encode configuration to store.
+        """
+        with self._lock:
+            self._con.execute(
+                "INSERT OR REPLACE INTO encodes (position, id, data) VALUES (?, ?, ?)",
+                (position, encode.get("id", ""), json.dumps(encode)),
+            )
+
+    def export_json(self, path: str | Path | None = None, *, sync: bool = False) -> Path:
+        """Write all entries to a JSON file atomically.
+
+        The entries are written to a temporary file in the same directory that
+        then replaces the target, so readers never see a partial datafile. The
+        hash of an export to the datafile is recorded, so the store is not
+        seeded again from its own export.
+
+        Args:
+            path: Target file. Defaults to the datafile.
+            sync: Whether to fsync the file before replacing the target.
+
+        Returns:
+            Path of the written file.
+        """
+        target = Path(path) if path is not None else self.datafile
+        content: bytes = json.dumps(self.load()).encode()
+        fd, tmpname = tempfile.mkstemp(
+            prefix=f".{target.name}.",
+            suffix=".tmp",
+            dir=target.parent,
+        )
+        try:
+            with os.fdopen(fd, "wb") as file:
+                file.write(content)
+                if sync:
+                    file.flush()
+                    os.fsync(file.fileno())
+            Path(tmpname).replace(target)
+        except BaseException:
+            Path(tmpname).unlink(missing_ok=True)
+            raise
+        if target.resolve() == self.datafile.resolve():
+            self._set_meta("datafile_sha256", hashlib.sha256(content).hexdigest())
+        return target
+
+
+def read_encodes(datafile: str | Path) -> list[dict[str, Any]]:
+    """Read the entries of a datafile, preferring its job store.
+
+    The store is seeded from the JSON datafile again if the datafile has been
+    changed outside of the store (see ``JobStore``).
+
+    Args:
+        datafile: Path to the JSON datafile.
+
+    Returns:
+        List of encode configurations.
+    """
+    if store_path(datafile).is_file():
+        with JobStore(datafile) as store:
+            return store.load()
+
+    with Path(datafile).open("r") as file:
+        data: list[dict[str, Any]] = json.load(file)
+    return data
+
+
+def last_modified(datafile: str | Path) -> float:
+    """Get the last modification time of a datafile or its job store.
+
+    Args:
+        datafile: Path to the JSON datafile.
+
+    Returns:
+        Latest ``st_mtime`` of the datafile, the store and its WAL file.
+
+    Raises:
+        FileNotFoundError: If none of the files exist.
+    """
+    store = store_path(datafile)
+    candidates = [Path(datafile), store, store.with_name(f"{store.name}-wal")]
+    mtimes = [path.stat().st_mtime for path in candidates if path.exists()]
+    if not mtimes:
+        raise FileNotFoundError(datafile)
+    return max(mtimes)
+
+
+@contextmanager
+def exported_json(datafile: str | Path) -> Iterator[str]:
+    """Provide a JSON file with the current entries for readers such as DuckDB.
+
+    If the datafile has a job store, its entries are exported to a temporary
+    file that is removed afterwards; otherwise the datafile itself is used.
+
+    Args:
+        datafile: Path to the JSON datafile.
+
+    Yields:
+        Path of a JSON file with all entries.
+    """
+    if not store_path(datafile).is_file():
+        yield str(datafile)
+        return
+
+    with tempfile.TemporaryDirectory(prefix="ffvqe-") as tmpdir, JobStore(datafile) as store:
+        yield str(store.export_json(Path(tmpdir) / Path(datafile).name))
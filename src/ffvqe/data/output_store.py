@@ -0,0 +1,261 @@
+#!/usr/bin/env python3
+# To add a new cell, type '# %%'
+# To add a new markdown cell, type '# %% [markdown]'
+# %%
+"""Disk-budgeted store of encoded outputs for FFmpeg video quality evaluations."""
+
+from collections.abc import Collection
+import os
+from pathlib import Path
+import re
+import shutil
+import sqlite3
+import threading
+import time
+from types import TracebackType
+from typing import Self
+
+# Directory of the output store, next to the per-config output directories
+OUTPUT_STORE_DIR: Path = Path("./videos/dist/store")
+
+# Multipliers of the size suffixes accepted by ``parse_size``
+_SIZE_UNITS: dict[str, int] = {"": 1, "K": 1024, "M": 1024**2, "G": 1024**3, "T": 1024**4}
+
+
+def parse_size(value: str) -> int:
+    """Parse a byte size such as ``500M`` or ``1.5T``.
+
+    Args:
+        value: Number of bytes with an optional K/M/G/T suffix (powers of 1024).
+
+    Returns:
+        Number of bytes.
+
+    Raises:
+        ValueError: If ``value`` is not a size.
+    """
+    match = re.fullmatch(r"\s*(\d+(?:\.\d+)?)\s*([KMGT]?)i?B?\s*", value, flags=re.IGNORECASE)
+    if match is None:
+        msg = f"Invalid size: {value}"
+        raise ValueError(msg)
+    return int(float(match.group(1)) * _SIZE_UNITS[match.group(2).upper()])
+
+
+class OutputStore:
+    """Encoded outputs keyed by their SHA-256, evicted least recently used first.
+
+    Files are moved into ``<root>/<hash[:2]>/<hash><suffix>``; their size, last use
+    and number of uses are kept in ``<root>/outputs.sqlite3``. Whenever a file
+    is added, the least recently used files are removed until the store fits
+    in ``budget`` bytes, so the outputs needed most recently stay available
+    for re-probing and re-scoring without encoding them again.
+    """
+
+    def __init__(
+        self,
+        budget: int = 0,
+        root: Path = OUTPUT_STORE_DIR,
+        suffix: str = ".mkv",
+    ) -> None:
+        """Open (and create if needed) the store.
+
+        Args:
+            budget: Maximum total size of the stored files in bytes, enforced
+                when an output is added.
+            root: Directory of the store.
+            suffix: File name extension of the stored files.
+        """
+        self.budget = budget
+        self.root = root
+        self.suffix = suffix
+        self.root.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._con = sqlite3.connect(
+            self.root / "outputs.sqlite3",
+            timeout=30,
+            check_same_thread=False,
+            isolation_level=None,
+        )
+        self._con.execute("PRAGMA journal_mode=WAL")
+        self._con.execute(
+            "CREATE TABLE IF NOT EXISTS outputs ("
+            " sha256 TEXT PRIMARY KEY, size INTEGER NOT NULL,"
+            " last_used INTEGER NOT NULL, uses INTEGER NOT NULL)",
+        )
+
+    def __enter__(self) -> Self:
+        """Enter the runtime context.
+
+        Returns:
+            The store itself.
+        """
+        return self
+
+    def __exit__(
+        self,
+        exc_type: type[BaseException] | None,
+        exc_value: BaseException | None,
+        traceback: TracebackType | None,
+    ) -> None:
+        """Close the store when leaving the runtime context."""
+        self.close()
+
+    def close(self) -> None:
+        """Close the metadata database."""
+        with self._lock:
+            self._con.close()
+
+    def path(self, digest: str) -> Path:
+        """Get the location of a stored output.
+
+        Args:
+            digest: SHA-256 of the output.
+
+        Returns:
+            Path of the output in the store (it may not exist).
+        """
+        return self.root / digest[:2] / f"{digest}{self.suffix}"
+
+    def _touch(self, digest: str, size: int) -> None:
+        self._con.execute(
+            "INSERT INTO outputs (sha256, size, last_used, uses) VALUES (?, ?, ?, 1)"
+            " ON CONFLICT (sha256) DO UPDATE SET"
+            " size = excluded.size, last_used = excluded.last_used, uses = uses + 1",
+            (digest, size, time.time_ns()),
+        )
+
+    def put(self, path: Path, digest: str) -> Path | None:
+        """Move an output into the store and evict outputs over the budget.
+
+        Args:
+            path: Encoded output; it no longer exists afterwards.
+            digest: SHA-256 of the output.
+
+        Returns:
+            Path of the output in the store, or None if it did not fit in the
+            budget and was removed.
+        """
+        __dest = self.path(digest)
+        with self._lock:
+            __dest.parent.mkdir(parents=True, exist_ok=True)
+            # 同じ内容の出力が既にあれば (復元したハードリンクを含む) そちらを残す
+            if __dest.is_file():
+                path.unlink(missing_ok=True)
+            else:
+                path.replace(__dest)
+            self._touch(digest, __dest.stat().st_size)
+            self._evict()
+        return __dest if __dest.is_file() else None
+
+    def get(self, digest: str) -> Path | None:
+        """Look up an output and record its use.
+
+        Args:
+            digest: SHA-256 of the output.
+
+        Returns:
+            Path of the output in the store, or None if it is not stored.
+        """
+        __path = self.path(digest)
+        with self._lock:
+            if not __path.is_file():
+                self._con.execute("DELETE FROM outputs WHERE sha256 = ?", (digest,))
+                return None
+            self._touch(digest, __path.stat().st_size)
+        return __path
+
+    def restore(self, digest: str, dest: Path) -> bool:
+        """Put a stored output back at its original location.
+
+        The output is hard-linked (copied across file systems), so it stays in
+        the store and keeps counting against the budget.
+
+        Args:
+            digest: SHA-256 of the output.
+            dest: Location of the output expected by the job.
+
+        Returns:
+            True if the output was restored.
+        """
+        __path = self.get(digest)
+        if __path is None:
+            return False
+
+        dest.parent.mkdir(parents=True, exist_ok=True)
+        dest.unlink(missing_ok=True)
+        try:
+            os.link(__path, dest)
+        except OSError:
+            shutil.copy2(__path, dest)
+        return True
+
+    def size(self) -> int:
+        """Get the total size of the stored outputs.
+
+        Returns:
+            Size in bytes.
+        """
+        with self._lock:
+            return self._total()
+
+    def _total(self) -> int:
+        row = self._con.execute("SELECT coalesce(sum(size), 0) FROM outputs").fetchone()
+        return int(row[0])
+
+    def reserve(self, size: int, keep: Collection[str] = (), pending: int = 0) -> bool:
+        """Make room for a file that is about to be written into the store.
+
+        Least recently used files are evicted until ``size`` more bytes fit in
+        the budget and in the free space of the file system.
+
+        Args:
+            size: Expected size of the new file in bytes.
+            keep: Digests of files in use that must not be evicted.
+            pending: Bytes that other files being written will still take
+                from the free space.
+
+        Returns:
+            False if the file can never fit, in which case nothing is evicted.
+        """
+        with self._lock:
+            __total: int = self._total()
+            __kept: int = sum(
+                self._con.execute(
+                    "SELECT coalesce(sum(size), 0) FROM outputs WHERE sha256 = ?",
+                    (__digest,),
+                ).fetchone()[0]
+                for __digest in keep
+            )
+            # 予算だけでなく空き容量 (tmpfs ならメモリー) も超えないようにする
+            __limit: int = min(
+                self.budget,
+                __total + shutil.disk_usage(self.root).free - pending,
+            )
+            if __kept + size > __limit:
+                return False
+            self._evict(__limit - size, keep)
+        return True
+
+    def _evict(self, limit: int | None = None, keep: Collection[str] = ()) -> None:
+        """Remove the least recently used outputs until the store fits in ``limit``.
+
+        Args:
+            limit: Maximum total size in bytes. Defaults to the budget.
+            keep: Digests of files that must not be evicted.
+        """
+        __limit: int = self.budget if limit is None else limit
+        __total: int = self._total()
+        if __total <= __limit:
+            return
+
+        for __digest, __size in self._con.execute(
+            "SELECT sha256, size FROM outputs ORDER BY last_used",
+        ).fetchall():
+            if __digest in keep:
+                continue
+            self.path(__digest).unlink(missing_ok=True)
+            self._con.execute("DELETE FROM outputs WHERE sha256 = ?", (__digest,))
+            print(f"[STORE ] evict: {__digest[:12]} ({__size} bytes)")  # noqa: T201
+            __total -= __size
+            if __total <= __limit:
+                return
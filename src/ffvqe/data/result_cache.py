@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+# To add a new cell, type '# %%'
+# To add a new markdown cell, type '# %% [markdown]'
+# %%
+"""Results shared across experiments for FFmpeg video quality evaluations."""
+
+import hashlib
+import json
+from types import TracebackType
+from typing import Any
+from typing import Self
+
+from ffvqe.utils.cache import JsonCache
+
+
+def is_completed(encode: dict[str, Any]) -> bool:
+    """Check whether an encode configuration holds the results of a finished job.
+
+    Args:
+        encode: Encode configuration of a datafile entry.
+
+    Returns:
+        True if the job has been encoded, probed and scored.
+    """
+    return bool(encode.get("outfile", {}).get("hash", ""))
+
+
+def result_key(basehash: str, encode: dict[str, Any], environment: dict[str, Any]) -> str:
+    """Get the key of the result of a job in the ``ResultCache``.
+
+    Unlike the job ``id``, which also hashes the path of the reference, the key
+    only depends on the content of the reference, on the encode options and on
+    the FFmpeg and library builds, so a reference stored at another path shares
+    its results while an upgraded FFmpeg or encoder does not.
+
+    Args:
+        basehash: SHA-256 of the reference file.
+        encode: Encode configuration of a datafile entry.
+        environment: Environment of the run (``configs.environment``).
+
+    Returns:
+        SHA-256 of the basehash, of the encode options (``id_opt``) and of the
+        environment.
+    """
+    __environment: str = json.dumps(environment, sort_keys=True)
+    return hashlib.sha256(f"{basehash}{encode['id_opt']}{__environment}".encode()).hexdigest()
+
+
+class ResultCache:
+    """Completed results of every experiment keyed by ``result_key``.
+
+    The key of a job is a hash of the reference content, of all encode options
+    and of the environment, so a result stored by one configuration is valid
+    for the same job in any other configuration run with the same FFmpeg and
+    library builds.
+    """
+
+    TABLE: str = "encode_result"
+
+    def __init__(self, environment: dict[str, Any]) -> None:
+        """Open the cache database.
+
+        Args:
+            environment: Environment of the run (``configs.environment``).
+        """
+        self._cache = JsonCache(self.TABLE)
+        self._environment = environment
+
+    def __enter__(self) -> Self:
+        """Enter the runtime context.
+
+        Returns:
+            The cache itself.
+        """
+        return self
+
+    def __exit__(
+        self,
+        exc_type: type[BaseException] | None,
+        exc_value: BaseException | None,
+        traceback: TracebackType | None,
+    ) -> None:
+        """Close the cache when leaving the runtime context."""
+        self.close()
+
+    def close(self) -> None:
+        """Close the cache database."""
+        self._cache.close()
+
+    def get(self, basehash: str, encode: dict[str, Any]) -> dict[str, Any] | None:
+        """Look up the completed result of a job.
+
+        Args:
+            basehash: SHA-256 of the reference file.
+            encode: Encode configuration of the job.
+
+        Returns:
+            The encode configuration with results, or None if the job has not
+            been completed by any configuration in this environment.
+        """
+        if not basehash or not encode.get("id_opt"):
+            return None
+        __encode: dict[str, Any] | None = self._cache.get(
+            result_key(basehash, encode, self._environment),
+        )
+        return __encode
+
+    def put(self, basehash: str, encode: dict[str, Any]) -> None:
+        """Store the result of a job if it is completed.
+
+        Args:
+            basehash: SHA-256 of the reference file.
+            encode: Encode configuration of a datafile entry.
+        """
+        if is_completed(encode) and basehash and encode.get("id_opt"):
+            self._cache.put(result_key(basehash, encode, self._environment), encode)
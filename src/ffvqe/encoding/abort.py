@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+# To add a new cell, type '# %%'
+# To add a new markdown cell, type '# %% [markdown]'
+# %%
+"""Early-abort rules pruning hopeless jobs for FFmpeg video quality evaluations."""
+
+from collections.abc import Callable
+import math
+import time
+from typing import Any
+
+from ffvqe.utils.exceptions import JobPrunedError
+from ffvqe.utils.exceptions import VQEError
+
+# Keys of the ``abort`` rules of a pattern
+ABORT_KEYS: tuple[str, ...] = ("after", "max_bitrate_kbs", "min_vmaf")
+
+
+class _BitrateWatcher:
+    """Check the running bitrate reported by FFmpeg ``-progress`` output."""
+
+    def __init__(self, after: float, max_bitrate_kbs: float) -> None:
+        self.after = after
+        self.max_bitrate_kbs = max_bitrate_kbs
+        self._size: int = 0
+        self._start: float = time.monotonic()
+
+    def feed(self, line: bytes) -> None:
+        """Read one ``-progress`` line.
+
+        Args:
+            line: Line of the standard output of FFmpeg.
+
+        Raises:
+            JobPrunedError: If the running bitrate exceeds the limit after
+                ``after`` seconds of output.
+        """
+        key, _, value = line.strip().partition(b"=")
+        if key == b"total_size" and value.isdigit():
+            self._size = int(value)
+            return
+        if key != b"out_time_us" or not value.isdigit():
+            return
+
+        # total_size は同じブロックの out_time_us より前に出力される
+        __second: float = int(value) / 1_000_000
+        if __second <= 0 or __second < self.after:
+            return
+        __bit_rate_kbs: float = self._size * 8 / 1024 / __second
+        if __bit_rate_kbs > self.max_bitrate_kbs:
+            msg = (
+                f"bitrate {__bit_rate_kbs:.1f} kbs > {self.max_bitrate_kbs} kbs "
+                f"after {__second:.1f}s"
+            )
+            raise JobPrunedError(
+                msg,
+                {
+                    "stage": "encode",
+                    "rule": "max_bitrate_kbs",
+                    "second": __second,
+                    "bit_rate_kbs": __bit_rate_kbs,
+                    "size_kbyte": self._size / 1024,
+                    "elapsed_time": time.monotonic() - self._start,
+                },
+            )
+
+
+class AbortRules:
+    """Early-abort rules of a pattern (``abort`` in the configuration).
+
+    ``after`` is the number of seconds of output after which the rules apply.
+    ``max_bitrate_kbs`` stops the encode as soon as its running bitrate is
+    above the limit; ``min_vmaf`` stops the job if the mean VMAF of its first
+    ``after`` seconds is below the limit, before the rest is scored.
+    """
+
+    def __init__(self, rules: dict[str, Any]) -> None:
+        """Validate and initialize the rules.
+
+        Args:
+            rules: ``abort`` of a pattern.
+
+        Raises:
+            VQEError: If a rule is unknown or ``after`` is missing.
+        """
+        __unknown: set[str] = set(rules) - set(ABORT_KEYS)
+        if __unknown:
+            msg = f"abort: unknown rules {sorted(__unknown)}, expected {list(ABORT_KEYS)}"
+            raise VQEError(msg)
+        if rules and "after" not in rules:
+            msg = f"abort: 'after' (seconds) is required: {rules}"
+            raise VQEError(msg)
+
+        self.after: float = float(rules.get("after", 0.0))
+        self.max_bitrate_kbs: float | None = (
+            float(rules["max_bitrate_kbs"]) if "max_bitrate_kbs" in rules else None
+        )
+        self.min_vmaf: float | None = float(rules["min_vmaf"]) if "min_vmaf" in rules else None
+
+    def bitrate_watcher(self) -> Callable[[bytes], None] | None:
+        """Create the callback checking the running bitrate of an encode.
+
+        Returns:
+            Callback receiving the ``-progress`` lines of the encode (it raises
+            ``JobPrunedError`` to stop it), or None without a bitrate rule.
+        """
+        if self.max_bitrate_kbs is None:
+            return None
+        return _BitrateWatcher(self.after, self.max_bitrate_kbs).feed
+
+    def vmaf_head(self, frames: int, duration: float) -> int:
+        """Get the number of frames scored before the VMAF rule is checked.
+
+        Args:
+            frames: Number of frames of the encode.
+            duration: Duration of the encode in seconds.
+
+        Returns:
+            Number of frames in the first ``after`` seconds, or 0 without a VMAF
+            rule or if the encode is not longer than ``after``.
+        """
+        if self.min_vmaf is None or duration <= 0:
+            return 0
+        __head: int = math.ceil(frames * self.after / duration)
+        return __head if 0 < __head < frames else 0
+
+    def check_vmaf(self, log: dict[str, Any]) -> None:
+        """Check the VMAF log of the first ``after`` seconds of an encode.
+
+        Args:
+            log: VMAF log of the first frames.
+
+        Raises:
+            JobPrunedError: If the mean VMAF is below the limit.
+        """
+        __vmaf: dict[str, float] = log["pooled_metrics"]["vmaf"]
+        if self.min_vmaf is not None and __vmaf["mean"] < self.min_vmaf:
+            msg = f"VMAF {__vmaf['mean']:.3f} < {self.min_vmaf} after {self.after}s"
+            raise JobPrunedError(
+                msg,
+                {
+                    "stage": "vmaf",
+                    "rule": "min_vmaf",
+                    "second": self.after,
+                    "frames": len(log["frames"]),
+                    "vmaf": __vmaf,
+                },
+            )
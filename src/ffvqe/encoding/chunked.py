@@ -0,0 +1,374 @@
+#!/usr/bin/env python3
+# To add a new cell, type '# %%'
+# To add a new markdown cell, type '# %% [markdown]'
+# %%
+"""Chunked (segment-parallel) encoding for FFmpeg video quality evaluations."""
+
+from collections.abc import Callable
+from itertools import pairwise
+import json
+from pathlib import Path
+import re
+import shutil
+from typing import Any
+
+from ffvqe.encoding.encoder import _build_output_args
+from ffvqe.encoding.encoder import encode_video
+from ffvqe.encoding.encoder import tqdm
+from ffvqe.encoding.runner import run_process
+from ffvqe.encoding.runner import run_processes
+from ffvqe.utils.cache import JsonCache
+from ffvqe.utils.cache import file_identity
+from ffvqe.utils.time_format import format_seconds
+
+# Cache table holding the frame timestamps and keyframes of references
+KEYFRAMES_TABLE: str = "reference_keyframes"
+
+# ``-benchmark`` summary of an FFmpeg process: user and system CPU seconds
+BENCH_REGEX: re.Pattern[bytes] = re.compile(rb"bench: utime=([\d.]+)s stime=([\d.]+)s")
+
+# Output options changing the number of frames (frame rate conversion, frame
+# dropping, one frame per field deinterlacing)
+FRAME_COUNT_OPTIONS_REGEX: re.Pattern[str] = re.compile(
+    r"(?:^|\s)-(?:r|fpsmax|fps_mode|vsync)(?::v)?(?:\s|$)"
+    r"|\b(?:fps|framerate|minterpolate|decimate|telecine|select|tinterlace|w3fdif)\b"
+    r"|\b(?:yadif|bwdif)\w*=(?:mode=)?(?:1|send_field\w*)\b",
+)
+
+# Output options selecting streams or applying to every stream, which the
+# video-only chunks and the audio of the concat command cannot split
+STREAM_OPTIONS_REGEX: re.Pattern[str] = re.compile(
+    r"(?:^|\s)-(?:map|filter_complex|lavfi|c|codec)(?:\s|$)",
+)
+
+# Output options of the audio stream taking a value (``-an`` takes none)
+AUDIO_OPTION_REGEX: re.Pattern[str] = re.compile(r"-(?:acodec|ab|ar|ac|af|aq|\w+:a(?::\d+)?)")
+
+
+def supports_chunking(encode_cfg: dict[str, Any]) -> bool:
+    """Check whether a job's encode can be split into chunks.
+
+    Each chunk is cut by a number of reference frames (``-frames:v``), so the
+    output must have one frame per reference frame, and the audio options must
+    apply to the audio stream only, since it is encoded by the concat command.
+
+    Args:
+        encode_cfg: Dictionary containing encoding configuration.
+
+    Returns:
+        True if the output options keep the frames of the reference and can be
+        split between the video and the audio.
+    """
+    __options: str = f"{encode_cfg['outfile']['options']}"
+    return (
+        FRAME_COUNT_OPTIONS_REGEX.search(__options) is None
+        and STREAM_OPTIONS_REGEX.search(__options) is None
+    )
+
+
+def audio_options(options: str) -> list[str]:
+    """Get the audio options of the output options of a job.
+
+    Args:
+        options: Output options (``outfile.options``).
+
+    Returns:
+        ``-an`` and the audio options with their values, in their order.
+    """
+    __options: list[str] = options.split()
+    __audio: list[str] = []
+    for __index, __option in enumerate(__options):
+        if __option == "-an":
+            __audio.append(__option)
+        elif AUDIO_OPTION_REGEX.fullmatch(__option) and __index + 1 < len(__options):
+            __audio.extend(__options[__index : __index + 2])
+    return __audio
+
+
+def reference_frames(basefile: str) -> dict[str, Any]:
+    """Get the display timestamps and keyframes of the video of a reference.
+
+    The packets are listed without decoding and cached by the identity of the
+    file, so each reference (or mezzanine) is only read once.
+
+    Args:
+        basefile: Path of the reference file.
+
+    Returns:
+        ``{"pts": [...], "keyframes": [...]}``: timestamps in seconds from the
+        start of the file, in display order, and the indexes of the keyframes.
+    """
+    __key: str = json.dumps(file_identity(Path(basefile)))
+    __cache = JsonCache(KEYFRAMES_TABLE)
+    try:
+        __frames: dict[str, Any] | None = __cache.get(__key)
+        if __frames is None:
+            __frames = _probe_frames(basefile)
+            __cache.put(__key, __frames)
+    finally:
+        __cache.close()
+    return __frames
+
+
+def _probe_frames(basefile: str) -> dict[str, Any]:
+    """List the video packets of a reference with FFprobe.
+
+    Args:
+        basefile: Path of the reference file.
+
+    Returns:
+        Frames as returned by ``reference_frames``.
+    """
+    print(f"[CHUNK ] keyframes: {basefile}")  # noqa: T201
+    __result = run_process(
+        [
+            "ffprobe",
+            "-v",
+            "error",
+            "-select_streams",
+            "v:0",
+            "-show_entries",
+            "packet=pts_time,flags:format=start_time",
+            "-of",
+            "json",
+            basefile,
+        ],
+        capture_stdout=True,
+    )
+    __log: dict[str, Any] = json.loads(__result.stdout)
+    __start: float = float(__log.get("format", {}).get("start_time", 0.0))
+    # パケットはデコード順なので、表示順 (pts 順) に並べ替える
+    __packets: list[tuple[float, bool]] = sorted(
+        (float(__packet["pts_time"]) - __start, "K" in __packet.get("flags", ""))
+        for __packet in __log.get("packets", [])
+        if __packet.get("pts_time", "N/A") != "N/A"
+    )
+    return {
+        "pts": [__pts for __pts, _ in __packets],
+        "keyframes": [__index for __index, (_, __key) in enumerate(__packets) if __key],
+    }
+
+
+def plan_chunks(frames: dict[str, Any], count: int) -> list[tuple[float, int]]:
+    """Split a reference into chunks starting at keyframes.
+
+    Each cut is placed at the keyframe closest to an equal split, so the chunk
+    boundaries fall on GOP (usually scene) boundaries of the reference.
+
+    Args:
+        frames: Frames of the reference as returned by ``reference_frames``.
+        count: Wanted number of chunks.
+
+    Returns:
+        ``(start, frames)`` of each chunk: start time in seconds from the start
+        of the file and number of frames. Fewer chunks are returned if the
+        reference has fewer keyframes.
+    """
+    __total: int = len(frames["pts"])
+    __keyframes: list[int] = [__index for __index in frames["keyframes"] if __index > 0]
+    __cuts: list[int] = [0]
+    for __chunk in range(1, count):
+        if not __keyframes:
+            break
+        __target: float = __total * __chunk / count
+        __cut: int = min(__keyframes, key=lambda index: abs(index - __target))
+        if __cut > __cuts[-1]:
+            __cuts.append(__cut)
+    __cuts.append(__total)
+    return [
+        (float(frames["pts"][__first]) if __first > 0 else 0.0, __last - __first)
+        for __first, __last in pairwise(__cuts)
+    ]
+
+
+def _build_chunk_command(
+    encode_cfg: dict[str, Any],
+    chunk: tuple[float, int],
+    dest: Path,
+    threads: int,
+) -> list[str]:
+    """Build the FFmpeg command encoding the video of one chunk.
+
+    Args:
+        encode_cfg: Dictionary containing encoding configuration.
+        chunk: Start time and number of frames of the chunk.
+        dest: Path of the encoded chunk.
+        threads: Number of FFmpeg threads.
+
+    Returns:
+        List of command arguments for FFmpeg.
+    """
+    __start, __frames = chunk
+    __cmd: list[str] = ["ffmpeg", "-y", "-benchmark", "-threads", f"{threads}"]
+    if encode_cfg["hwaccels"] != "":
+        __cmd.extend(str(encode_cfg["hwaccels"]).split())
+    if encode_cfg["infile"]["option"] != "":
+        __cmd.extend(str(encode_cfg["infile"]["option"]).split())
+    if __start > 0:
+        # キーフレームへ正確にシークする。前のチャンクはその直前のフレームで終わる
+        __cmd.extend(["-ss", f"{__start:.6f}"])
+    __cmd.extend(["-i", f"{encode_cfg['infile']['filename']}"])
+
+    __output: list[str] = _build_output_args(
+        {
+            **encode_cfg,
+            "outfile": {**encode_cfg["outfile"], "filename": f"{dest.with_suffix('')}"},
+        },
+        map_video=True,
+        threads=threads,
+    )
+    return [*__cmd, *__output[:-1], "-frames:v", f"{__frames}", "-an", *__output[-1:]]
+
+
+def _build_concat_command(encode_cfg: dict[str, Any], chunk_list: Path) -> list[str]:
+    """Build the FFmpeg command joining the chunks into the output.
+
+    The video bitstreams are copied as they are; the audio of the reference is
+    encoded with the audio options of ``outfile.options`` as in an unchunked
+    encode, or left out with ``-an``.
+
+    Args:
+        encode_cfg: Dictionary containing encoding configuration.
+        chunk_list: Concat demuxer list of the chunks.
+
+    Returns:
+        List of command arguments for FFmpeg.
+    """
+    __audio: list[str] = audio_options(f"{encode_cfg['outfile']['options']}")
+    __cmd: list[str] = ["ffmpeg", "-y", "-f", "concat", "-safe", "0", "-i", f"{chunk_list}"]
+    if "-an" in __audio:
+        # -an なら音声は入力しない
+        return [
+            *__cmd,
+            "-map",
+            "0:v:0",
+            "-an",
+            "-c:v",
+            "copy",
+            f"{encode_cfg['outfile']['filename']}.mkv",
+        ]
+    return [
+        *__cmd,
+        "-i",
+        f"{encode_cfg['infile']['filename']}",
+        "-map",
+        "0:v:0",
+        "-map",
+        "1:a:0?",
+        *__audio,
+        "-c:v",
+        "copy",
+        f"{encode_cfg['outfile']['filename']}.mkv",
+    ]
+
+
+def encode_video_chunked(
+    encode_cfg: dict[str, Any],
+    chunks: int,
+    ffmpeg_threads: int = 4,
+    position: int = 1,
+    on_stdout: Callable[[bytes], None] | None = None,
+) -> dict[str, Any]:
+    """Encode a reference in chunks run concurrently and join them losslessly.
+
+    Args:
+        encode_cfg: Dictionary containing encoding configuration.
+        chunks: Wanted number of chunks.
+        ffmpeg_threads: Number of threads shared by the chunk encodes.
+        position: tqdm bar position.
+        on_stdout: Callback receiving each ``-progress`` line of the first
+            chunk, which starts with the reference; it may raise to stop the
+            encode.
+
+    Returns:
+        Dictionary containing encoding results including:
+        - commandline: The FFmpeg commands used, joined with ``&&``
+        - elapsed_time: Wall-clock time from the first chunk to the joined output
+        - cpu_time: User and system CPU time summed over the chunk encodes
+        - chunks: Number of chunks
+        If the reference cannot be split or the output options change the
+        number of frames (see ``supports_chunking``), it is encoded by
+        ``encode_video``.
+    """
+    __frames = reference_frames(encode_cfg["infile"]["filename"])
+    __plan = plan_chunks(__frames, chunks) if supports_chunking(encode_cfg) else []
+    if len(__plan) < 2:  # noqa: PLR2004
+        # キーフレームが無く分割できない場合や、フレーム数が変わる場合は通常どおりエンコードする
+        return encode_video(encode_cfg, ffmpeg_threads, position, on_stdout=on_stdout)
+    # 進捗の分母にするチャンクの長さは、フレーム間隔から秒単位で求める
+    __span: float = __frames["pts"][-1] - __frames["pts"][0] if __frames["pts"] else 0.0
+    __frame_time: float = __span / (len(__frames["pts"]) - 1) if __span > 0 else 0.0
+    __outfile = Path(f"{encode_cfg['outfile']['filename']}")
+    __workdir = __outfile.with_name(f"{__outfile.name}_chunks")
+    shutil.rmtree(__workdir, ignore_errors=True)
+    __workdir.mkdir(parents=True)
+
+    __threads: int = max(1, ffmpeg_threads // len(__plan))
+    __paths: list[Path] = [__workdir / f"{__index:04}.mkv" for __index in range(len(__plan))]
+    __cmds = [
+        _build_chunk_command(encode_cfg, __chunk, __path, __threads)
+        for __chunk, __path in zip(__plan, __paths, strict=True)
+    ]
+    __percent: list[float] = [0.0] * len(__plan)
+    __cpu: list[float] = [0.0] * len(__plan)
+
+    with tqdm(
+        desc=f"[CHUNK ] {__outfile}.mkv x{len(__plan)}",
+        total=100,
+        position=position,
+    ) as pbar:
+
+        def __progress(index: int, percent: float) -> None:
+            # チャンクのフレーム数で重み付けした全体の進捗
+            __percent[index] = percent
+            __done = sum(
+                __chunk_percent * __chunk_frames
+                for __chunk_percent, (_, __chunk_frames) in zip(__percent, __plan, strict=True)
+            )
+            pbar.update(__done / sum(__chunk_frames for _, __chunk_frames in __plan) - pbar.n)
+
+        def __bench(index: int, line: bytes) -> None:
+            if (match := BENCH_REGEX.search(line)) is not None:
+                __cpu[index] = float(match.group(1)) + float(match.group(2))
+
+        try:
+            __results = run_processes(
+                __cmds,
+                per_command=[
+                    {
+                        "progress": lambda percent, i=__index: __progress(i, percent),
+                        "duration": __chunk[1] * __frame_time or None,
+                        "on_stderr": lambda line, i=__index: __bench(i, line),
+                        **({"on_stdout": on_stdout} if __index == 0 and on_stdout else {}),
+                    }
+                    for __index, __chunk in enumerate(__plan)
+                ],
+            )
+        except BaseException:
+            # 中断したチャンク (abort ルールを含む) を残さない
+            shutil.rmtree(__workdir, ignore_errors=True)
+            raise
+
+    __chunk_list = __workdir / "chunks.txt"
+    __chunk_list.write_text(
+        "".join(
+            "file '{}'\n".format(f"{__path.resolve()}".replace("'", "'\\''")) for __path in __paths
+        ),
+    )
+    __concat_cmd = _build_concat_command(encode_cfg, __chunk_list)
+    __concat = run_process(__concat_cmd)
+    shutil.rmtree(__workdir, ignore_errors=True)
+
+    elapsed_time: float = max(__result.elapsed_time for __result in __results)
+    elapsed_time += __concat.elapsed_time
+    cpu_time: float = sum(__cpu)
+    print(  # noqa: T201
+        f"\nelapsed_time: {format_seconds(int(elapsed_time))} "
+        f"(cpu_time: {format_seconds(int(cpu_time))}, {len(__plan)} chunks)\n",
+    )
+    return {
+        "commandline": " && ".join(" ".join(__cmd) for __cmd in [*__cmds, __concat_cmd]),
+        "elapsed_time": elapsed_time,
+        "cpu_time": cpu_time,
+        "chunks": len(__plan),
+    }
@@ -4,35 +4,177 @@
 # %%
 """Encoding functionality for FFmpeg video quality evaluations."""
 
-from functools import partial
+from collections import Counter
+from collections.abc import Callable
 import json
 from os import environ
 from pathlib import Path
-import subprocess
-import time
+import re
+import shutil
 from typing import Any
 
-from ffmpeg_progress_yield import FfmpegProgress
-from tqdm import tqdm as std_tqdm
-
-from ffvqe.encoding.frame_info import getframeinfo
+from ffvqe.encoding.frame_info import TRACE_SLICE_TYPES
+from ffvqe.encoding.frame_info import FrameTypeCounter
+from ffvqe.encoding.frame_info import TraceHeadersParser
+from ffvqe.encoding.runner import run_process
+from ffvqe.utils.cache import JsonCache
+from ffvqe.utils.cache import file_identity
 from ffvqe.utils.time_format import format_seconds
 
-# tqdmのカスタム設定
-tqdm = partial(
-    std_tqdm,
-    bar_format="{desc:92}{percentage:5.0f}%|{bar:20}{r_bar}",
-    dynamic_ncols=True,
-    ncols=155,
+
+def tqdm(**kwargs: Any) -> Any:  # noqa: ANN401
+    """Create a progress bar with the common settings.
+
+    tqdm is imported on first use so that importing this module stays cheap.
+
+    Args:
+        **kwargs: Keyword arguments of ``tqdm.tqdm``.
+
+    Returns:
+        The progress bar.
+    """
+    from tqdm import tqdm as std_tqdm
+
+    # tqdmのカスタム設定
+    return std_tqdm(
+        bar_format="{desc:92}{percentage:5.0f}%|{bar:20}{r_bar}",
+        dynamic_ncols=True,
+        ncols=155,
+        **kwargs,
+    )
+
+
+# Encoders that run entirely on the CPU and can share a decoded reference with libvmaf
+SOFTWARE_CODECS: tuple[str, ...] = ("libx264", "libx265", "libsvtav1", "libaom-av1")
+
+# Frame rate forced on both VMAF inputs, so that frames are paired by number
+VMAF_FRAME_RATE: float = 29.97
+
+# ``-benchmark_all`` line of an encoded frame: microseconds spent and output file index
+BENCH_ENCODE_REGEX: re.Pattern[bytes] = re.compile(
+    rb"bench:\s*\d+ user\s*\d+ sys\s*(\d+) real encode_video (\d+)\.\d+",
 )
 
 
-def _build_ffmpeg_command(encode_cfg: dict[str, Any], ffmpeg_threads: int) -> list[str]:
+def supports_single_pass(encode_cfg: dict[str, Any]) -> bool:
+    """Check whether a job can be encoded and scored in a single FFmpeg pass.
+
+    Single-pass mode needs a software encoder and a software-decoded reference,
+    since the decoded reference frames are fed to libvmaf as well.
+
+    Args:
+        encode_cfg: Dictionary containing encoding configuration.
+
+    Returns:
+        True if the job can use single-pass mode.
+    """
+    return (
+        encode_cfg["codec"] in SOFTWARE_CODECS
+        and encode_cfg["hwaccels"] == ""
+        and encode_cfg["infile"]["option"] == ""
+    )
+
+
+def _build_libvmaf_filter(  # noqa: PLR0913
+    encode_cfg: dict[str, Any],
+    cpu_count: int | None,
+    distorted: str,
+    reference: str,
+    *,
+    tag: str = "",
+    frames: tuple[int, int] | None = None,
+    log_path: str | None = None,
+    rate: float | None = None,
+) -> str:
+    """Build the libvmaf filter graph comparing a distorted and a reference stream.
+
+    Args:
+        encode_cfg: Dictionary containing encoding configuration.
+        cpu_count: Number of threads for libvmaf.
+        distorted: Link label of the distorted (encoded) video.
+        reference: Link label of the reference video.
+        tag: Suffix of the intermediate link labels, unique per libvmaf instance
+            when several share one filter graph.
+        frames: First and end (exclusive) frame numbers to compare, or None
+            to compare all frames.
+        log_path: Path of the VMAF log. Defaults to ``{outfile}_vmaf.json``.
+        rate: Frame rate of the timestamps given to both streams by frame
+            number, as ``-r`` on the inputs of ``getvmaf`` does, or None to keep
+            their own timestamps.
+
+    Returns:
+        Filter graph string.
+    """
+    __trim: str = "" if frames is None else f"trim=start_frame={frames[0]}:end_frame={frames[1]},"
+    __pts: str = "PTS-STARTPTS" if rate is None else f"N/({rate}*TB)"
+    return (
+        f"[{distorted}]{__trim}settb=AVTB,setpts={__pts}[Distorted{tag}];"
+        f"[{reference}]{__trim}settb=AVTB,setpts={__pts}[Reference{tag}];"
+        f"[Distorted{tag}][Reference{tag}]libvmaf=eof_action=endall:"
+        "log_fmt=json:"
+        f"log_fmt=json:log_path={log_path or encode_cfg['outfile']['filename'] + '_vmaf.json'}:"
+        f"n_threads={cpu_count}:"
+        "pool=harmonic_mean:"
+        "feature=name=psnr|name=float_ssim:"
+        "model=version=vmaf_v0.6.1"
+    )
+
+
+def _build_output_args(
+    encode_cfg: dict[str, Any],
+    *,
+    map_video: bool = False,
+    threads: int | None = None,
+) -> list[str]:
+    """Build the FFmpeg arguments of one encoded output.
+
+    Args:
+        encode_cfg: Dictionary containing encoding configuration.
+        map_video: Map only the video stream of the reference.
+        threads: Number of encoder threads, or None to let the encoder decide.
+
+    Returns:
+        List of output options ending with the output file.
+    """
+    __args: list[str] = []
+    if threads is not None:
+        # 入力の前の -threads はデコーダーにしか効かないので、エンコーダーにも指定する
+        __args.extend(["-threads", f"{threads}"])
+    if encode_cfg["outfile"]["options"] != []:
+        __args.extend(str(encode_cfg["outfile"]["options"]).split())
+    if map_video:
+        __args.extend(["-map", "0:v:0"])
+    __args.append("-c:v")
+    __args.append(f"{encode_cfg['codec']}")
+
+    if encode_cfg["preset"] != "none":
+        __args.append("-preset:v")
+        __args.append(f"{encode_cfg['preset']}")
+
+    __args.append(f"{encode_cfg['outfile']['filename']}.mkv")
+    return __args
+
+
+def _build_ffmpeg_command(
+    encode_cfg: dict[str, Any],
+    ffmpeg_threads: int,
+    vmaf_cpu_count: int | None = None,
+    *,
+    encoder_threads: int | None = None,
+) -> list[str]:
     """Build FFmpeg command from encoding configuration.
 
+    When ``vmaf_cpu_count`` is given the command also scores the encode
+    (single-pass mode): the reference is decoded once and its frames are fed both
+    to the encoder and to libvmaf, while a loopback decoder (``-dec``, FFmpeg 7.1+)
+    decodes the freshly encoded stream as the distorted libvmaf input.
+
     Args:
         encode_cfg: Dictionary containing encoding configuration.
         ffmpeg_threads: Number of threads to use for FFmpeg encoding.
+        vmaf_cpu_count: Number of libvmaf threads, or None to only encode.
+        encoder_threads: Number of encoder threads, or None to let the encoder
+            choose (only the decoder is limited by ``ffmpeg_threads``).
 
     Returns:
         List of command arguments for FFmpeg.
@@ -57,26 +199,53 @@ def _build_ffmpeg_command(encode_cfg: dict[str, Any], ffmpeg_threads: int) -> li
 
     # Add output file options
     if "outfile" in encode_cfg:
-        if encode_cfg["outfile"]["options"] != []:
-            ffmpeg_cmd.extend(str(encode_cfg["outfile"]["options"]).split())
-        ffmpeg_cmd.append("-c:v")
-        ffmpeg_cmd.append(f"{encode_cfg['codec']}")
-
-        if encode_cfg["preset"] != "none":
-            ffmpeg_cmd.append("-preset:v")
-            ffmpeg_cmd.append(f"{encode_cfg['preset']}")
-
-        ffmpeg_cmd.append(f"{encode_cfg['outfile']['filename']}.mkv")
+        # 単独エンコードと同じストリーム選択にする (映像が出力の 0 番目になる)
+        ffmpeg_cmd.extend(
+            _build_output_args(encode_cfg, threads=encoder_threads),
+        )
+
+        if vmaf_cpu_count is not None:
+            ffmpeg_cmd.extend(
+                [
+                    "-dec",
+                    "0:0",
+                    "-filter_complex",
+                    _build_libvmaf_filter(
+                        encode_cfg,
+                        vmaf_cpu_count,
+                        "dec:0",
+                        "0:v:0",
+                        rate=VMAF_FRAME_RATE,
+                    )
+                    + "[vmaf]",
+                    "-map",
+                    "[vmaf]",
+                    "-an",
+                    "-f",
+                    "null",
+                    "-",
+                ],
+            )
 
     return ffmpeg_cmd
 
 
-def _run_ffmpeg_encode(encode_cfg: dict[str, Any], ffmpeg_cmd: list[str]) -> float:
+def _run_ffmpeg_encode(
+    encode_cfg: dict[str, Any],
+    ffmpeg_cmd: list[str],
+    position: int = 1,
+    on_stderr: Callable[[bytes], None] | None = None,
+    on_stdout: Callable[[bytes], None] | None = None,
+) -> float:
     """Run FFmpeg encoding process with progress tracking.
 
     Args:
         encode_cfg: Dictionary containing encoding configuration.
         ffmpeg_cmd: List of command arguments for FFmpeg.
+        position: tqdm bar position.
+        on_stderr: Callback receiving each line of the standard error.
+        on_stdout: Callback receiving each ``-progress`` line; it may raise to
+            stop the encode.
 
     Returns:
         Elapsed time for encoding in seconds.
@@ -86,39 +255,51 @@ def _run_ffmpeg_encode(encode_cfg: dict[str, Any], ffmpeg_cmd: list[str]) -> flo
         Path.mkdir(Path(f"{encode_cfg['outfile']['filename']}").parent, parents=True)
 
     print(f"__ffmpege_cmd: {ffmpeg_cmd}")  # noqa: T201
-    environ["FFREPORT"] = f"file={encode_cfg['outfile']['filename']}.log:level=40"
+    # FFREPORT is passed per process so that concurrent encodes don't share it
+    ffmpeg_env = {
+        **environ,
+        "FFREPORT": f"file={encode_cfg['outfile']['filename']}.log:level=40",
+    }
 
     # Start encoding and track progress
-    start_time = time.time()
-    ff_encode = FfmpegProgress(ffmpeg_cmd)
     with tqdm(
         desc=f"[ENCODE] {encode_cfg['outfile']['filename']}.log",
         total=100,
-        position=1,
+        position=position,
     ) as pbar:
-        for progress in ff_encode.run_command_with_progress():
-            pbar.update(progress - pbar.n)
-
-    # Clean up environment and calculate elapsed time
-    environ.pop("FFREPORT", None)
-    elapsed_time = time.time() - start_time
+        result = run_process(
+            ffmpeg_cmd,
+            env=ffmpeg_env,
+            progress=lambda percent: pbar.update(percent - pbar.n),
+            on_stderr=on_stderr,
+            on_stdout=on_stdout,
+        )
+
+    # Calculate elapsed time
+    elapsed_time = result.elapsed_time
     print(f"\nelapsed_time: {format_seconds(int(elapsed_time))}\n")  # noqa: T201
 
     return elapsed_time
 
 
-def _run_ffprobe(encode_cfg: dict[str, Any], probe_timeout: int) -> tuple[str, float]:
-    """Run FFprobe on encoded file to extract information.
+def _run_ffprobe(
+    encode_cfg: dict[str, Any],
+    probe_timeout: int,
+    position: int = 0,
+) -> tuple[str, float]:
+    """Run FFprobe on encoded file to extract stream and format information.
 
     Args:
         encode_cfg: Dictionary containing encoding configuration.
         probe_timeout: Timeout in seconds for the FFprobe command.
+        position: tqdm bar position.
 
     Returns:
         Tuple of (probe_filename, elapsed_time).
 
     Raises:
         subprocess.TimeoutExpired: If FFprobe process times out.
+        subprocess.CalledProcessError: If FFprobe fails.
     """
     probe_filename: str = f"{encode_cfg['outfile']['filename']}_ffprobe.json"
     probe_cmd: list[str] = [
@@ -128,8 +309,6 @@ def _run_ffprobe(encode_cfg: dict[str, Any], probe_timeout: int) -> tuple[str, f
         "-hide_banner",
         "-show_streams",
         "-show_format",
-        "-show_entries",
-        "frame=pict_type",
         "-print_format",
         "json",
         "-i",
@@ -138,33 +317,271 @@ def _run_ffprobe(encode_cfg: dict[str, Any], probe_timeout: int) -> tuple[str, f
         probe_filename,
     ]
 
-    # Start FFprobe process and track progress
-    start_time = time.time()
-    process = subprocess.Popen(args=probe_cmd)
-
-    for _timeout in tqdm(
-        range(probe_timeout),
+    # Run FFprobe; completion is awaited, not polled
+    with tqdm(
         desc=f"[PROBE ] {probe_filename}",
-        unit="s",
-    ):
-        time.sleep(1)
-        if process.poll() is not None:
-            break
-
-    elapsed_time = time.time() - start_time
+        total=1,
+        position=position,
+    ) as pbar:
+        result = run_process(probe_cmd, timeout=probe_timeout)
+        pbar.update(1)
 
-    # Check if process timed out
-    if process.poll() is None:
-        process.terminate()
-        raise subprocess.TimeoutExpired(probe_cmd, probe_timeout)
+    elapsed_time = result.elapsed_time
 
     return probe_filename, elapsed_time
 
 
+def encode_video(  # noqa: PLR0913
+    encode_cfg: dict[str, Any],
+    ffmpeg_threads: int = 4,
+    position: int = 1,
+    vmaf_cpu_count: int | None = None,
+    on_stdout: Callable[[bytes], None] | None = None,
+    *,
+    encoder_threads: int | None = None,
+) -> dict[str, Any]:
+    """Encode video using FFmpeg with the specified configuration.
+
+    Args:
+        encode_cfg: Dictionary containing encoding configuration.
+        ffmpeg_threads: Number of threads to use for FFmpeg encoding.
+        position: tqdm bar position.
+        vmaf_cpu_count: Number of libvmaf threads to also score the encode in the
+            same pass (see ``supports_single_pass``), or None to only encode.
+        on_stdout: Callback receiving each ``-progress`` line of the encode,
+            such as ``AbortRules.bitrate_watcher``; it may raise to stop it.
+        encoder_threads: Number of encoder threads when a core budget is shared
+            by concurrent jobs, or None to let the encoder choose.
+
+    Returns:
+        Dictionary containing encoding results including:
+        - commandline: The full FFmpeg command used
+        - elapsed_time: Time taken for encoding (and scoring in single-pass mode)
+    """
+    ffmpeg_cmd = _build_ffmpeg_command(
+        encode_cfg,
+        ffmpeg_threads,
+        vmaf_cpu_count,
+        encoder_threads=encoder_threads,
+    )
+    elapsed_time_enc = _run_ffmpeg_encode(encode_cfg, ffmpeg_cmd, position, on_stdout=on_stdout)
+
+    return {
+        "commandline": " ".join(ffmpeg_cmd),
+        "elapsed_time": elapsed_time_enc,
+    }
+
+
+def encode_videos(
+    encode_cfgs: list[dict[str, Any]],
+    ffmpeg_threads: int = 4,
+    position: int = 1,
+    *,
+    encoder_threads: int | None = None,
+) -> list[dict[str, Any]]:
+    """Encode several variants of one reference in a single FFmpeg run.
+
+    The reference is decoded once and its frames are fed to one encoder per
+    output. ``-benchmark_all`` reports the time spent encoding each frame of
+    each output; the run time is split between the outputs in proportion to
+    their encoder time, so ``elapsed_time`` stays comparable between jobs.
+
+    Args:
+        encode_cfgs: Encoding configurations sharing the reference, infile
+            option and hardware acceleration options.
+        ffmpeg_threads: Number of threads to use for FFmpeg decoding.
+        position: tqdm bar position.
+        encoder_threads: Number of threads shared by the encoders when a core
+            budget is shared by concurrent jobs, or None to let each encoder choose.
+
+    Returns:
+        One dictionary per encode, as returned by ``encode_video``.
+    """
+    # エンコーダーは同時に動くので、スレッドを出力で分け合う
+    __threads: int | None = (
+        None if encoder_threads is None else max(1, encoder_threads // len(encode_cfgs))
+    )
+    ffmpeg_cmd = _build_ffmpeg_command(encode_cfgs[0], ffmpeg_threads, encoder_threads=__threads)
+    ffmpeg_cmd.insert(1, "-benchmark_all")
+    for __encode_cfg in encode_cfgs[1:]:
+        ffmpeg_cmd.extend(_build_output_args(__encode_cfg, threads=__threads))
+        Path(f"{__encode_cfg['outfile']['filename']}").parent.mkdir(parents=True, exist_ok=True)
+
+    __bench: Counter[int] = Counter()
+
+    def __on_stderr(line: bytes) -> None:
+        if (match := BENCH_ENCODE_REGEX.search(line)) is not None:
+            __bench[int(match.group(2))] += int(match.group(1))
+
+    elapsed_time = _run_ffmpeg_encode(encode_cfgs[0], ffmpeg_cmd, position, __on_stderr)
+
+    # FFREPORT は 1 プロセス 1 ファイルなので、各出力のログとしてコピーする
+    __report = Path(f"{encode_cfgs[0]['outfile']['filename']}.log")
+    __total: int = sum(__bench.values())
+    __results: list[dict[str, Any]] = []
+    for __index, __encode_cfg in enumerate(encode_cfgs):
+        if __index > 0 and __report.is_file():
+            shutil.copyfile(__report, f"{__encode_cfg['outfile']['filename']}.log")
+        __share: float = __bench[__index] / __total if __total else 1 / len(encode_cfgs)
+        __results.append(
+            {
+                "commandline": " ".join(ffmpeg_cmd),
+                "elapsed_time": elapsed_time * __share,
+            },
+        )
+    return __results
+
+
+def _trace_frame_types(
+    encode_cfg: dict[str, Any],
+    codec_name: str,
+    probe_timeout: int,
+    position: int = 0,
+) -> tuple[FrameTypeCounter, float]:
+    """Count picture types from slice headers without decoding.
+
+    The encoded video is stream-copied through the ``trace_headers`` bitstream
+    filter, which logs every parsed header.
+
+    Args:
+        encode_cfg: Dictionary containing encoding configuration.
+        codec_name: FFprobe codec name of the video stream (see ``TRACE_SLICE_TYPES``).
+        probe_timeout: Timeout in seconds for the FFmpeg command.
+        position: tqdm bar position.
+
+    Returns:
+        Tuple of (frame type counter, elapsed_time).
+    """
+    parser = TraceHeadersParser(codec_name, FrameTypeCounter())
+    trace_cmd: list[str] = [
+        "ffmpeg",
+        "-hide_banner",
+        "-loglevel",
+        "repeat+info",
+        "-i",
+        f"{encode_cfg['outfile']['filename']}.mkv",
+        "-map",
+        "0:v:0",
+        "-c",
+        "copy",
+        "-bsf:v",
+        "trace_headers",
+        "-f",
+        "null",
+        "-",
+    ]
+
+    with tqdm(
+        desc=f"[PROBE ] {encode_cfg['outfile']['filename']}.mkv (headers)",
+        total=1,
+        position=position,
+    ) as pbar:
+        result = run_process(trace_cmd, timeout=probe_timeout, on_stderr=parser.feed)
+        pbar.update(1)
+
+    return parser.finish(), result.elapsed_time
+
+
+def _stream_frame_types(
+    encode_cfg: dict[str, Any],
+    probe_timeout: int,
+    position: int = 0,
+) -> tuple[FrameTypeCounter, float]:
+    """Count picture types from decoded frames without buffering them.
+
+    FFprobe writes one CSV line per frame to a pipe and each line is counted as
+    it arrives, so memory use does not grow with the number of frames.
+
+    Args:
+        encode_cfg: Dictionary containing encoding configuration.
+        probe_timeout: Timeout in seconds for the FFprobe command.
+        position: tqdm bar position.
+
+    Returns:
+        Tuple of (frame type counter, elapsed_time).
+    """
+    counter = FrameTypeCounter()
+    frames_cmd: list[str] = [
+        "ffprobe",
+        "-v",
+        "error",
+        "-hide_banner",
+        "-select_streams",
+        "v:0",
+        "-show_entries",
+        "frame=pict_type",
+        "-print_format",
+        "csv=p=0",
+        "-i",
+        f"{encode_cfg['outfile']['filename']}.mkv",
+    ]
+
+    with tqdm(
+        desc=f"[PROBE ] {encode_cfg['outfile']['filename']}.mkv (frames)",
+        total=1,
+        position=position,
+    ) as pbar:
+        result = run_process(frames_cmd, timeout=probe_timeout, on_stdout=counter.feed)
+        pbar.update(1)
+
+    return counter, result.elapsed_time
+
+
+def probe_video(
+    encode_cfg: dict[str, Any],
+    probe_timeout: int,
+    position: int = 1,
+    *,
+    fast: bool = False,
+) -> dict[str, Any]:
+    """Run FFprobe on an encoded file and extract frame information.
+
+    The stream and format information is written to ``*_ffprobe.json``; picture
+    types are counted while FFprobe streams them (see ``_stream_frame_types``), so
+    the per-frame list is never held in memory or written to disk. In fast mode
+    the picture types are read from the slice headers instead (see
+    ``_trace_frame_types``) for the codecs listed in ``TRACE_SLICE_TYPES``; other
+    codecs fall back to decoding. Both paths give the same ``stream`` result.
+
+    Args:
+        encode_cfg: Dictionary containing encoding configuration.
+        probe_timeout: Timeout in seconds for the FFprobe command.
+        position: tqdm bar position.
+        fast: Whether to avoid decoding where the codec allows it.
+
+    Returns:
+        Dictionary containing probe results including:
+        - elapsed_prbt: Time taken for probing
+        - stream: Stream information from FFprobe
+    """
+    probe_filename, elapsed_time_prbt = _run_ffprobe(encode_cfg, probe_timeout, position)
+    with Path(probe_filename).open("r") as file:
+        video_stream: dict[str, Any] = json.load(file)["streams"][0]
+
+    codec_name: str = video_stream.get("codec_name", "")
+    if fast and codec_name in TRACE_SLICE_TYPES:
+        counter, elapsed_time_frames = _trace_frame_types(
+            encode_cfg,
+            codec_name,
+            probe_timeout,
+            position,
+        )
+    else:
+        if fast:
+            print(f"[PROBE ] fast probe not supported for {codec_name}, decoding frames")  # noqa: T201
+        counter, elapsed_time_frames = _stream_frame_types(encode_cfg, probe_timeout, position)
+
+    return {
+        "elapsed_prbt": elapsed_time_prbt + elapsed_time_frames,
+        "stream": counter.stream(video_stream),
+    }
+
+
 def encoding(
     encode_cfg: dict[str, Any],
     probe_timeout: int,
     ffmpeg_threads: int = 4,
+    position: int = 1,
 ) -> dict[str, Any]:
     """Encode video using FFmpeg with the specified configuration.
 
@@ -175,6 +592,7 @@ def encoding(
         encode_cfg: Dictionary containing encoding configuration.
         probe_timeout: Timeout in seconds for the FFprobe command.
         ffmpeg_threads: Number of threads to use for FFmpeg encoding.
+        position: tqdm bar position.
 
     Returns:
         Dictionary containing encoding results including:
@@ -183,25 +601,22 @@ def encoding(
         - elapsed_prbt: Time taken for probing
         - stream: Stream information from FFprobe
     """
-    # Build FFmpeg command
-    ffmpeg_cmd = _build_ffmpeg_command(encode_cfg, ffmpeg_threads)
-
-    # Run FFmpeg encoding
-    elapsed_time_enc = _run_ffmpeg_encode(encode_cfg, ffmpeg_cmd)
-
-    # Run FFprobe on encoded file
-    probe_filename, elapsed_time_prbt = _run_ffprobe(encode_cfg, probe_timeout)
-
-    # Return results
     return {
-        "commandline": " ".join(ffmpeg_cmd),
-        "elapsed_time": elapsed_time_enc,
-        "elapsed_prbt": elapsed_time_prbt,
-        "stream": getframeinfo(probe_filename),
+        **encode_video(encode_cfg, ffmpeg_threads, position),
+        **probe_video(encode_cfg, probe_timeout, position),
     }
 
 
-def getvmaf(encode_cfg: dict[str, Any], cpu_count: int | None = None) -> dict[str, Any]:
+def getvmaf(  # noqa: PLR0913
+    encode_cfg: dict[str, Any],
+    cpu_count: int | None = None,
+    position: int = 1,
+    chunks: int = 1,
+    frames: int | None = None,
+    *,
+    head: int = 0,
+    check: Callable[[dict[str, Any]], None] | None = None,
+) -> dict[str, Any]:
     """Calculate VMAF score for encoded video.
 
     Compares the encoded video with the original reference video to calculate
@@ -210,6 +625,14 @@ def getvmaf(encode_cfg: dict[str, Any], cpu_count: int | None = None) -> dict[st
     Args:
         encode_cfg: Dictionary containing encoding configuration.
         cpu_count: Number of CPU cores to use for VMAF calculation.
+        position: tqdm bar position.
+        chunks: Number of frame ranges scored in separate processes whose logs
+            are merged (see ``getvmaf_chunked``).
+        frames: Number of frames of the encoded video, required to split it.
+        head: Number of first frames scored on their own and passed to ``check``
+            before the rest is scored.
+        check: Callback receiving the VMAF log of the first ``head`` frames; it
+            may raise to stop before the rest is scored.
 
     Returns:
         Dictionary containing VMAF calculation results including:
@@ -221,44 +644,47 @@ def getvmaf(encode_cfg: dict[str, Any], cpu_count: int | None = None) -> dict[st
 
         cpu_count = os_cpu_count()
 
+    if (chunks > 1 or head > 0) and frames:
+        from ffvqe.encoding.vmaf_chunks import getvmaf_chunked
+
+        return getvmaf_chunked(
+            encode_cfg,
+            frames,
+            chunks,
+            cpu_count,
+            position,
+            head=head,
+            check=check,
+        )
+
     __ffmpege_cmd: list[str] = [
         "ffmpeg",
         "-r",
-        "29.97",
+        f"{VMAF_FRAME_RATE}",
         "-i",
         f"{encode_cfg['outfile']['filename']}.mkv",
         "-r",
-        "29.97",
+        f"{VMAF_FRAME_RATE}",
         "-i",
         f"{encode_cfg['infile']['filename']}",
         "-lavfi",
-        (
-            "[0:v]settb=AVTB,setpts=PTS-STARTPTS[Distorted];"
-            "[1:v]settb=AVTB,setpts=PTS-STARTPTS[Reference];"
-            "[Distorted][Reference]libvmaf=eof_action=endall:"
-            "log_fmt=json:"
-            f"log_fmt=json:log_path={encode_cfg['outfile']['filename']}_vmaf.json:"
-            f"n_threads={cpu_count}:"
-            "pool=harmonic_mean:"
-            "feature=name=psnr|name=float_ssim:"
-            "model=version=vmaf_v0.6.1"
-        ),
+        _build_libvmaf_filter(encode_cfg, cpu_count, "0:v", "1:v"),
         "-an",
         "-f",
         "null",
         "-",
     ]
 
-    __start = time.time()
-    __ff_vmaf = FfmpegProgress(__ffmpege_cmd)
     with tqdm(
         desc=f"[VMAF  ] {encode_cfg['outfile']['filename']}_vmaf.json",
         total=100,
-        position=1,
+        position=position,
     ) as pbar:
-        for progress in __ff_vmaf.run_command_with_progress():
-            pbar.update(progress - pbar.n)
-    elapsed_time = time.time() - __start
+        result = run_process(
+            __ffmpege_cmd,
+            progress=lambda percent: pbar.update(percent - pbar.n),
+        )
+    elapsed_time = result.elapsed_time
 
     print(f"\nelapsed_time: {format_seconds(int(elapsed_time))}\n")  # noqa: T201
     return {
@@ -267,6 +693,94 @@ def getvmaf(encode_cfg: dict[str, Any], cpu_count: int | None = None) -> dict[st
     }
 
 
+def _build_vmaf_batch_command(
+    encode_cfgs: list[dict[str, Any]],
+    cpu_count: int | None,
+) -> list[str]:
+    """Build the FFmpeg command scoring several encodes of one reference.
+
+    The reference is the last input; it is decoded once and ``split`` into one
+    libvmaf instance per encode, each writing the ``_vmaf.json`` of its job.
+
+    Args:
+        encode_cfgs: Encoding configurations sharing the same reference.
+        cpu_count: Number of threads of each libvmaf instance.
+
+    Returns:
+        List of command arguments for FFmpeg.
+    """
+    __count: int = len(encode_cfgs)
+    __cmd: list[str] = ["ffmpeg"]
+    for __encode_cfg in encode_cfgs:
+        __cmd.extend(
+            ["-r", f"{VMAF_FRAME_RATE}", "-i", f"{__encode_cfg['outfile']['filename']}.mkv"],
+        )
+    __cmd.extend(["-r", f"{VMAF_FRAME_RATE}", "-i", f"{encode_cfgs[0]['infile']['filename']}"])
+
+    __graph: list[str] = [
+        f"[{__count}:v]split={__count}" + "".join(f"[ref{__i}]" for __i in range(__count)),
+    ]
+    __graph.extend(
+        _build_libvmaf_filter(__encode_cfg, cpu_count, f"{__i}:v", f"ref{__i}", tag=f"{__i}")
+        + f"[vmaf{__i}]"
+        for __i, __encode_cfg in enumerate(encode_cfgs)
+    )
+    __cmd.extend(["-filter_complex", ";".join(__graph)])
+    for __i in range(__count):
+        __cmd.extend(["-map", f"[vmaf{__i}]", "-an", "-f", "null", "-"])
+    return __cmd
+
+
+def getvmaf_batch(
+    encode_cfgs: list[dict[str, Any]],
+    cpu_count: int | None = None,
+    position: int = 1,
+) -> list[dict[str, Any]]:
+    """Calculate VMAF scores for several encodes of one reference in one FFmpeg run.
+
+    The reference is decoded once for all encodes instead of once per encode.
+    ``cpu_count`` threads are shared by the libvmaf instances.
+
+    Args:
+        encode_cfgs: Encoding configurations sharing the same reference.
+        cpu_count: Number of CPU cores to use for VMAF calculation.
+        position: tqdm bar position.
+
+    Returns:
+        One dictionary per encode, as returned by ``getvmaf``. ``elapsed_time``
+        is the run time divided by the number of encodes.
+    """
+    if cpu_count is None:
+        from os import cpu_count as os_cpu_count
+
+        cpu_count = os_cpu_count() or 1
+
+    __ffmpege_cmd = _build_vmaf_batch_command(
+        encode_cfgs,
+        max(1, cpu_count // len(encode_cfgs)),
+    )
+
+    with tqdm(
+        desc=f"[VMAF  ] {encode_cfgs[0]['infile']['filename']} x{len(encode_cfgs)}",
+        total=100,
+        position=position,
+    ) as pbar:
+        result = run_process(
+            __ffmpege_cmd,
+            progress=lambda percent: pbar.update(percent - pbar.n),
+        )
+    elapsed_time = result.elapsed_time
+
+    print(f"\nelapsed_time: {format_seconds(int(elapsed_time))}\n")  # noqa: T201
+    return [
+        {
+            "commandline": " ".join(__ffmpege_cmd),
+            "elapsed_time": elapsed_time / len(encode_cfgs),
+        }
+        for _ in encode_cfgs
+    ]
+
+
 def getprobe(videofile: str) -> None:
     """Run FFprobe on a video file to extract information.
 
@@ -280,8 +794,8 @@ def getprobe(videofile: str) -> None:
         f"{videofile}".replace(Path(videofile).suffix, "_ffprobe.json", 1),
     )
     print(f"[PROBE ] {__probe_file}")  # noqa: T201
-    subprocess.run(
-        args=[
+    run_process(
+        [
             "ffprobe",
             "-v",
             "error",
@@ -297,14 +811,36 @@ def getprobe(videofile: str) -> None:
             f"{videofile}",
         ],
         timeout=10,
-        check=True,
     )
 
 
+def _versions_key(build_file: Path) -> str | None:
+    """Build the cache key of the environment block from the toolchain files.
+
+    Args:
+        build_file: Path of the build's ``versions.json``.
+
+    Returns:
+        The key, or None if ffprobe is not on the ``PATH``.
+    """
+    __ffprobe: str | None = shutil.which("ffprobe")
+    if __ffprobe is None:
+        return None
+    __files: list[Path] = [
+        Path(__binary) for __binary in (shutil.which("ffmpeg"), __ffprobe) if __binary is not None
+    ]
+    if build_file.is_file():
+        __files.append(build_file)
+    return json.dumps([file_identity(__file) for __file in __files])
+
+
 def get_versions(configfile: str) -> dict[str, Any]:
     """Get FFmpeg version information.
 
-    Retrieves version information for FFmpeg and its libraries.
+    Retrieves version information for FFmpeg and its libraries. The result is
+    cached, keyed by the resolved path, size and modification time of the
+    ffmpeg/ffprobe binaries and of ``/opt/ffmpeg/versions.json``, so runs on an
+    unchanged toolchain do not start ffprobe.
 
     Args:
         configfile: Path to the configuration file.
@@ -312,11 +848,39 @@ def get_versions(configfile: str) -> dict[str, Any]:
     Returns:
         Dictionary containing FFmpeg version information.
     """
-    __versions_file: Path = Path(f"{Path(configfile).parent}/versions.json")
     __versions_build_file: Path = Path("/opt/ffmpeg/versions.json")
-    print(f"[PROBE ] {__versions_file}")  # noqa: T201
-    subprocess.run(
-        args=[
+    __key: str | None = _versions_key(__versions_build_file)
+    __cache = JsonCache("environment") if __key is not None else None
+    try:
+        if __cache is not None and __key is not None:
+            __cached: dict[str, Any] | None = __cache.get(__key)
+            if __cached is not None:
+                print(f"[CACHE ] versions: {configfile}")  # noqa: T201
+                return __cached
+
+        __versions: dict[str, Any] = _capture_versions(configfile, __versions_build_file)
+        if __cache is not None and __key is not None:
+            __cache.put(__key, __versions)
+    finally:
+        if __cache is not None:
+            __cache.close()
+
+    return __versions
+
+
+def _capture_versions(configfile: str, versions_build_file: Path) -> dict[str, Any]:
+    """Run ffprobe and read the build's package versions.
+
+    Args:
+        configfile: Path to the configuration file.
+        versions_build_file: Path of the build's ``versions.json``.
+
+    Returns:
+        Dictionary containing FFmpeg version information.
+    """
+    print(f"[PROBE ] versions: {configfile}")  # noqa: T201
+    __result = run_process(
+        [
             "ffprobe",
             "-v",
             "error",
@@ -325,26 +889,24 @@ def get_versions(configfile: str) -> dict[str, Any]:
             "-show_program_version",
             "-print_format",
             "json",
-            "-o",
-            f"{__versions_file}",
         ],
         timeout=10,
-        check=True,
+        capture_stdout=True,
     )
-
-    with __versions_file.open("r") as file:
-        __versions_log: dict[str, Any] = json.load(file)
-    __versions_file.unlink()
+    __versions_log: dict[str, Any] = json.loads(__result.stdout)
 
     __versions_build: dict[str, Any] = {}
-    """__versions_build_file がある"""
-    if Path(f"{__versions_build_file}").exists():
-        print(f"[GET   ] {__versions_build_file} file found.")  # noqa: T201
-        with Path(f"{__versions_build_file}").open("r") as file:
+    """versions_build_file がある"""
+    if versions_build_file.is_file():
+        print(f"[GET   ] {versions_build_file} file found.")  # noqa: T201
+        __text: str = versions_build_file.read_text()
+        try:
+            __versions_build = json.loads(__text)
+        except ValueError:
+            # JSON でなければ従来どおり YAML として読む
             from ffvqe.utils.yaml_handler import create_yaml_handler
 
-            yaml = create_yaml_handler()
-            __versions_build = yaml.load(file)
+            __versions_build = create_yaml_handler().load(__text)
 
     return {
         "ffmpege": {
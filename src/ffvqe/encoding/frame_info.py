@@ -4,10 +4,148 @@
 # %%
 """Frame information extraction for FFmpeg video quality evaluations."""
 
+import heapq
 import json
 from pathlib import Path
+import re
 from typing import Any
 
+# Picture type of a slice_type value as reported by the decoder, per codec
+# (H.264 slice types 5-9 are 0-4 with the "all slices of the picture" flag)
+TRACE_SLICE_TYPES: dict[str, dict[int, str]] = {
+    "h264": {0: "P", 1: "B", 2: "I", 3: "p", 4: "i"},
+    "hevc": {0: "B", 1: "P", 2: "I"},
+}
+
+# Packets are traced in decode order; this many are buffered to restore display order
+REORDER_WINDOW: int = 64
+
+# Flags are printed in this order by the trace_headers bitstream filter,
+# e.g. "Packet: 2618 bytes, key frame, corrupt, pts 3003, dts 0, duration 1001."
+TRACE_PACKET_REGEX = re.compile(
+    rb"\] Packet: \d+ bytes(?:, key frame)?(?:, corrupt)?, (?:pts (-?\d+)|no pts)",
+)
+TRACE_SLICE_TYPE_REGEX = re.compile(rb"\sslice_type\s+[01]+ = (\d+)\s*$")
+
+
+class FrameTypeCounter:
+    """Count picture types and the first GOP length one frame at a time."""
+
+    def __init__(self) -> None:
+        """Initialize the counter."""
+        self.frames: dict[str, int] = {"I": 0, "P": 0, "B": 0}
+        self._current_gop_length = 0
+        self._first_gop_length = 0
+
+    def add(self, pict_type: str) -> None:
+        """Count one frame in display order.
+
+        Args:
+            pict_type: Picture type of the frame (``I``, ``P``, ``B``, ...).
+        """
+        if pict_type in self.frames:
+            self.frames[pict_type] += 1
+
+        # Iフレームが見つかったらGOPの長さを記録
+        if pict_type == "I":
+            if self._current_gop_length > 0 and self._first_gop_length == 0:
+                self._first_gop_length = self._current_gop_length
+            self._current_gop_length = 1  # Iフレーム自体をカウント
+        else:
+            self._current_gop_length += 1
+
+    def feed(self, line: bytes) -> None:
+        """Count one frame from a line of ``-show_entries frame=pict_type -of csv=p=0``.
+
+        Args:
+            line: Raw output line of FFprobe.
+        """
+        if pict_type := line.strip().split(b",", 1)[0].decode():
+            self.add(pict_type)
+
+    @property
+    def gop(self) -> int:
+        """Length of the first GOP (the whole stream if it has a single GOP)."""
+        return self._first_gop_length or self._current_gop_length
+
+    def stream(self, video_stream: dict[str, Any]) -> dict[str, Any]:
+        """Build the ``outfile.stream`` result.
+
+        Args:
+            video_stream: FFprobe stream entry of the video stream.
+
+        Returns:
+            A dictionary with gop, has_b_frames, refs and frame counts.
+        """
+        return {
+            "gop": int(self.gop),
+            "has_b_frames": int(video_stream["has_b_frames"]),
+            "refs": int(video_stream["refs"]),
+            "frames": {**self.frames, "total": sum(self.frames.values())},
+        }
+
+
+class TraceHeadersParser:
+    """Read picture types from ``trace_headers`` bitstream filter output.
+
+    Only slice headers are parsed, so no frame is decoded. The picture type of a
+    packet is the type of its first slice, which is what the decoders report for
+    the encoders used here. Packets are traced in decode order and are put back
+    into display order by pts through a small reorder buffer before counting.
+    """
+
+    def __init__(self, codec_name: str, counter: FrameTypeCounter) -> None:
+        """Initialize the parser.
+
+        Args:
+            codec_name: FFprobe codec name; must be a key of ``TRACE_SLICE_TYPES``.
+            counter: Counter receiving the picture types in display order.
+        """
+        self.slice_types = TRACE_SLICE_TYPES[codec_name]
+        self.modulo = len(self.slice_types)
+        self.counter = counter
+        self._reorder: list[tuple[int, int, str]] = []
+        self._packets = 0
+        self._pts: int | None = None
+        self._pict_type: str | None = None
+
+    def _flush_packet(self) -> None:
+        if self._pict_type is not None:
+            pts = self._pts if self._pts is not None else self._packets
+            heapq.heappush(self._reorder, (pts, self._packets, self._pict_type))
+            if len(self._reorder) > REORDER_WINDOW:
+                self.counter.add(heapq.heappop(self._reorder)[2])
+        self._packets += 1
+        self._pts = None
+        self._pict_type = None
+
+    def feed(self, line: bytes) -> None:
+        """Parse one line of FFmpeg log output.
+
+        Args:
+            line: Raw log line.
+        """
+        if (packet := TRACE_PACKET_REGEX.search(line)) is not None:
+            self._flush_packet()
+            pts = packet.group(1)
+            self._pts = None if pts is None else int(pts)
+        elif (
+            self._pict_type is None
+            and (slice_type := TRACE_SLICE_TYPE_REGEX.search(line)) is not None
+        ):
+            self._pict_type = self.slice_types.get(int(slice_type.group(1)) % self.modulo)
+
+    def finish(self) -> FrameTypeCounter:
+        """Count the buffered packets.
+
+        Returns:
+            The counter with all frames added.
+        """
+        self._flush_packet()
+        while self._reorder:
+            self.counter.add(heapq.heappop(self._reorder)[2])
+        return self.counter
+
 
 def getframeinfo(filename: str) -> dict[str, Any]:
     """Extract frame information from FFprobe JSON output.
@@ -26,52 +164,20 @@ def getframeinfo(filename: str) -> dict[str, Any]:
         - frames: Counts of I, P, B frames and total frames
     """
     __probe_log: dict[str, Any] = {}
-    __stream: dict[str, Any] = {
-        "gop": 0,
-        "has_b_frames": 0,
-        "refs": 0,
-        "frames": {"I": 0, "P": 0, "B": 0, "total": 0},
-    }
-    # フレームのカウントを初期化
-    __gop_lengths = []
-    __current_gop_length = 0
-    __first_gop_length = 0
+    __counter = FrameTypeCounter()
 
     with Path(f"{filename}").open("r") as file:
         __probe_log = json.load(file)
 
     # フレーム情報をループしてカウント
     for frame in __probe_log["frames"]:
-        frame_type = frame["pict_type"]
-        if frame_type in __stream["frames"]:
-            __stream["frames"][frame_type] += 1
-
-        # Iフレームが見つかったらGOPの長さを記録
-        if frame_type == "I":
-            if __current_gop_length > 0:
-                __gop_lengths.append(__current_gop_length)
-                if __first_gop_length == 0:
-                    __first_gop_length = __current_gop_length
-            __current_gop_length = 1  # Iフレーム自体をカウント
-        else:
-            __current_gop_length += 1
+        __counter.add(frame["pict_type"])
 
-    # 最後のGOPの長さを追加
-    if __current_gop_length > 0:
-        __gop_lengths.append(__current_gop_length)
-        if __first_gop_length == 0:
-            __first_gop_length = __current_gop_length
+    __stream: dict[str, Any] = __counter.stream(__probe_log["streams"][0])
 
     # テスト用に固定値を返す
     if filename == "dummy_path":
         __stream["gop"] = 1
-    else:
-        __stream["gop"] = int(__first_gop_length)
-    __stream["has_b_frames"] = int(__probe_log["streams"][0]["has_b_frames"])
-    __stream["refs"] = int(__probe_log["streams"][0]["refs"])
-    __stream["frames"]["total"] = (
-        __stream["frames"]["I"] + __stream["frames"]["P"] + __stream["frames"]["B"]
-    )
 
     """ "frames" を削除"""
     if "frames" in __probe_log:
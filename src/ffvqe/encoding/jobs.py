@@ -0,0 +1,762 @@
+#!/usr/bin/env python3
+# To add a new cell, type '# %%'
+# To add a new markdown cell, type '# %% [markdown]'
+# %%
+"""Per-job encode, probe and VMAF stages for FFmpeg video quality evaluations."""
+
+from collections.abc import Callable
+from collections.abc import Iterator
+from contextlib import ExitStack
+from contextlib import contextmanager
+from copy import deepcopy
+import json
+from os import cpu_count
+from pathlib import Path
+from time import gmtime
+from time import strftime
+from typing import Any
+
+from ffvqe.data.output_store import OUTPUT_STORE_DIR
+from ffvqe.data.output_store import OutputStore
+from ffvqe.encoding.abort import AbortRules
+from ffvqe.encoding.chunked import encode_video_chunked
+from ffvqe.encoding.chunked import supports_chunking
+from ffvqe.encoding.encoder import SOFTWARE_CODECS
+from ffvqe.encoding.encoder import encode_video
+from ffvqe.encoding.encoder import encode_videos
+from ffvqe.encoding.encoder import getvmaf
+from ffvqe.encoding.encoder import getvmaf_batch
+from ffvqe.encoding.encoder import probe_video
+from ffvqe.encoding.encoder import supports_single_pass
+from ffvqe.encoding.mezzanine import Mezzanines
+from ffvqe.encoding.mezzanine import supports_mezzanine
+from ffvqe.encoding.reference_probe import ReferenceProbes
+from ffvqe.encoding.scheduler import JobSlot
+from ffvqe.encoding.shared_frames import SharedFrames
+from ffvqe.utils.exceptions import JobPrunedError
+from ffvqe.utils.file_operations import getfilehash
+
+# Job stages in execution order; each one is recorded in ``encode["stages"]``
+STAGES: tuple[str, ...] = ("encoded", "hashed", "probed", "scored")
+
+
+class EncodeJob:
+    """State of one datafile entry while it moves through the pipeline.
+
+    The encode configuration is copied so that the datafile list owned by
+    ``main_encode`` is only modified by the caller. Every finished stage is
+    recorded under ``encode["stages"]`` together with the artifact it produced and
+    its results, and handed to ``checkpoint`` so that it can be persisted. A job
+    created from a partially processed entry resumes at the first stage that is
+    not done or whose artifact is missing or invalid.
+
+    A job stopped by an abort rule of its pattern is recorded as pruned under
+    ``encode["pruned"]`` with the partial statistics measured so far; the
+    remaining stages pass it through.
+    """
+
+    def __init__(  # noqa: PLR0913
+        self,
+        index: int,
+        encode: dict[str, Any],
+        checkpoint: Callable[["EncodeJob"], None] | None = None,
+        *,
+        probes: ReferenceProbes | None = None,
+        mezzanines: Mezzanines | None = None,
+        frames: SharedFrames | None = None,
+    ) -> None:
+        """Initialize the job.
+
+        Args:
+            index: Index of the entry in the datafile.
+            encode: Encode configuration of the entry.
+            checkpoint: Called on the worker thread after every finished stage.
+            probes: Reference probes shared by the jobs of a run.
+            mezzanines: Decoded references shared by the jobs of a run, if enabled.
+            frames: Reference frames shared by the VMAF runs, if enabled.
+        """
+        self.index = index
+        self.probes = probes if probes is not None else ReferenceProbes()
+        self.mezzanines = mezzanines
+        self.frames = frames
+        self.encode: dict[str, Any] = deepcopy(encode)
+        self.encode.setdefault("stages", {})
+        self.base_probe: dict[str, Any] = {}
+        self.encode_rep: dict[str, Any] = {}
+        self.probe_rep: dict[str, Any] = {}
+        self.vmaf_rsp: dict[str, Any] = {}
+        self.hash: str = ""
+        self._checkpoint = checkpoint
+        self._restore()
+
+    @property
+    def outfile(self) -> str:
+        """Output file path without extension."""
+        return str(self.encode["outfile"]["filename"])
+
+    def done(self, stage: str) -> bool:
+        """Check whether a stage has been recorded as done.
+
+        Args:
+            stage: Stage name.
+
+        Returns:
+            True if the stage is done.
+        """
+        return bool(self.encode["stages"].get(stage, {}).get("done", False))
+
+    @property
+    def pruned(self) -> bool:
+        """Whether the job has been stopped by an abort rule."""
+        return "pruned" in self.encode
+
+    @property
+    def abort_rules(self) -> AbortRules:
+        """Early-abort rules of the job's pattern."""
+        return AbortRules(self.encode.get("abort", {}))
+
+    def prune(self, stats: dict[str, Any]) -> None:
+        """Record the job as pruned and checkpoint it.
+
+        Args:
+            stats: Partial statistics of the job when the abort rule fired.
+        """
+        self.encode["pruned"] = stats
+        if self._checkpoint is not None:
+            self._checkpoint(self)
+
+    def mark(self, stage: str, artifact: str = "", **results: Any) -> None:  # noqa: ANN401
+        """Record a stage as done and checkpoint the job.
+
+        Args:
+            stage: Stage name.
+            artifact: Path of the file produced by the stage.
+            **results: Stage results needed to finish the job after a restart.
+        """
+        self.encode["stages"][stage] = {"done": True, "artifact": artifact, **results}
+        if self._checkpoint is not None:
+            self._checkpoint(self)
+
+    def _results(self, stage: str) -> dict[str, Any]:
+        return {
+            key: value
+            for key, value in self.encode["stages"][stage].items()
+            if key not in {"done", "artifact"}
+        }
+
+    def _artifact_valid(self, stage: str) -> bool:
+        """Check that the artifact of a stage is present and usable.
+
+        Args:
+            stage: Stage name.
+
+        Returns:
+            True if the artifact is valid.
+        """
+        __state: dict[str, Any] = self.encode["stages"].get(stage, {})
+        __artifact: Path = Path(f"{__state.get('artifact', '')}")
+        if stage == "encoded":
+            return __artifact.is_file() and __artifact.stat().st_size > 0
+        if stage == "hashed":
+            return bool(__state.get("hash", ""))
+
+        # probed / scored: JSON ログが読めて必要なキーがあること
+        __key: str = "format" if stage == "probed" else "pooled_metrics"
+        try:
+            with __artifact.open("r") as file:
+                __log = json.load(file)
+        except (OSError, ValueError):
+            return False
+        return isinstance(__log, dict) and __key in __log
+
+    def _restore_output(self) -> bool:
+        """Put the output back from the output store by the hash recorded for it.
+
+        Returns:
+            True if the output was restored.
+        """
+        __hash: str = str(self.encode["stages"].get("hashed", {}).get("hash", ""))
+        if not __hash or not OUTPUT_STORE_DIR.is_dir():
+            return False
+
+        with OutputStore(root=OUTPUT_STORE_DIR) as store:
+            if not store.restore(__hash, Path(f"{self.outfile}.mkv")):
+                return False
+        print(f"[STORE ] restore: {self.outfile}.mkv")  # noqa: T201
+        return True
+
+    def _restore(self) -> None:
+        """Drop stages that have to run again and restore results of the others."""
+        __valid: dict[str, bool] = {
+            stage: self.done(stage) and self._artifact_valid(stage) for stage in STAGES[1:]
+        }
+        # 後続ステージがすべて完了していれば .mkv は不要
+        __encoded: bool = self.done("encoded") and (
+            all(__valid.values()) or self._artifact_valid("encoded") or self._restore_output()
+        )
+        if not __encoded:
+            __valid = dict.fromkeys(STAGES[1:], False)
+            self.encode["stages"].pop("encoded", None)
+
+        for __stage, __ok in __valid.items():
+            if not __ok:
+                self.encode["stages"].pop(__stage, None)
+
+        if self.done("encoded"):
+            self.encode_rep = self._results("encoded")
+        if self.done("probed"):
+            self.probe_rep = self._results("probed")
+        if self.done("hashed"):
+            self.hash = str(self._results("hashed")["hash"])
+        if self.done("scored"):
+            self.vmaf_rsp = self._results("scored")
+
+
+def _load_base_probe(job: EncodeJob) -> dict[str, Any]:
+    """Load the FFprobe log of the job's reference file.
+
+    Args:
+        job: Encode job.
+
+    Returns:
+        FFprobe log of the reference file.
+    """
+    if not job.base_probe:
+        job.base_probe = job.probes.get(job.encode["infile"]["filename"])
+
+    return job.base_probe
+
+
+def _hash_output(job: EncodeJob) -> None:
+    """Hash the encoded output unless it has already been hashed.
+
+    Called right after the encode, while the output is still in the page cache,
+    so the hash does not read the file back from disk.
+
+    Args:
+        job: Encode job.
+    """
+    if not job.done("hashed"):
+        job.hash = getfilehash(f"{job.outfile}.mkv")
+        job.mark("hashed", hash=job.hash)
+
+
+@contextmanager
+def _reference(job: EncodeJob, *, encode: bool) -> Iterator[dict[str, Any]]:
+    """Provide the encode configuration of a job, reading an already decoded reference.
+
+    libvmaf reads the shared reference frames if available, then the
+    mezzanine. The encoder can only read the mezzanine, and only when the
+    reference is decoded in software with default options.
+
+    Args:
+        job: Encode job.
+        encode: Whether the reference is decoded for the encoder rather than
+            for libvmaf.
+
+    Yields:
+        Encode configuration to pass to FFmpeg; it must not be modified.
+    """
+    with ExitStack() as stack:
+        __encode_cfg: dict[str, Any] = job.encode
+        if not encode and job.frames is not None:
+            __encode_cfg = stack.enter_context(job.frames.reference(__encode_cfg))
+        if (
+            __encode_cfg is job.encode
+            and job.mezzanines is not None
+            and (not encode or supports_mezzanine(job.encode))
+        ):
+            __encode_cfg = stack.enter_context(job.mezzanines.reference(__encode_cfg))
+        yield __encode_cfg
+
+
+def _vmaf_cpu_count(slot: JobSlot, args: object) -> int | None:
+    """Get the number of libvmaf threads for a job.
+
+    Args:
+        slot: Resources granted to the stage.
+        args: Command line arguments.
+
+    Returns:
+        Number of threads, or None to use all cores.
+    """
+    # 単独実行時は従来どおり全コアで VMAF を計算する
+    if getattr(args, "jobs", 1) == 1 and not getattr(args, "pipeline", False):
+        return None
+    return slot.cores
+
+
+def _encoder_threads(args: object) -> int | None:
+    """Get the number of encoder threads for a job.
+
+    Args:
+        args: Command line arguments.
+
+    Returns:
+        ``--ffmpeg-threads`` when concurrent jobs share the cores, or None to let
+        the encoder choose as in a single-job run.
+    """
+    # 単独実行時は従来どおりエンコーダーのスレッド数を指定しない
+    if (
+        getattr(args, "jobs", 1) == 1
+        and not getattr(args, "pipeline", False)
+        and getattr(args, "cpu_budget", None) is None
+    ):
+        return None
+    return int(getattr(args, "ffmpeg_threads", 4))
+
+
+def _prune(job: EncodeJob, err: JobPrunedError) -> None:
+    """Record a job stopped by an abort rule.
+
+    Args:
+        job: Encode job.
+        err: Error raised by the abort rule, holding the partial statistics.
+    """
+    print(f"[PRUNE ] {job.outfile}: {err}")  # noqa: T201
+    job.prune(err.stats)
+
+
+def stage_encode(job: EncodeJob, slot: JobSlot, args: object) -> EncodeJob:
+    """Encode stage.
+
+    With ``--single-pass`` and a software codec, the encode is also scored in the
+    same FFmpeg process and the VMAF stage is skipped. Otherwise, with
+    ``--encode-chunks`` a software codec job is encoded in chunks run concurrently.
+
+    Args:
+        job: Encode job.
+        slot: Resources granted to the stage.
+        args: Command line arguments.
+
+    Returns:
+        The job with ``encode_rep`` and ``hash`` (and ``vmaf_rsp`` in single-pass
+        mode) set, or pruned if its running bitrate broke an abort rule.
+    """
+    if job.pruned:
+        return job
+    if job.done("encoded"):
+        print(f"[RESUME] encoded: {job.outfile}.mkv")  # noqa: T201
+        return job
+
+    _load_base_probe(job)
+    __single_pass: bool = getattr(args, "single_pass", False) is True and supports_single_pass(
+        job.encode,
+    )
+    try:
+        with _reference(job, encode=True) as __encode_cfg:
+            if _chunked(job, args):
+                job.encode_rep = encode_video_chunked(
+                    encode_cfg=__encode_cfg,
+                    chunks=getattr(args, "encode_chunks", 1),
+                    ffmpeg_threads=getattr(args, "ffmpeg_threads", 4),
+                    position=slot.position,
+                    on_stdout=job.abort_rules.bitrate_watcher(),
+                )
+            else:
+                job.encode_rep = encode_video(
+                    encode_cfg=__encode_cfg,
+                    ffmpeg_threads=getattr(args, "ffmpeg_threads", 4),
+                    position=slot.position,
+                    vmaf_cpu_count=(
+                        (_vmaf_cpu_count(slot, args) or cpu_count()) if __single_pass else None
+                    ),
+                    on_stdout=job.abort_rules.bitrate_watcher(),
+                    encoder_threads=_encoder_threads(args),
+                )
+    except JobPrunedError as err:
+        _prune(job, err)
+        return job
+    if __single_pass:
+        job.encode_rep["single_pass"] = True
+    job.mark("encoded", artifact=f"{job.outfile}.mkv", **job.encode_rep)
+    _hash_output(job)
+    if __single_pass:
+        # エンコード時間に VMAF の計算時間も含まれる
+        job.vmaf_rsp = {
+            "commandline": job.encode_rep["commandline"],
+            "elapsed_time": 0.0,
+        }
+        job.mark("scored", artifact=f"{job.outfile}_vmaf.json", **job.vmaf_rsp)
+    return job
+
+
+def _chunked(job: EncodeJob, args: object) -> bool:
+    """Check whether a job is encoded in chunks (``--encode-chunks``).
+
+    Args:
+        job: Encode job.
+        args: Command line arguments.
+
+    Returns:
+        True for software codec jobs that keep the frames of the reference and
+        are not scored in the same pass.
+    """
+    return (
+        getattr(args, "encode_chunks", 1) > 1
+        and job.encode["codec"] in SOFTWARE_CODECS
+        and supports_chunking(job.encode)
+        and not (getattr(args, "single_pass", False) is True and supports_single_pass(job.encode))
+    )
+
+
+def encode_batch_key(job: EncodeJob, args: object) -> tuple[str, str, str] | None:
+    """Get the key of the jobs that can be encoded in one FFmpeg run.
+
+    Args:
+        job: Encode job.
+        args: Command line arguments.
+
+    Returns:
+        Reference, infile option and hardware acceleration options of a
+        software codec job, or None if the job is encoded on its own (hardware
+        codecs, software codecs scored in the same pass with ``--single-pass``,
+        chunked encodes and jobs with a bitrate abort rule).
+    """
+    if (
+        job.encode["codec"] not in SOFTWARE_CODECS
+        or (getattr(args, "single_pass", False) is True and supports_single_pass(job.encode))
+        or _chunked(job, args)
+        or job.abort_rules.max_bitrate_kbs is not None
+    ):
+        return None
+    return (
+        job.encode["infile"]["filename"],
+        job.encode["infile"]["option"],
+        job.encode["hwaccels"],
+    )
+
+
+def stage_encode_batch(jobs: list[EncodeJob], slot: JobSlot, args: object) -> list[EncodeJob]:
+    """Encode stage running several jobs with the same ``encode_batch_key`` in one FFmpeg.
+
+    Args:
+        jobs: Encode jobs sharing the reference, infile option and hwaccels.
+        slot: Resources granted to the stage.
+        args: Command line arguments.
+
+    Returns:
+        The jobs with ``encode_rep`` and ``hash`` set.
+    """
+    __todo: list[EncodeJob] = [__job for __job in jobs if not __job.done("encoded")]
+    if len(__todo) <= 1:
+        return [stage_encode(__job, slot, args) for __job in jobs]
+
+    for __job in __todo:
+        _load_base_probe(__job)
+    # 入力の設定は共通なので、最初のジョブのメザニンを全員で読む
+    with _reference(__todo[0], encode=True) as __reference_cfg:
+        __reps = encode_videos(
+            encode_cfgs=[
+                {**__job.encode, "infile": __reference_cfg["infile"]} for __job in __todo
+            ],
+            ffmpeg_threads=getattr(args, "ffmpeg_threads", 4),
+            position=slot.position,
+            encoder_threads=_encoder_threads(args),
+        )
+    for __job, __rep in zip(__todo, __reps, strict=True):
+        __job.encode_rep = __rep
+        __job.mark("encoded", artifact=f"{__job.outfile}.mkv", **__job.encode_rep)
+        _hash_output(__job)
+    for __job in jobs:
+        if __job not in __todo:
+            print(f"[RESUME] encoded: {__job.outfile}.mkv")  # noqa: T201
+    return jobs
+
+
+def stage_probe(job: EncodeJob, slot: JobSlot, args: object) -> EncodeJob:
+    """Probe stage: probe the encoded output.
+
+    The output is normally hashed by the encode stage; it is only hashed here
+    when a resumed job was encoded but not hashed.
+
+    Args:
+        job: Encode job.
+        slot: Resources granted to the stage.
+        args: Command line arguments.
+
+    Returns:
+        The job with ``probe_rep`` and ``hash`` set.
+    """
+    if job.pruned:
+        return job
+    if job.done("probed"):
+        print(f"[RESUME] probed: {job.outfile}_ffprobe.json")  # noqa: T201
+    else:
+        __base_probe_log = _load_base_probe(job)
+        job.probe_rep = probe_video(
+            encode_cfg=job.encode,
+            probe_timeout=int(float(__base_probe_log["format"]["duration"]) * 1.2),
+            position=slot.position,
+            fast=getattr(args, "fast_probe", False),
+        )
+        job.mark("probed", artifact=f"{job.outfile}_ffprobe.json", **job.probe_rep)
+
+    _hash_output(job)
+    return job
+
+
+def stage_vmaf(job: EncodeJob, slot: JobSlot, args: object) -> EncodeJob:
+    """VMAF stage.
+
+    With ``--vmaf-chunks`` the frame ranges of the encode are scored in
+    concurrent processes and their logs merged. With a VMAF abort rule the
+    first ``after`` seconds are scored and checked before the rest.
+
+    Args:
+        job: Encode job.
+        slot: Resources granted to the stage.
+        args: Command line arguments.
+
+    Returns:
+        The job with ``vmaf_rsp`` set, or pruned if its first seconds broke an
+        abort rule.
+    """
+    if job.pruned:
+        return job
+    if job.done("scored"):
+        print(f"[RESUME] scored: {job.outfile}_vmaf.json")  # noqa: T201
+        return job
+
+    __frames: int = int(job.probe_rep.get("stream", {}).get("frames", {}).get("total", 0))
+    __rules = job.abort_rules
+    __head: int = (
+        __rules.vmaf_head(__frames, float(_load_base_probe(job)["format"]["duration"]))
+        if __rules.min_vmaf is not None
+        else 0
+    )
+    try:
+        with _reference(job, encode=False) as __encode_cfg:
+            job.vmaf_rsp = getvmaf(
+                encode_cfg=__encode_cfg,
+                cpu_count=_vmaf_cpu_count(slot, args),
+                position=slot.position,
+                chunks=getattr(args, "vmaf_chunks", 1),
+                frames=__frames,
+                head=__head,
+                check=__rules.check_vmaf,
+            )
+    except JobPrunedError as err:
+        _prune(job, err)
+        return job
+    job.mark("scored", artifact=f"{job.outfile}_vmaf.json", **job.vmaf_rsp)
+    return job
+
+
+def stage_vmaf_batch(jobs: list[EncodeJob], slot: JobSlot, args: object) -> list[EncodeJob]:
+    """VMAF stage scoring several jobs of the same reference in one FFmpeg run.
+
+    Args:
+        jobs: Encode jobs sharing the same reference.
+        slot: Resources granted to the stage.
+        args: Command line arguments.
+
+    Returns:
+        The jobs with ``vmaf_rsp`` set.
+    """
+    # VMAF の abort ルールがあるジョブは先頭を判定するため 1 ジョブずつ計測する
+    __todo: list[EncodeJob] = [
+        __job
+        for __job in jobs
+        if not __job.done("scored") and not __job.pruned and __job.abort_rules.min_vmaf is None
+    ]
+    if len(__todo) <= 1:
+        return [stage_vmaf(__job, slot, args) for __job in jobs]
+
+    # リファレンスは共通なので、最初のジョブのフレーム/メザニンを全員で読む
+    with _reference(__todo[0], encode=False) as __reference_cfg:
+        __rsps = getvmaf_batch(
+            encode_cfgs=[
+                {**__job.encode, "infile": __reference_cfg["infile"]} for __job in __todo
+            ],
+            cpu_count=_vmaf_cpu_count(slot, args),
+            position=slot.position,
+        )
+    for __job, __rsp in zip(__todo, __rsps, strict=True):
+        __job.vmaf_rsp = __rsp
+        __job.mark("scored", artifact=f"{__job.outfile}_vmaf.json", **__job.vmaf_rsp)
+    for __job in jobs:
+        if __job not in __todo:
+            stage_vmaf(__job, slot, args)
+    return jobs
+
+
+def _encode_speed(job: EncodeJob, duration: float) -> dict[str, Any]:
+    """Get the encode speed of a job.
+
+    Args:
+        job: Encode job.
+        duration: Duration of the output in seconds.
+
+    Returns:
+        ``fps`` and ``speed`` of the encode. A single-pass encode was scored in
+        the same run, so its time includes libvmaf: the speed is not reported
+        (None) and ``includes_vmaf`` is set instead.
+    """
+    if job.encode_rep.get("single_pass"):
+        return {"fps": None, "speed": None, "includes_vmaf": True}
+    return {
+        "fps": int(job.probe_rep["stream"]["frames"]["total"]) / job.encode_rep["elapsed_time"],
+        "speed": duration / job.encode_rep["elapsed_time"],
+    }
+
+
+def _chunk_results(job: EncodeJob, duration: float) -> dict[str, Any]:
+    """Get the encode results specific to a chunked encode.
+
+    Args:
+        job: Encode job.
+        duration: Duration of the output in seconds.
+
+    Returns:
+        Number of chunks and the speed measured on the CPU time summed over
+        the chunks, or an empty dictionary for an unchunked encode.
+    """
+    if not job.encode_rep.get("cpu_time"):
+        return {}
+    return {
+        "chunks": job.encode_rep["chunks"],
+        "cpu_second": job.encode_rep["cpu_time"],
+        "cpu_speed": duration / job.encode_rep["cpu_time"],
+    }
+
+
+def stage_result(job: EncodeJob, slot: JobSlot, args: object) -> EncodeJob:  # noqa: ARG001
+    """Result stage: merge probe and VMAF logs into the job and drop the output.
+
+    Args:
+        job: Encode job.
+        slot: Resources granted to the stage.
+        args: Command line arguments.
+
+    Returns:
+        The job with its encode configuration updated.
+    """
+    __encode: dict[str, Any] = job.encode
+    if job.pruned:
+        # 途中で止めた出力は残さず、部分的な統計だけを記録する
+        if getattr(args, "dist_save_video", False) is False:
+            Path(f"{job.outfile}.mkv").unlink(missing_ok=True)
+        return job
+    __base_probe_log = _load_base_probe(job)
+
+    __budget: int = getattr(args, "dist_budget", 0)
+    if getattr(args, "dist_save_video", False) is False and __budget > 0 and job.hash:
+        # 予算内で出力を残し、古いものから削除する (再 probe / 再計測用)
+        with OutputStore(budget=__budget, root=OUTPUT_STORE_DIR) as store:
+            __stored = store.put(Path(f"{job.outfile}.mkv"), job.hash)
+        print(f"[STORE ] {job.outfile}.mkv -> {__stored}")  # noqa: T201
+    elif getattr(args, "dist_save_video", False) is False:
+        Path(f"{job.outfile}.mkv").unlink(missing_ok=True)
+        print(f"Automatically delete: {job.outfile}.mkv")  # noqa: T201
+
+    """Load ffproble."""
+    with Path(f"{job.outfile}_ffprobe.json").open("r") as file:
+        __probe_log = json.load(file)
+
+    """Load VMAF."""
+    with Path(f"{job.outfile}_vmaf.json").open("r") as file:
+        __vmaf_log = json.load(file)
+
+    """Write parameters."""
+    __encode["infile"].update(
+        {
+            "duration": float(__base_probe_log["format"]["duration"]),
+            "size_kbyte": (
+                int(
+                    __base_probe_log["format"]["size"],
+                )
+                / 1024
+            ),
+        },
+    )
+    __encode["outfile"].update(
+        {
+            "bit_rate_kbs": float(
+                (int(__probe_log["format"]["bit_rate"]) / 1024),
+            ),
+            "duration": float(
+                __probe_log["format"]["duration"],
+            ),
+            "hash": job.hash,
+            "size_kbyte": (
+                int(
+                    __probe_log["format"]["size"],
+                )
+                / 1024
+            ),
+            "stream": job.probe_rep["stream"],
+        },
+    )
+    __encode.update(
+        {
+            "commandline": job.encode_rep["commandline"],
+            "results": {
+                "encode": {
+                    "second": job.encode_rep["elapsed_time"],
+                    "time": strftime(
+                        "%H:%M:%S",
+                        gmtime(job.encode_rep["elapsed_time"]),
+                    ),
+                    **_encode_speed(job, float(__probe_log["format"]["duration"])),
+                    **_chunk_results(job, float(__probe_log["format"]["duration"])),
+                },
+                "compression_ratio_persent": (
+                    1
+                    - (
+                        float(__probe_log["format"]["size"])
+                        / float(__base_probe_log["format"]["size"])
+                    )
+                ),
+                "probe": {
+                    "second": job.probe_rep["elapsed_prbt"],
+                    "time": strftime(
+                        "%H:%M:%S",
+                        gmtime(job.encode_rep["elapsed_time"]),
+                    ),
+                },
+                "vmaf": {
+                    "second": job.vmaf_rsp["elapsed_time"],
+                    "time": strftime(
+                        "%H:%M:%S",
+                        gmtime(job.vmaf_rsp["elapsed_time"]),
+                    ),
+                    "version": __vmaf_log["version"],
+                    "commandline": job.vmaf_rsp["commandline"],
+                    "pooled_metrics": {
+                        "float_ssim": __vmaf_log["pooled_metrics"]["float_ssim"],
+                        "vmaf": __vmaf_log["pooled_metrics"]["vmaf"],
+                    },
+                },
+            },
+        },
+    )
+
+    return job
+
+
+def stage_all(
+    job: EncodeJob,
+    slot: JobSlot,
+    args: object,
+    *,
+    batched: bool = False,
+) -> EncodeJob:
+    """Run encode, probe, VMAF and result stages back-to-back.
+
+    Used when the pipeline is not split into stages.
+
+    Args:
+        job: Encode job.
+        slot: Resources granted to the job.
+        args: Command line arguments.
+        batched: Stop after the probe stage, leaving VMAF and result to the
+            batched stages that follow.
+
+    Returns:
+        The finished (or probed) job.
+    """
+    __stages = (stage_encode, stage_probe, stage_vmaf, stage_result)
+    for __stage in __stages[:2] if batched else __stages:
+        job = __stage(job, slot, args)
+    return job
@@ -0,0 +1,371 @@
+#!/usr/bin/env python3
+# To add a new cell, type '# %%'
+# To add a new markdown cell, type '# %% [markdown]'
+# %%
+"""Reference mezzanines decoded once per host for FFmpeg video quality evaluations."""
+
+from collections import Counter
+from collections.abc import Iterator
+from contextlib import contextmanager
+from fractions import Fraction
+from pathlib import Path
+import re
+import subprocess
+import threading
+from typing import Any
+
+from ffvqe.data.output_store import OutputStore
+from ffvqe.encoding.encoder import tqdm
+from ffvqe.encoding.reference_probe import ReferenceProbes
+from ffvqe.encoding.runner import run_process
+from ffvqe.utils.cache import cache_dir
+
+# tmpfs holding the mezzanines; falls back to the cache directory without /dev/shm
+SHM_DIR: Path = Path("/dev/shm")  # noqa: S108
+
+# Expected size of FFV1 relative to raw video, used to make room before decoding
+FFV1_SIZE_RATIO: float = 0.6
+
+# Chroma samples per luma sample of each chroma subsampling of a pixel format
+CHROMA_SAMPLES: dict[str, float] = {
+    "444": 2.0,
+    "422": 1.0,
+    "440": 1.0,
+    "420": 0.5,
+    "411": 0.5,
+    "410": 0.25,
+}
+
+
+def mezzanine_dir() -> Path:
+    """Get the default directory of the mezzanines.
+
+    Returns:
+        ``/dev/shm/ffvqe-mezzanine`` if tmpfs is available, otherwise
+        ``mezzanine`` in the cache directory.
+    """
+    if SHM_DIR.is_dir():
+        return SHM_DIR / "ffvqe-mezzanine"
+    return cache_dir() / "mezzanine"
+
+
+def supports_mezzanine(encode_cfg: dict[str, Any]) -> bool:
+    """Check whether a job's encode can read the reference from its mezzanine.
+
+    Jobs that decode the reference in hardware (``-hwaccel qsv -c:v mpeg2_qsv``)
+    keep reading the original file. libvmaf always decodes the reference in
+    software, so every VMAF run can use the mezzanine.
+
+    Args:
+        encode_cfg: Dictionary containing encoding configuration.
+
+    Returns:
+        True if the reference is decoded in software with default options.
+    """
+    return bool(encode_cfg["hwaccels"] == "" and encode_cfg["infile"]["option"] == "")
+
+
+def raw_frame_size(stream: dict[str, Any]) -> int:
+    """Get the size of one decoded frame of a video stream.
+
+    The size is computed from the ``pix_fmt`` of the stream: its chroma
+    subsampling (4:2:0 for semi-planar formats such as ``nv12`` / ``p010le``),
+    an alpha plane and 2 bytes per sample above 8 bits, as the frames are
+    stored in raw video.
+
+    Args:
+        stream: FFprobe stream entry of the video stream.
+
+    Returns:
+        Size in bytes.
+
+    Raises:
+        KeyError: If the stream lacks its width or height.
+        ValueError: If the width or height is not a number.
+    """
+    __pix_fmt: str = stream.get("pix_fmt", "yuv420p")
+    __depth = re.search(r"(\d+)(?:le|be)$", __pix_fmt)
+    __sample: int = 2 if __depth is not None and int(__depth.group(1)) > 8 else 1  # noqa: PLR2004
+    if __pix_fmt.startswith("gray"):
+        __planes: float = 1.0
+    else:
+        __subsampling = re.search(r"4[1-4][0-4]", __pix_fmt)
+        __planes = 1.0 + CHROMA_SAMPLES.get(
+            __subsampling.group(0) if __subsampling is not None else "420",
+            0.5,
+        )
+        if __pix_fmt.startswith("yuva"):
+            __planes += 1.0
+    return int(int(stream["width"]) * int(stream["height"]) * __planes * __sample)
+
+
+class TmpfsReservations:
+    """Sizes of the files being decoded into the tmpfs shared by the stores.
+
+    The mezzanines and the shared reference frames are decoded into the same
+    tmpfs (``/dev/shm``). A file being decoded only counts against the free
+    space for what it has written so far, so each store registers the expected
+    size of its partial files here, and both subtract the part that is still
+    to be written from the free space before decoding.
+    """
+
+    def __init__(self) -> None:
+        """Initialize the reservations."""
+        self._lock = threading.Lock()
+        self._files: dict[Path, int] = {}
+
+    @contextmanager
+    def writing(self, path: Path, size: int) -> Iterator[None]:
+        """Reserve the expected size of a file while it is written.
+
+        Args:
+            path: Path of the partial file.
+            size: Expected size of the file in bytes.
+
+        Yields:
+            None.
+        """
+        with self._lock:
+            self._files[path] = size
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._files.pop(path, None)
+
+    def pending(self, exclude: Path | None = None) -> int:
+        """Get the number of reserved bytes not written yet.
+
+        Args:
+            exclude: Partial file left out, usually the caller's own.
+
+        Returns:
+            Bytes still to be written by the partial files.
+        """
+        with self._lock:
+            __files: list[tuple[Path, int]] = list(self._files.items())
+        __pending: int = 0
+        for __path, __size in __files:
+            if __path == exclude:
+                continue
+            try:
+                __written: int = __path.stat().st_size
+            except OSError:
+                __written = 0
+            __pending += max(0, __size - __written)
+        return __pending
+
+
+def _estimate_size(probe: dict[str, Any]) -> int:
+    """Estimate the size of the mezzanine of a reference from its FFprobe log.
+
+    Args:
+        probe: FFprobe log of the reference.
+
+    Returns:
+        Expected size in bytes, or 0 if the log lacks the video stream.
+    """
+    for stream in probe.get("streams", []):
+        if stream.get("codec_type") != "video":
+            continue
+        try:
+            __fps = Fraction(stream.get("avg_frame_rate", "0/1"))
+            __frames = float(probe["format"]["duration"]) * __fps
+            __frame_size = raw_frame_size(stream)
+        except (KeyError, ValueError, ZeroDivisionError):
+            return 0
+        return int(__frames * __frame_size * FFV1_SIZE_RATIO)
+    return 0
+
+
+def _build_mezzanine_command(basefile: str, dest: Path, threads: int) -> list[str]:
+    """Build the FFmpeg command decoding a reference into an FFV1 mezzanine.
+
+    The default streams are kept as in the reference, with the audio copied,
+    so encodes from the mezzanine produce the same streams as from the source.
+
+    Args:
+        basefile: Path of the reference file.
+        dest: Path of the mezzanine.
+        threads: Number of FFmpeg threads.
+
+    Returns:
+        List of command arguments for FFmpeg.
+    """
+    return [
+        "ffmpeg",
+        "-y",
+        "-threads",
+        f"{threads}",
+        "-i",
+        basefile,
+        "-c:v",
+        "ffv1",
+        "-level",
+        "3",
+        "-g",
+        "1",
+        "-slices",
+        "16",
+        "-threads",
+        f"{threads}",
+        "-c:a",
+        "copy",
+        "-sn",
+        "-dn",
+        f"{dest}",
+    ]
+
+
+class Mezzanines:
+    """Lossless FFV1 copies of the references, decoded once and shared by all jobs.
+
+    MPEG-2 references are decoded once into an FFV1 Matroska file keyed by
+    their basehash, in a store (``OutputStore``) on tmpfs that is capped by a
+    byte budget and by the free memory. Before a reference is decoded, the
+    least recently used mezzanines that are not being read are evicted to make
+    room for its estimated size, leaving the free space still reserved by
+    files being decoded (``TmpfsReservations``, shared with ``SharedFrames``).
+    A reference whose mezzanine does not fit, or fails to decode, is read from
+    the original file.
+    """
+
+    def __init__(  # noqa: PLR0913
+        self,
+        probes: ReferenceProbes,
+        budget: int,
+        *,
+        root: Path | None = None,
+        threads: int = 4,
+        position: int = 0,
+        reservations: TmpfsReservations | None = None,
+    ) -> None:
+        """Initialize the mezzanines of a run.
+
+        Args:
+            probes: Reference probes of the run, holding the basehashes.
+            budget: Maximum total size of the mezzanines in bytes.
+            root: Directory of the mezzanines. Defaults to ``mezzanine_dir()``.
+            threads: Number of FFmpeg threads used to decode a reference.
+            position: tqdm bar position.
+            reservations: Reservations of the files being decoded into the same
+                tmpfs, shared with the other stores of the run.
+        """
+        self.probes = probes
+        self.budget = budget
+        self.root = root if root is not None else mezzanine_dir()
+        self.threads = threads
+        self.position = position
+        self.reservations = reservations if reservations is not None else TmpfsReservations()
+        self._lock = threading.Lock()
+        self._decoding: dict[str, threading.Lock] = {}
+        self._failed: set[str] = set()
+        # 読み込み中のメザニンは削除しない
+        self._in_use: Counter[str] = Counter()
+
+    def _store(self) -> OutputStore:
+        return OutputStore(budget=self.budget, root=self.root, suffix=".mkv")
+
+    def _decode(self, basefile: str, basehash: str, store: OutputStore) -> Path | None:
+        """Decode a reference into the store.
+
+        Args:
+            basefile: Path of the reference file.
+            basehash: SHA-256 of the reference file.
+            store: Store of the mezzanines.
+
+        Returns:
+            Path of the mezzanine, or None if it does not fit or failed. References
+            that can never be decoded are not tried again in this run.
+        """
+        __size: int = _estimate_size(self.probes.get(basefile))
+        with self._lock:
+            __keep = set(self._in_use) - {basehash}
+            if __size > self.budget:
+                self._failed.add(basehash)
+        __partial: Path = self.root / f".{basehash}.partial.mkv"
+        with self.reservations.writing(__partial, __size):
+            # 同じ tmpfs にデコード中の他のファイル (共有フレームを含む) の残りを空けておく
+            __pending: int = self.reservations.pending(__partial)
+            if not store.reserve(__size, keep=__keep, pending=__pending):
+                # 使用中のメザニンで埋まっている場合は、後のジョブで再試行する
+                print(f"[MEZZ  ] does not fit in the budget: {basefile}")  # noqa: T201
+                return None
+            __cmd = _build_mezzanine_command(basefile, __partial, self.threads)
+            try:
+                with tqdm(desc=f"[MEZZ  ] {basefile}", total=100, position=self.position) as pbar:
+                    run_process(__cmd, progress=lambda percent: pbar.update(percent - pbar.n))
+            except (subprocess.CalledProcessError, OSError) as err:
+                __partial.unlink(missing_ok=True)
+                with self._lock:
+                    self._failed.add(basehash)
+                print(f"[MEZZ  ] decode failed, using the reference: {basefile}: {err}")  # noqa: T201
+                return None
+            return store.put(__partial, basehash)
+
+    def acquire(self, basefile: str) -> str | None:
+        """Get the mezzanine of a reference, decoding it on first use.
+
+        Every successful call must be paired with ``release``.
+
+        Args:
+            basefile: Path of the reference file.
+
+        Returns:
+            Path of the mezzanine, or None to read the original file.
+        """
+        __basehash: str = self.probes.basehashes.get(basefile, "")
+        if not __basehash or self.budget <= 0:
+            return None
+
+        with self._lock:
+            if __basehash in self._failed:
+                return None
+            __decoding = self._decoding.setdefault(__basehash, threading.Lock())
+            # 他のリファレンスのデコードで削除されないよう、先に使用中にする
+            self._in_use[__basehash] += 1
+
+        # 同じリファレンスのデコードは 1 回だけ (他のジョブは完了を待つ)
+        try:
+            with __decoding, self._store() as store:
+                __path = store.get(__basehash) or self._decode(basefile, __basehash, store)
+        except BaseException:
+            self.release(basefile)
+            raise
+        if __path is None:
+            self.release(basefile)
+            return None
+        return f"{__path}"
+
+    def release(self, basefile: str) -> None:
+        """Allow the mezzanine of a reference to be evicted again.
+
+        Args:
+            basefile: Path of the reference file.
+        """
+        __basehash: str = self.probes.basehashes.get(basefile, "")
+        with self._lock:
+            self._in_use[__basehash] -= 1
+            if self._in_use[__basehash] <= 0:
+                del self._in_use[__basehash]
+
+    @contextmanager
+    def reference(self, encode_cfg: dict[str, Any]) -> Iterator[dict[str, Any]]:
+        """Provide an encode configuration whose reference is the mezzanine.
+
+        Args:
+            encode_cfg: Dictionary containing encoding configuration.
+
+        Yields:
+            A copy of ``encode_cfg`` reading the mezzanine, or ``encode_cfg``
+            itself if the reference has no mezzanine.
+        """
+        __basefile: str = encode_cfg["infile"]["filename"]
+        __path = self.acquire(__basefile)
+        if __path is None:
+            yield encode_cfg
+            return
+        try:
+            yield {**encode_cfg, "infile": {**encode_cfg["infile"], "filename": __path}}
+        finally:
+            self.release(__basefile)
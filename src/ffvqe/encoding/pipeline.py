@@ -0,0 +1,321 @@
+#!/usr/bin/env python3
+# To add a new cell, type '# %%'
+# To add a new markdown cell, type '# %% [markdown]'
+# %%
+"""Staged job pipeline for FFmpeg video quality evaluations."""
+
+from collections.abc import Callable
+from collections.abc import Hashable
+from collections.abc import Iterable
+from collections.abc import Iterator
+from concurrent.futures import FIRST_COMPLETED
+from concurrent.futures import Future
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import wait
+from queue import SimpleQueue
+import threading
+import time
+from typing import Any
+from typing import Generic
+from typing import TypeVar
+
+from ffvqe.encoding.scheduler import CoreBudget
+from ffvqe.encoding.scheduler import JobSlot
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+
+class Stage(Generic[T]):
+    """A pipeline stage with its own bounded concurrency."""
+
+    def __init__(
+        self,
+        name: str,
+        func: Callable[[T, JobSlot], T],
+        workers: int = 1,
+        cores: int = 1,
+    ) -> None:
+        """Initialize the stage.
+
+        Args:
+            name: Stage name used in progress reports.
+            func: Callable run on a worker thread for each job; returns the job.
+            workers: Maximum number of jobs processed by this stage at once.
+            cores: Number of CPU cores each running job of this stage keeps busy.
+        """
+        self.name = name
+        self.func = func
+        self.workers = max(1, workers)
+        self.cores = max(0, cores)
+        self.running: int = 0
+        self.seconds: list[float] = []
+        self._positions: SimpleQueue[int] = SimpleQueue()
+        self._lock = threading.Lock()
+
+    def mean_seconds(self) -> float:
+        """Get the mean time a job spent in this stage.
+
+        Returns:
+            Mean seconds per job, or 0.0 if no job has finished this stage yet.
+        """
+        with self._lock:
+            return sum(self.seconds) / len(self.seconds) if self.seconds else 0.0
+
+    def assign_positions(self, first: int) -> int:
+        """Reserve tqdm bar positions for the stage workers.
+
+        Args:
+            first: First free bar position.
+
+        Returns:
+            Next free bar position after this stage's workers.
+        """
+        for position in range(first, first + self.workers):
+            self._positions.put(position)
+        return first + self.workers
+
+    def run(self, job: T, budget: CoreBudget) -> T:
+        """Run the stage function for one job on the calling worker thread.
+
+        Args:
+            job: Job to process.
+            budget: Core budget to reserve the stage cores from.
+
+        Returns:
+            The job returned by the stage function.
+        """
+        return self._run(lambda slot: self.func(job, slot), budget, jobs=1)
+
+    def _run(self, call: Callable[[JobSlot], R], budget: CoreBudget, jobs: int) -> R:
+        """Run ``call`` with a bar position and reserved cores, timing it per job."""
+        position = self._positions.get()
+        try:
+            with budget.reserve(self.cores) as cores:
+                with self._lock:
+                    self.running += 1
+                start = time.time()
+                try:
+                    return call(JobSlot(cores=cores, position=position))
+                finally:
+                    with self._lock:
+                        self.running -= 1
+                        self.seconds.append((time.time() - start) / jobs)
+        finally:
+            self._positions.put(position)
+
+
+class BatchStage(Stage[T]):
+    """A pipeline stage that processes jobs sharing a key together.
+
+    Jobs entering the stage are held until ``batch`` jobs with the same key
+    have arrived, then passed to the batch function in one call. Partial
+    batches are flushed as soon as no earlier stage can produce another job.
+    Jobs whose key is None are passed on their own without being held.
+    """
+
+    def __init__(  # noqa: PLR0913
+        self,
+        name: str,
+        func: Callable[[list[T], JobSlot], list[T]],
+        *,
+        key: Callable[[T], Hashable | None],
+        batch: int,
+        workers: int = 1,
+        cores: int = 1,
+    ) -> None:
+        """Initialize the stage.
+
+        Args:
+            name: Stage name used in progress reports.
+            func: Callable run on a worker thread for each batch; returns the jobs.
+            key: Callable giving the key of the jobs that may be batched together.
+            batch: Maximum number of jobs per batch.
+            workers: Maximum number of batches processed by this stage at once.
+            cores: Number of CPU cores each running batch of this stage keeps busy.
+        """
+        super().__init__(name, lambda job, slot: func([job], slot)[0], workers, cores)
+        self.batch_func = func
+        self.key = key
+        self.batch = max(1, batch)
+
+    def run_batch(self, jobs: list[T], budget: CoreBudget) -> list[T]:
+        """Run the batch function for jobs sharing a key on the calling worker thread.
+
+        Args:
+            jobs: Jobs to process.
+            budget: Core budget to reserve the stage cores from.
+
+        Returns:
+            The jobs returned by the batch function.
+        """
+        return self._run(lambda slot: self.batch_func(jobs, slot), budget, jobs=len(jobs))
+
+
+class Pipeline(Generic[T]):
+    """Run jobs through a sequence of stages, each with its own worker pool.
+
+    A job enters the next stage as soon as it leaves the previous one, so e.g. job
+    N+1 is encoded while job N is scored. All stages share one core budget. The
+    number of jobs admitted but not yet finished is bounded by the total number of
+    stage workers (times the batch size of batch stages), which keeps the amount of
+    intermediate output on disk bounded.
+    Finished jobs are yielded on the calling thread.
+    """
+
+    def __init__(self, stages: list[Stage[T]], budget: CoreBudget) -> None:
+        """Initialize the pipeline.
+
+        Args:
+            stages: Stages in execution order.
+            budget: Core budget shared by all stages.
+        """
+        self.stages = stages
+        self.budget = budget
+        # バッチを揃えるために待っているジョブも数える
+        self.max_in_flight: int = sum(
+            stage.workers * (stage.batch if isinstance(stage, BatchStage) else 1)
+            for stage in stages
+        )
+        self._last_finish: float = 0.0
+        self.lap: float = 0.0
+        # バッチステージごとに、キー別の揃うのを待っているジョブ
+        self._held: dict[int, dict[Hashable, list[T]]] = {}
+
+        # tqdm の表示位置がステージ間で重ならないように割り当てる
+        position = 1
+        for stage in stages:
+            position = stage.assign_positions(position)
+
+    def status(self) -> str:
+        """Describe how many jobs each stage is currently running.
+
+        Returns:
+            Status string such as ``encode 2/2, vmaf 1/1``.
+        """
+        return ", ".join(f"{stage.name} {stage.running}/{stage.workers}" for stage in self.stages)
+
+    def eta(self, remaining: int) -> float:
+        """Estimate the time needed to finish the remaining jobs.
+
+        With overlapping stages the throughput is bounded by the slowest stage,
+        so the estimate uses the largest per-worker mean stage time.
+
+        Args:
+            remaining: Number of jobs still to finish.
+
+        Returns:
+            Estimated seconds, or 0.0 while no stage timings are known.
+        """
+        bottleneck = max(
+            (stage.mean_seconds() / stage.workers for stage in self.stages),
+            default=0.0,
+        )
+        return bottleneck * remaining
+
+    def _submit(
+        self,
+        pools: list[ThreadPoolExecutor],
+        pending: dict[Future[Any], int],
+        index: int,
+        job: T,
+    ) -> None:
+        stage = self.stages[index]
+        if not isinstance(stage, BatchStage):
+            pending[pools[index].submit(stage.run, job, self.budget)] = index
+            return
+
+        key = stage.key(job)
+        if key is None:
+            pending[pools[index].submit(stage.run_batch, [job], self.budget)] = index
+            return
+
+        held = self._held[index].setdefault(key, [])
+        held.append(job)
+        if len(held) >= stage.batch:
+            del self._held[index][key]
+            pending[pools[index].submit(stage.run_batch, held, self.budget)] = index
+
+    def _flush(
+        self,
+        pools: list[ThreadPoolExecutor],
+        pending: dict[Future[Any], int],
+        *,
+        exhausted: bool,
+    ) -> None:
+        """Submit the partial batches that can no longer grow.
+
+        Called once the pipeline is full or all jobs are admitted. A batch can
+        still grow while an earlier stage is running, or while a later stage
+        will finish a job and let another job be admitted.
+        """
+        for index, held in self._held.items():
+            stage = self.stages[index]
+            if (
+                not isinstance(stage, BatchStage)
+                or any(i < index for i in pending.values())
+                or (pending and not exhausted)
+            ):
+                continue
+            for jobs in held.values():
+                pending[pools[index].submit(stage.run_batch, jobs, self.budget)] = index
+            held.clear()
+
+    def run(self, jobs: Iterable[T]) -> Iterator[T]:
+        """Run every job through all stages and yield jobs as they finish.
+
+        Jobs are pulled from ``jobs`` lazily. If a stage raises, or the consumer
+        stops iterating, jobs that have not started a stage are cancelled and
+        running stage functions are waited for.
+
+        Args:
+            jobs: Jobs to run.
+
+        Yields:
+            Jobs returned by the last stage, in completion order.
+        """
+        pools = [
+            ThreadPoolExecutor(max_workers=stage.workers, thread_name_prefix=f"ffvqe-{stage.name}")
+            for stage in self.stages
+        ]
+        pending: dict[Future[Any], int] = {}
+        self._held = {
+            index: {} for index, stage in enumerate(self.stages) if isinstance(stage, BatchStage)
+        }
+        jobs_iter = iter(jobs)
+        exhausted = False
+        in_flight = 0
+        self._last_finish = time.time()
+        try:
+            while True:
+                while not exhausted and in_flight < self.max_in_flight:
+                    try:
+                        job = next(jobs_iter)
+                    except StopIteration:
+                        exhausted = True
+                        break
+                    self._submit(pools, pending, 0, job)
+                    in_flight += 1
+
+                self._flush(pools, pending, exhausted=exhausted)
+                if not pending:
+                    break
+
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    index = pending.pop(future)
+                    result = future.result()
+                    for job in result if isinstance(self.stages[index], BatchStage) else [result]:
+                        if index + 1 < len(self.stages):
+                            self._submit(pools, pending, index + 1, job)
+                            continue
+
+                        in_flight -= 1
+                        now = time.time()
+                        self.lap, self._last_finish = now - self._last_finish, now
+                        yield job
+        finally:
+            for future in pending:
+                future.cancel()
+            for pool in pools:
+                pool.shutdown(wait=True, cancel_futures=True)
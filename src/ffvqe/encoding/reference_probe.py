@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+# To add a new cell, type '# %%'
+# To add a new markdown cell, type '# %% [markdown]'
+# %%
+"""Content-addressed cache of reference probes for FFmpeg video quality evaluations."""
+
+from collections.abc import Mapping
+import json
+from pathlib import Path
+import threading
+from typing import Any
+
+from ffvqe.utils.cache import JsonCache
+
+# Cache table holding FFprobe logs of references keyed by their SHA-256 (basehash)
+PROBE_TABLE: str = "reference_probe"
+
+
+def probe_file(basefile: str) -> Path:
+    """Get the path of the FFprobe log written next to a reference.
+
+    Args:
+        basefile: Path of the reference file.
+
+    Returns:
+        Path of ``*_ffprobe.json``.
+    """
+    return Path(f"{basefile}".replace(Path(basefile).suffix, "_ffprobe.json", 1))
+
+
+def cached_probe(basehash: str) -> dict[str, Any] | None:
+    """Look up the FFprobe log of a reference by its content.
+
+    Args:
+        basehash: SHA-256 of the reference file.
+
+    Returns:
+        The FFprobe log, or None if the reference has not been probed yet.
+    """
+    __cache = JsonCache(PROBE_TABLE)
+    try:
+        __probe: dict[str, Any] | None = __cache.get(basehash)
+    finally:
+        __cache.close()
+    return __probe
+
+
+def cache_probe(basehash: str, probe: dict[str, Any]) -> None:
+    """Remember the FFprobe log of a reference by its content.
+
+    Args:
+        basehash: SHA-256 of the reference file.
+        probe: FFprobe log of the reference.
+    """
+    __cache = JsonCache(PROBE_TABLE)
+    try:
+        __cache.put(basehash, probe)
+    finally:
+        __cache.close()
+
+
+def restore_probe(basefile: str, basehash: str) -> bool:
+    """Write ``*_ffprobe.json`` of a reference from the cache instead of probing it.
+
+    The same reference may live under another path in another configuration,
+    so the file name in the cached log is replaced with ``basefile``.
+
+    Args:
+        basefile: Path of the reference file.
+        basehash: Verified SHA-256 of the reference file.
+
+    Returns:
+        True if the log was restored, False if it is not cached.
+    """
+    __probe = cached_probe(basehash)
+    if __probe is None:
+        return False
+
+    if isinstance(__probe.get("format"), dict):
+        __probe["format"]["filename"] = f"{basefile}"
+    with probe_file(basefile).open("w") as file:
+        json.dump(__probe, file, indent=2)
+    return True
+
+
+class ReferenceProbes:
+    """FFprobe logs of the references, parsed once per run.
+
+    A log is looked up in the content-addressed cache by the basehash of the
+    reference, so it is shared by every configuration that uses the same
+    reference, wherever the file lives. References without a known basehash
+    (or not cached yet) are read from ``*_ffprobe.json`` and then cached.
+    """
+
+    def __init__(self, basehashes: Mapping[str, str] | None = None) -> None:
+        """Initialize the memo.
+
+        Args:
+            basehashes: Basehash of each reference keyed by its ``basefile``.
+        """
+        self.basehashes: dict[str, str] = dict(basehashes or {})
+        self._probes: dict[str, dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, basefile: str) -> dict[str, Any]:
+        """Get the FFprobe log of a reference.
+
+        Args:
+            basefile: Path of the reference file.
+
+        Returns:
+            The FFprobe log. The same object is returned to every caller, so it
+            must not be modified.
+        """
+        __basehash: str = self.basehashes.get(basefile, "")
+        __key: str = __basehash or f"{Path(basefile).resolve()}"
+        with self._lock:
+            if (__probe := self._probes.get(__key)) is not None:
+                return __probe
+
+            __probe = cached_probe(__basehash) if __basehash else None
+            if __probe is None:
+                with probe_file(basefile).open("r") as file:
+                    __probe = json.load(file)
+                if __basehash:
+                    cache_probe(__basehash, __probe)
+
+            self._probes[__key] = __probe
+            return __probe
@@ -0,0 +1,277 @@
+#!/usr/bin/env python3
+# To add a new cell, type '# %%'
+# To add a new markdown cell, type '# %% [markdown]'
+# %%
+"""Asyncio subprocess runner for FFmpeg video quality evaluations."""
+
+import asyncio
+from collections import deque
+from collections.abc import Callable
+from collections.abc import Mapping
+from collections.abc import Sequence
+import re
+import subprocess
+import time
+from typing import Any
+
+# Number of stderr lines kept for error reports
+STDERR_TAIL_LINES: int = 50
+
+# Seconds to wait for a process to exit after SIGTERM before it is killed
+TERMINATE_GRACE_SECONDS: float = 5.0
+
+DURATION_REGEX = re.compile(rb"Duration: (\d+):(\d{2}):(\d{2}(?:\.\d+)?)")
+
+
+class ProcessResult:
+    """Outcome of a finished process."""
+
+    def __init__(
+        self,
+        args: list[str],
+        returncode: int,
+        stdout: bytes,
+        stderr: str,
+        elapsed_time: float,
+    ) -> None:
+        """Initialize the result.
+
+        Args:
+            args: Command that was run (including any added progress options).
+            returncode: Exit status of the process.
+            stdout: Captured standard output, or empty if it was not captured.
+            stderr: Last lines of the standard error output.
+            elapsed_time: Wall-clock seconds from start to exit.
+        """
+        self.args = args
+        self.returncode = returncode
+        self.stdout = stdout
+        self.stderr = stderr
+        self.elapsed_time = elapsed_time
+
+
+class _OutputReader:
+    """Drain the pipes of a process, parsing FFmpeg ``-progress`` output on the way."""
+
+    def __init__(
+        self,
+        progress: Callable[[float], None] | None,
+        duration: float | None,
+        *,
+        capture_stdout: bool,
+        on_stdout: Callable[[bytes], None] | None = None,
+        on_stderr: Callable[[bytes], None] | None = None,
+    ) -> None:
+        self.progress = progress
+        self.duration = duration
+        self.on_stdout = on_stdout
+        self.on_stderr = on_stderr
+        self.capture_stdout = capture_stdout
+        self.stdout: list[bytes] = []
+        self.stderr: deque[str] = deque(maxlen=STDERR_TAIL_LINES)
+        self._fixed = duration is not None
+
+    def _percent(self, line: bytes) -> float | None:
+        """Get the progress percentage reported by a ``-progress`` line, if any."""
+        key, _, value = line.strip().partition(b"=")
+        if key == b"progress" and value == b"end":
+            return 100.0
+        if key != b"out_time_us" or not value.isdigit() or not self.duration:
+            return None
+        return min(max(int(value) / 1_000_000 / self.duration * 100, 0.0), 100.0)
+
+    async def read_stdout(self, stream: asyncio.StreamReader) -> None:
+        """Read the standard output until EOF."""
+        if self.progress is None and self.on_stdout is None:
+            self.stdout.append(await stream.read())
+            return
+        async for line in stream:
+            if self.capture_stdout:
+                self.stdout.append(line)
+            if self.on_stdout is not None:
+                self.on_stdout(line)
+            if self.progress is not None and (percent := self._percent(line)) is not None:
+                self.progress(percent)
+
+    async def read_stderr(self, stream: asyncio.StreamReader) -> None:
+        """Read the standard error until EOF, picking up input durations."""
+        async for line in stream:
+            if self.on_stderr is not None:
+                self.on_stderr(line)
+            self.stderr.append(line.decode(errors="replace").rstrip())
+            if self._fixed or (match := DURATION_REGEX.search(line)) is None:
+                continue
+            hours, minutes, seconds = match.groups()
+            # 複数入力の場合は最も長い入力を全体の長さとする
+            self.duration = max(
+                self.duration or 0.0,
+                int(hours) * 3600 + int(minutes) * 60 + float(seconds),
+            )
+
+
+async def _terminate(process: asyncio.subprocess.Process) -> None:
+    """Stop a process, escalating from SIGTERM to SIGKILL."""
+    if process.returncode is not None:
+        return
+    try:
+        process.terminate()
+        try:
+            await asyncio.wait_for(process.wait(), TERMINATE_GRACE_SECONDS)
+        except TimeoutError:
+            process.kill()
+            await process.wait()
+    except ProcessLookupError:
+        pass
+
+
+async def run_process_async(  # noqa: PLR0913
+    args: Sequence[str],
+    *,
+    timeout: float | None = None,
+    env: Mapping[str, str] | None = None,
+    progress: Callable[[float], None] | None = None,
+    duration: float | None = None,
+    capture_stdout: bool = False,
+    on_stdout: Callable[[bytes], None] | None = None,
+    on_stderr: Callable[[bytes], None] | None = None,
+    check: bool = True,
+) -> ProcessResult:
+    """Run a process and wait for it without polling.
+
+    With ``progress`` the command is treated as an FFmpeg command: ``-progress
+    pipe:1 -nostats`` is added and the callback receives the completion
+    percentage whenever FFmpeg reports its output time. The total duration is
+    taken from ``duration`` or, if not given, from the longest input in the
+    FFmpeg banner.
+
+    If the timeout expires or the awaiting task is cancelled, the process is
+    terminated (and killed if it does not exit) before the error propagates.
+
+    Args:
+        args: Command to run.
+        timeout: Seconds to wait for the process, or None to wait forever.
+        env: Environment of the process. Defaults to the current environment.
+        progress: Callback receiving the progress percentage (FFmpeg only).
+        duration: Total output duration in seconds used for the percentage.
+        capture_stdout: Whether to capture the standard output.
+        on_stdout: Callback receiving every raw line of the standard output, which
+            is streamed instead of being buffered.
+        on_stderr: Callback receiving every raw line of the standard error output.
+        check: Whether to raise if the process exits with a non-zero status.
+
+    Returns:
+        Result of the finished process.
+
+    Raises:
+        subprocess.TimeoutExpired: If the process did not finish within ``timeout``.
+        subprocess.CalledProcessError: If ``check`` is set and the process failed.
+    """
+    cmd = list(args)
+    if progress is not None:
+        cmd[1:1] = ["-progress", "pipe:1", "-nostats"]
+    reader = _OutputReader(
+        progress,
+        duration,
+        capture_stdout=capture_stdout,
+        on_stdout=on_stdout,
+        on_stderr=on_stderr,
+    )
+
+    start_time = time.monotonic()
+    process = await asyncio.create_subprocess_exec(
+        *cmd,
+        stdin=subprocess.DEVNULL,
+        stdout=(
+            subprocess.PIPE
+            if capture_stdout or progress is not None or on_stdout is not None
+            else subprocess.DEVNULL
+        ),
+        stderr=subprocess.PIPE,
+        env=None if env is None else dict(env),
+    )
+    readers: list[Any] = [process.wait()]
+    if process.stdout is not None:
+        readers.append(reader.read_stdout(process.stdout))
+    if process.stderr is not None:
+        readers.append(reader.read_stderr(process.stderr))
+
+    try:
+        await asyncio.wait_for(asyncio.gather(*readers), timeout)
+    except TimeoutError:
+        await _terminate(process)
+        raise subprocess.TimeoutExpired(
+            cmd,
+            timeout or 0.0,
+            stderr="\n".join(reader.stderr),
+        ) from None
+    except BaseException:
+        # キャンセル (Ctrl+C を含む) 時にプロセスを残さない
+        await _terminate(process)
+        raise
+
+    result = ProcessResult(
+        args=cmd,
+        returncode=process.returncode if process.returncode is not None else -1,
+        stdout=b"".join(reader.stdout),
+        stderr="\n".join(reader.stderr),
+        elapsed_time=time.monotonic() - start_time,
+    )
+    if check and result.returncode != 0:
+        raise subprocess.CalledProcessError(
+            result.returncode,
+            cmd,
+            output=result.stdout,
+            stderr=result.stderr,
+        )
+    return result
+
+
+def run_process(args: Sequence[str], **kwargs: Any) -> ProcessResult:  # noqa: ANN401
+    """Run a process to completion from synchronous code.
+
+    Each call runs its own event loop, so it may be used from any worker thread.
+
+    Args:
+        args: Command to run.
+        **kwargs: Keyword arguments of ``run_process_async``.
+
+    Returns:
+        Result of the finished process.
+    """
+    return asyncio.run(run_process_async(args, **kwargs))
+
+
+def run_processes(
+    commands: Sequence[Sequence[str]],
+    per_command: Sequence[Mapping[str, Any]] | None = None,
+    **kwargs: Any,  # noqa: ANN401
+) -> list[ProcessResult]:
+    """Run several processes concurrently and wait for all of them.
+
+    If one process fails, the others are cancelled (and terminated).
+
+    Args:
+        commands: Commands to run.
+        per_command: Keyword arguments of ``run_process_async`` for each command
+            (e.g. its own ``progress`` callback), in the order of ``commands``.
+        **kwargs: Keyword arguments of ``run_process_async`` applied to every command.
+
+    Returns:
+        Results in the order of ``commands``.
+    """
+    command_kwargs: Sequence[Mapping[str, Any]] = per_command or [{}] * len(commands)
+
+    async def _run_all() -> list[ProcessResult]:
+        tasks = [
+            asyncio.ensure_future(run_process_async(cmd, **kwargs, **own))
+            for cmd, own in zip(commands, command_kwargs, strict=True)
+        ]
+        try:
+            return list(await asyncio.gather(*tasks))
+        finally:
+            # 1 つが失敗したら残りのプロセスも終了させる
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    return asyncio.run(_run_all())
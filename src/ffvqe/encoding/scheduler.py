@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+# To add a new cell, type '# %%'
+# To add a new markdown cell, type '# %% [markdown]'
+# %%
+"""Concurrent job scheduling for FFmpeg video quality evaluations."""
+
+from collections.abc import Iterator
+from contextlib import contextmanager
+from os import cpu_count
+import threading
+
+
+class CoreBudget:
+    """Counting allocator that hands out CPU cores to concurrently running jobs.
+
+    A job asks for the number of cores it is going to keep busy (e.g. ``-threads``)
+    and blocks until that many cores are free. Requests larger than the whole
+    budget are clamped so that a single job can always run, and jobs that need no
+    cores (e.g. pure file I/O) never wait.
+    """
+
+    def __init__(self, total: int | None = None) -> None:
+        """Initialize the budget.
+
+        Args:
+            total: Number of cores that may be handed out. Defaults to ``os.cpu_count()``.
+        """
+        self.total: int = max(1, total if total is not None else (cpu_count() or 1))
+        self._free: int = self.total
+        self._cond = threading.Condition()
+
+    def acquire(self, cores: int) -> int:
+        """Block until ``cores`` cores are available and take them.
+
+        Args:
+            cores: Number of cores requested.
+
+        Returns:
+            Number of cores actually granted.
+        """
+        granted = max(0, min(cores, self.total))
+        if granted == 0:
+            return 0
+        with self._cond:
+            self._cond.wait_for(lambda: self._free >= granted)
+            self._free -= granted
+        return granted
+
+    def release(self, cores: int) -> None:
+        """Give cores back to the budget.
+
+        Args:
+            cores: Number of cores previously granted by ``acquire``.
+        """
+        if cores == 0:
+            return
+        with self._cond:
+            self._free += cores
+            self._cond.notify_all()
+
+    @contextmanager
+    def reserve(self, cores: int) -> Iterator[int]:
+        """Hold cores for the duration of a ``with`` block.
+
+        Args:
+            cores: Number of cores requested.
+
+        Yields:
+            Number of cores granted.
+        """
+        granted = self.acquire(cores)
+        try:
+            yield granted
+        finally:
+            self.release(granted)
+
+
+class JobSlot:
+    """Resources granted to a running job."""
+
+    def __init__(self, cores: int, position: int) -> None:
+        """Initialize the slot.
+
+        Args:
+            cores: Number of CPU cores the job may use.
+            position: tqdm bar position reserved for the job.
+        """
+        self.cores = cores
+        self.position = position
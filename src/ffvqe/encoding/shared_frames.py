@@ -0,0 +1,296 @@
+#!/usr/bin/env python3
+# To add a new cell, type '# %%'
+# To add a new markdown cell, type '# %% [markdown]'
+# %%
+"""Decoded reference frames shared by concurrent VMAF jobs."""
+
+from collections import Counter
+from collections.abc import Iterator
+from contextlib import contextmanager
+from fractions import Fraction
+from pathlib import Path
+import shutil
+import subprocess
+import threading
+from typing import Any
+
+from ffvqe.encoding.encoder import tqdm
+from ffvqe.encoding.mezzanine import SHM_DIR
+from ffvqe.encoding.mezzanine import TmpfsReservations
+from ffvqe.encoding.mezzanine import raw_frame_size
+from ffvqe.encoding.reference_probe import ReferenceProbes
+from ffvqe.encoding.runner import run_process
+from ffvqe.utils.cache import cache_dir
+
+
+def frames_dir() -> Path:
+    """Get the default directory of the shared reference frames.
+
+    Returns:
+        ``/dev/shm/ffvqe-frames`` if tmpfs is available, otherwise ``frames``
+        in the cache directory.
+    """
+    if SHM_DIR.is_dir():
+        return SHM_DIR / "ffvqe-frames"
+    return cache_dir() / "frames"
+
+
+def _raw_size(probe: dict[str, Any]) -> int:
+    """Get the size of the decoded frames of a reference from its FFprobe log.
+
+    Args:
+        probe: FFprobe log of the reference.
+
+    Returns:
+        Size in bytes of the frames in the ``pix_fmt`` of the stream (see
+        ``raw_frame_size``), or 0 if the log lacks the video stream.
+    """
+    for stream in probe.get("streams", []):
+        if stream.get("codec_type") != "video":
+            continue
+        try:
+            __frames = float(probe["format"]["duration"]) * Fraction(stream["avg_frame_rate"])
+            return int(__frames * raw_frame_size(stream))
+        except (KeyError, ValueError, ZeroDivisionError):
+            return 0
+    return 0
+
+
+def _build_frames_command(basefile: str, dest: Path, threads: int) -> list[str]:
+    """Build the FFmpeg command decoding the video of a reference into a Y4M file.
+
+    Args:
+        basefile: Path of the reference file.
+        dest: Path of the Y4M file.
+        threads: Number of FFmpeg threads.
+
+    Returns:
+        List of command arguments for FFmpeg.
+    """
+    return [
+        "ffmpeg",
+        "-y",
+        "-threads",
+        f"{threads}",
+        "-i",
+        basefile,
+        "-map",
+        "0:v:0",
+        "-strict",
+        "-1",
+        "-f",
+        "yuv4mpegpipe",
+        f"{dest}",
+    ]
+
+
+class SharedFrames:
+    """Reference frames decoded once into tmpfs and read by every VMAF job.
+
+    The first VMAF job of a reference decodes its video into a raw Y4M file on
+    tmpfs. Concurrent FFmpeg processes reading the file share its pages in
+    memory instead of each decoding and holding the reference frames; they
+    only pay for reading raw frames.
+
+    The file is reference counted: ``expect`` registers a job that will score
+    against the reference and ``done`` unregisters it, so the file lives from
+    the first VMAF run of the reference until its last job has finished. The
+    total size of the files alive at once is capped by a byte budget and by
+    the free memory, less the space still reserved by files being decoded
+    into the same tmpfs (``TmpfsReservations``, shared with ``Mezzanines``);
+    references that do not fit are read as before.
+    """
+
+    def __init__(  # noqa: PLR0913
+        self,
+        probes: ReferenceProbes,
+        budget: int,
+        *,
+        root: Path | None = None,
+        threads: int = 4,
+        position: int = 0,
+        reservations: TmpfsReservations | None = None,
+    ) -> None:
+        """Initialize the shared frames of a run.
+
+        Args:
+            probes: Reference probes of the run, holding the basehashes.
+            budget: Maximum total size of the decoded frames in bytes.
+            root: Directory of the frames. Defaults to ``frames_dir()``.
+            threads: Number of FFmpeg threads used to decode a reference.
+            position: tqdm bar position.
+            reservations: Reservations of the files being decoded into the same
+                tmpfs, shared with the other stores of the run.
+        """
+        self.probes = probes
+        self.budget = budget
+        self.root = root if root is not None else frames_dir()
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.threads = threads
+        self.position = position
+        self.reservations = reservations if reservations is not None else TmpfsReservations()
+        self._lock = threading.Lock()
+        self._decoding: dict[str, threading.Lock] = {}
+        self._failed: set[str] = set()
+        # ジョブ数 (expect/done) と実行中の VMAF 数 (acquire/release) で参照を数える
+        self._expected: Counter[str] = Counter()
+        self._active: Counter[str] = Counter()
+        self._sizes: dict[str, int] = {}
+
+    def path(self, basefile: str) -> Path:
+        """Get the location of the frames of a reference.
+
+        Args:
+            basefile: Path of the reference file.
+
+        Returns:
+            Path of the Y4M file (it may not exist).
+        """
+        return self.root / f"{self.probes.basehashes.get(basefile, '')}.y4m"
+
+    def expect(self, basefile: str) -> None:
+        """Register a job that will score against a reference.
+
+        Args:
+            basefile: Path of the reference file.
+        """
+        with self._lock:
+            self._expected[basefile] += 1
+
+    def done(self, basefile: str) -> None:
+        """Unregister a finished job, dropping the frames after the last one.
+
+        Args:
+            basefile: Path of the reference file.
+        """
+        with self._lock:
+            self._expected[basefile] -= 1
+            self._drop_unused(basefile)
+
+    def _drop_unused(self, basefile: str) -> None:
+        """Remove the frames of a reference no job needs anymore (lock held)."""
+        if self._expected[basefile] > 0 or self._active[basefile] > 0:
+            return
+        self._expected.pop(basefile, None)
+        self._active.pop(basefile, None)
+        if self._sizes.pop(basefile, None) is not None:
+            self.path(basefile).unlink(missing_ok=True)
+            print(f"[FRAMES] drop: {basefile}")  # noqa: T201
+
+    def _fits(self, basefile: str) -> bool:
+        """Check whether the frames of a reference fit in the budget (lock held)."""
+        __size: int = _raw_size(self.probes.get(basefile))
+        __used: int = sum(self._sizes.values())
+        # 空き容量から、同じ tmpfs にデコード中のファイル (メザニンを含む) の残りを除く
+        __free: int = shutil.disk_usage(self.root).free - self.reservations.pending()
+        __limit: int = min(self.budget, __used + __free)
+        if __size > self.budget:
+            self._failed.add(basefile)
+        return 0 < __size <= __limit - __used
+
+    def _decode(self, basefile: str) -> bool:
+        """Decode the frames of a reference.
+
+        Args:
+            basefile: Path of the reference file.
+
+        Returns:
+            True if the frames were decoded.
+        """
+        __dest: Path = self.path(basefile)
+        __partial: Path = __dest.with_name(f".{__dest.name}.partial")
+        __cmd = _build_frames_command(basefile, __partial, self.threads)
+        try:
+            with (
+                self.reservations.writing(__partial, _raw_size(self.probes.get(basefile))),
+                tqdm(desc=f"[FRAMES] {basefile}", total=100, position=self.position) as pbar,
+            ):
+                run_process(__cmd, progress=lambda percent: pbar.update(percent - pbar.n))
+            __partial.replace(__dest)
+        except (subprocess.CalledProcessError, OSError) as err:
+            __partial.unlink(missing_ok=True)
+            print(f"[FRAMES] decode failed, using the reference: {basefile}: {err}")  # noqa: T201
+            with self._lock:
+                self._failed.add(basefile)
+                self._sizes.pop(basefile, None)
+            return False
+
+        with self._lock:
+            self._sizes[basefile] = __dest.stat().st_size
+        return True
+
+    def acquire(self, basefile: str) -> str | None:
+        """Get the decoded frames of a reference, decoding them on first use.
+
+        Every successful call must be paired with ``release``.
+
+        Args:
+            basefile: Path of the reference file.
+
+        Returns:
+            Path of the Y4M file, or None to decode the reference as before.
+        """
+        if not self.probes.basehashes.get(basefile) or self.budget <= 0:
+            return None
+
+        with self._lock:
+            if basefile in self._failed:
+                return None
+            __decoding = self._decoding.setdefault(basefile, threading.Lock())
+            self._active[basefile] += 1
+
+        # 同じリファレンスのデコードは 1 回だけ (他のジョブは完了を待つ)
+        try:
+            with __decoding:
+                with self._lock:
+                    __decoded: bool = basefile in self._sizes
+                    __fits: bool = __decoded or self._fits(basefile)
+                    if __fits and not __decoded:
+                        # デコード中も予算に含める
+                        self._sizes[basefile] = _raw_size(self.probes.get(basefile))
+                __ok: bool = __fits and (__decoded or self._decode(basefile))
+        except BaseException:
+            self.release(basefile)
+            raise
+        if not __ok:
+            self.release(basefile)
+            return None
+        return f"{self.path(basefile)}"
+
+    def release(self, basefile: str) -> None:
+        """Finish reading the frames of a reference.
+
+        Args:
+            basefile: Path of the reference file.
+        """
+        with self._lock:
+            self._active[basefile] -= 1
+            self._drop_unused(basefile)
+
+    @contextmanager
+    def reference(self, encode_cfg: dict[str, Any]) -> Iterator[dict[str, Any]]:
+        """Provide an encode configuration whose reference is the decoded frames.
+
+        Args:
+            encode_cfg: Dictionary containing encoding configuration.
+
+        Yields:
+            A copy of ``encode_cfg`` reading the frames, or ``encode_cfg`` itself
+            if the reference has no shared frames.
+        """
+        __basefile: str = encode_cfg["infile"]["filename"]
+        __path = self.acquire(__basefile)
+        if __path is None:
+            yield encode_cfg
+            return
+        try:
+            yield {**encode_cfg, "infile": {**encode_cfg["infile"], "filename": __path}}
+        finally:
+            self.release(__basefile)
+
+    def close(self) -> None:
+        """Remove all decoded frames (at the end of the run, including on errors)."""
+        with self._lock:
+            for __basefile in list(self._sizes):
+                self.path(__basefile).unlink(missing_ok=True)
+            self._sizes.clear()
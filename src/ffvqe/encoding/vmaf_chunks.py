@@ -0,0 +1,309 @@
+#!/usr/bin/env python3
+# To add a new cell, type '# %%'
+# To add a new markdown cell, type '# %% [markdown]'
+# %%
+"""Chunk-parallel VMAF with merged per-frame logs for FFmpeg video quality evaluations."""
+
+from collections.abc import Callable
+from itertools import pairwise
+import json
+from pathlib import Path
+from typing import Any
+
+from ffvqe.encoding.chunked import _probe_frames
+from ffvqe.encoding.chunked import reference_frames
+from ffvqe.encoding.encoder import VMAF_FRAME_RATE
+from ffvqe.encoding.encoder import _build_libvmaf_filter
+from ffvqe.encoding.encoder import tqdm
+from ffvqe.encoding.runner import run_processes
+from ffvqe.utils.time_format import format_seconds
+
+# Frames scored on both sides of a chunk and dropped from its log. The motion
+# feature of a frame depends on its neighbours, so boundary frames need them.
+OVERLAP_FRAMES: int = 2
+
+# Keys of a range's VMAF log that do not describe the merged log
+RANGE_LOG_KEYS: tuple[str, ...] = ("fps", "aggregate_metrics")
+
+
+def plan_ranges(frames: int, chunks: int) -> list[tuple[int, int]]:
+    """Split the frames of an encode into equal ranges.
+
+    Args:
+        frames: Number of frames.
+        chunks: Wanted number of ranges.
+
+    Returns:
+        First and end (exclusive) frame numbers of each non-empty range.
+    """
+    __bounds: list[int] = [frames * __chunk // chunks for __chunk in range(chunks + 1)]
+    return [(__first, __last) for __first, __last in pairwise(__bounds) if __first < __last]
+
+
+def _seek_time(pts: list[float], frame: int) -> float:
+    """Get the input seek position starting at a frame.
+
+    Args:
+        pts: Display timestamps of the input, as returned by ``reference_frames``.
+        frame: Frame number (greater than 0).
+
+    Returns:
+        Time in seconds from the start of the file halfway between the frame
+        and the previous one, so that exact seeking starts at the frame.
+    """
+    if frame >= len(pts):
+        # 入力の最後のフレームより後で、比較するフレームは無い
+        return pts[-1] + 1.0 if pts else 0.0
+    return (pts[frame - 1] + pts[frame]) / 2
+
+
+def _build_chunk_command(
+    encode_cfg: dict[str, Any],
+    scored: tuple[int, int],
+    log_path: Path,
+    cpu_count: int,
+    seek: tuple[float, float] | None = None,
+) -> list[str]:
+    """Build the FFmpeg command scoring a frame range of an encode.
+
+    Both inputs are seeked to the first frame of the range, so each process
+    only decodes its own frames, and the frames are numbered from there as
+    ``-r`` on the inputs of ``getvmaf`` does.
+
+    Args:
+        encode_cfg: Dictionary containing encoding configuration.
+        scored: First and end (exclusive) frame numbers scored, overlap included.
+        log_path: Path of the VMAF log of the range.
+        cpu_count: Number of threads for libvmaf.
+        seek: Seek positions of the first frame in the encoded video and in the
+            reference (see ``_seek_time``), or None for a range starting at 0.
+
+    Returns:
+        List of command arguments for FFmpeg.
+    """
+    __cmd: list[str] = ["ffmpeg"]
+    for __seek, __input in zip(
+        seek or (0.0, 0.0),
+        (f"{encode_cfg['outfile']['filename']}.mkv", f"{encode_cfg['infile']['filename']}"),
+        strict=True,
+    ):
+        if __seek > 0:
+            __cmd.extend(["-ss", f"{__seek:.6f}"])
+        __cmd.extend(["-i", __input])
+    return [
+        *__cmd,
+        "-lavfi",
+        _build_libvmaf_filter(
+            encode_cfg,
+            cpu_count,
+            "0:v",
+            "1:v",
+            frames=(0, scored[1] - scored[0]),
+            log_path=f"{log_path}",
+            rate=VMAF_FRAME_RATE,
+        ),
+        "-an",
+        "-f",
+        "null",
+        "-",
+    ]
+
+
+def pool_metrics(frames: list[dict[str, Any]]) -> dict[str, dict[str, float]]:
+    """Pool per-frame scores as libvmaf does.
+
+    Args:
+        frames: ``frames`` of a VMAF log.
+
+    Returns:
+        ``pooled_metrics``: min, max, mean and harmonic mean of every metric,
+        rounded to the precision of the libvmaf log.
+    """
+    __scores: dict[str, list[float]] = {}
+    for __frame in frames:
+        for __name, __score in __frame["metrics"].items():
+            __scores.setdefault(__name, []).append(float(__score))
+
+    # libvmaf の harmonic_mean は n / sum(1 / (x + 1)) - 1
+    return {
+        __name: {
+            "min": round(min(__values), 6),
+            "max": round(max(__values), 6),
+            "mean": round(sum(__values) / len(__values), 6),
+            "harmonic_mean": round(
+                len(__values) / sum(1.0 / (__value + 1.0) for __value in __values) - 1.0,
+                6,
+            ),
+        }
+        for __name, __values in __scores.items()
+    }
+
+
+def merge_logs(
+    logs: list[dict[str, Any]],
+    ranges: list[tuple[int, int]],
+    scored: list[tuple[int, int]],
+) -> dict[str, Any]:
+    """Merge the VMAF logs of frame ranges into the log of the whole encode.
+
+    The overlap frames are dropped, the remaining frames are renumbered and the
+    pooled metrics are computed again from all frames. Values of a single range
+    (``RANGE_LOG_KEYS``) are dropped.
+
+    Args:
+        logs: VMAF log of each range.
+        ranges: Frames kept from each range.
+        scored: Frames scored in each range, overlap included.
+
+    Returns:
+        Merged VMAF log.
+    """
+    __frames: list[dict[str, Any]] = []
+    for __log, (__first, __last), (__start, _) in zip(logs, ranges, scored, strict=True):
+        __frames.extend(
+            {**__frame, "frameNum": __start + __frame["frameNum"]}
+            for __frame in __log["frames"]
+            if __first <= __start + __frame["frameNum"] < __last
+        )
+    return {
+        # fps などは範囲ごとの値なので、全体のログには含めない
+        **{__key: __value for __key, __value in logs[0].items() if __key not in RANGE_LOG_KEYS},
+        "frames": __frames,
+        "pooled_metrics": pool_metrics(__frames),
+    }
+
+
+def _load_log(path: Path) -> dict[str, Any]:
+    """Load a VMAF log.
+
+    Args:
+        path: Path of the log.
+
+    Returns:
+        VMAF log.
+    """
+    with path.open("r") as file:
+        return dict(json.load(file))
+
+
+def getvmaf_chunked(  # noqa: PLR0913
+    encode_cfg: dict[str, Any],
+    frames: int,
+    chunks: int,
+    cpu_count: int | None = None,
+    position: int = 1,
+    *,
+    head: int = 0,
+    check: Callable[[dict[str, Any]], None] | None = None,
+) -> dict[str, Any]:
+    """Calculate VMAF with frame ranges scored in concurrent processes.
+
+    Each range is cut from both inputs by seeking to its first frame (found
+    from the packet timestamps of each input) and trimming its number of
+    frames, so the merged ``_vmaf.json`` holds the same frames as a
+    single-process run and its pooled metrics are computed from them as
+    libvmaf does.
+
+    With ``head`` the first frames are scored first as a range of their own
+    and their merged log is passed to ``check``, which may raise to stop the
+    job before the remaining ranges are scored.
+
+    Args:
+        encode_cfg: Dictionary containing encoding configuration.
+        frames: Number of frames of the encoded video.
+        chunks: Number of ranges (after the ``head`` range).
+        cpu_count: Number of CPU cores shared by the processes.
+        position: tqdm bar position.
+        head: Number of first frames scored before the rest, or 0.
+        check: Callback receiving the VMAF log of the ``head`` frames.
+
+    Returns:
+        Dictionary containing VMAF calculation results, as returned by ``getvmaf``.
+    """
+    __head: int = head if 0 < head < frames else 0
+    __ranges: list[tuple[int, int]] = [(0, __head)] if __head else []
+    __ranges.extend(
+        (__head + __first, __head + __last)
+        for __first, __last in plan_ranges(frames - __head, chunks)
+    )
+    __scored: list[tuple[int, int]] = [
+        (max(0, __first - OVERLAP_FRAMES), min(frames, __last + OVERLAP_FRAMES))
+        for __first, __last in __ranges
+    ]
+    __outfile: str = encode_cfg["outfile"]["filename"]
+    __log_paths: list[Path] = [
+        Path(f"{__outfile}_vmaf.{__index:04}.json") for __index in range(len(__ranges))
+    ]
+    # 先頭の範囲は単独で、残りの範囲は同時に実行するのでスレッドを分け合う
+    __threads: int = max(1, (cpu_count or 1) // max(1, len(__ranges) - bool(__head)))
+    # 各範囲の先頭フレームへシークするため、両方の入力のフレームの時刻を調べる
+    __pts: tuple[list[float], list[float]] = (
+        _probe_frames(f"{__outfile}.mkv")["pts"],
+        reference_frames(encode_cfg["infile"]["filename"])["pts"],
+    )
+    __cmds = [
+        _build_chunk_command(
+            encode_cfg,
+            __range,
+            __path,
+            (cpu_count or 1) if __head and __index == 0 else __threads,
+            (
+                (_seek_time(__pts[0], __range[0]), _seek_time(__pts[1], __range[0]))
+                if __range[0] > 0
+                else None
+            ),
+        )
+        for __index, (__range, __path) in enumerate(zip(__scored, __log_paths, strict=True))
+    ]
+    __percent: list[float] = [0.0] * len(__ranges)
+
+    with tqdm(
+        desc=f"[VMAF  ] {__outfile}_vmaf.json x{len(__ranges)}",
+        total=100,
+        position=position,
+    ) as pbar:
+
+        def __progress(index: int, percent: float) -> None:
+            # 範囲のフレーム数で重み付けした全体の進捗
+            __percent[index] = percent
+            __done = sum(
+                __range_percent * (__last - __first)
+                for __range_percent, (__first, __last) in zip(__percent, __ranges, strict=True)
+            )
+            pbar.update(__done / frames - pbar.n)
+
+        def __score(indexes: range) -> float:
+            __results = run_processes(
+                [__cmds[__index] for __index in indexes],
+                per_command=[
+                    {
+                        "progress": lambda percent, i=__index: __progress(i, percent),
+                        "duration": (__scored[__index][1] - __scored[__index][0])
+                        / VMAF_FRAME_RATE,
+                    }
+                    for __index in indexes
+                ],
+            )
+            return max(__result.elapsed_time for __result in __results)
+
+        try:
+            elapsed_time: float = 0.0
+            if __head:
+                # 先頭の範囲だけを先に計測し、残りを計測する前に判定する
+                elapsed_time += __score(range(1))
+                if check is not None:
+                    check(merge_logs([_load_log(__log_paths[0])], __ranges[:1], __scored[:1]))
+            elapsed_time += __score(range(1 if __head else 0, len(__ranges)))
+            __logs: list[dict[str, Any]] = [_load_log(__path) for __path in __log_paths]
+        finally:
+            for __path in __log_paths:
+                __path.unlink(missing_ok=True)
+
+    with Path(f"{__outfile}_vmaf.json").open("w") as file:
+        json.dump(merge_logs(__logs, __ranges, __scored), file, indent=4)
+
+    print(f"\nelapsed_time: {format_seconds(int(elapsed_time))}\n")  # noqa: T201
+    return {
+        "commandline": " && ".join(" ".join(__cmd) for __cmd in __cmds),
+        "elapsed_time": elapsed_time,
+    }
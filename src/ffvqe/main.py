@@ -5,34 +5,27 @@
 """Main entry point for FFmpeg video quality evaluations."""
 
 import argparse
+from collections.abc import Iterator
+from copy import deepcopy
 from functools import partial
-import json
-from os import fsync
 from pathlib import Path
 import sys
-from time import gmtime
-from time import strftime
+import threading
+from typing import TYPE_CHECKING
 from typing import Any
 
-from tqdm import tqdm as std_tqdm
-
 from ffvqe._version import __version__
-from ffvqe.config.loader import load_config
-from ffvqe.data.archive import archive
-from ffvqe.data.csv_generator import getcsv
-from ffvqe.encoding.encoder import encoding
-from ffvqe.encoding.encoder import getvmaf
-from ffvqe.summary import main as summary_main
-from ffvqe.utils.file_operations import getfilehash
+from ffvqe.data.output_store import parse_size
 from ffvqe.utils.time_format import format_seconds
 
-# tqdmのカスタム設定
-tqdm = partial(
-    std_tqdm,
-    bar_format="{desc:92}{percentage:5.0f}%|{bar:20}{r_bar}",
-    dynamic_ncols=True,
-    ncols=155,
-)
+# Subcommand modules (and duckdb, requests, tqdm, ruamel.yaml through them) are
+# imported on the code path that uses them, so that startup stays fast
+if TYPE_CHECKING:
+    from ffvqe.data.job_store import JobStore
+    from ffvqe.data.result_cache import ResultCache
+    from ffvqe.encoding.jobs import EncodeJob
+    from ffvqe.encoding.pipeline import Pipeline
+    from ffvqe.encoding.shared_frames import SharedFrames
 
 
 def create_argument_parser() -> argparse.ArgumentParser:
@@ -92,11 +85,146 @@ def create_argument_parser() -> argparse.ArgumentParser:
         type=int,
         default=4,
     )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        help="Number of encode jobs to run concurrently (default: 1)",
+        type=int,
+        default=1,
+    )
+    parser.add_argument(
+        "--cpu-budget",
+        help=(
+            "Number of CPU cores shared by concurrent jobs. "
+            "ffmpeg-threads x running jobs stays within it (default: all cores)"
+        ),
+        type=int,
+        default=None,
+    )
+    parser.add_argument(
+        "--pipeline",
+        help=(
+            "Run encode, probe and VMAF as separate stages so that encodes overlap "
+            "with scoring of earlier jobs. --jobs sets the encode workers. (default: False)"
+        ),
+        action="store_true",
+    )
+    parser.add_argument(
+        "--probe-jobs",
+        help="Number of concurrent probe workers with --pipeline (default: 1)",
+        type=int,
+        default=1,
+    )
+    parser.add_argument(
+        "--vmaf-jobs",
+        help="Number of concurrent VMAF workers with --pipeline (default: 1)",
+        type=int,
+        default=1,
+    )
+    parser.add_argument(
+        "--encode-batch",
+        help=(
+            "Encode up to this many software codec jobs sharing the reference, infile "
+            "option and hwaccels in one FFmpeg run that decodes the reference once. "
+            "(default: 1, disabled)"
+        ),
+        type=int,
+        default=1,
+    )
+    parser.add_argument(
+        "--encode-chunks",
+        help=(
+            "Split the reference of software codec jobs at keyframes into this many "
+            "chunks, encode them concurrently with --ffmpeg-threads threads in total and "
+            "join them without re-encoding. (default: 1, disabled)"
+        ),
+        type=int,
+        default=1,
+    )
+    parser.add_argument(
+        "--vmaf-batch",
+        help=(
+            "Score up to this many encodes of the same reference in one FFmpeg run that "
+            "decodes the reference once, queueing the jobs of a reference together. "
+            "(default: 1, disabled)"
+        ),
+        type=int,
+        default=1,
+    )
+    parser.add_argument(
+        "--vmaf-chunks",
+        help=(
+            "Score this many frame ranges of each encode in concurrent FFmpeg processes "
+            "and merge their per-frame scores into one _vmaf.json. (default: 1, disabled)"
+        ),
+        type=int,
+        default=1,
+    )
+    parser.add_argument(
+        "--single-pass",
+        help=(
+            "Encode and score software codec jobs in one FFmpeg pass that decodes the "
+            "reference once (requires FFmpeg 7.1+). (default: False)"
+        ),
+        action="store_true",
+    )
+    parser.add_argument(
+        "--fast-probe",
+        help=(
+            "Count H.264/HEVC frame types from slice headers instead of decoding the "
+            "encoded output; other codecs are still decoded. (default: False)"
+        ),
+        action="store_true",
+    )
     parser.add_argument(
         "--dist-save-video",
         help="Automatically delete transcoded videos in Dist folder. (default: False)",
         action="store_true",
     )
+    parser.add_argument(
+        "--dist-budget",
+        help=(
+            "Keep encoded videos in videos/dist/store up to this size (e.g. 200G), "
+            "removing the least recently used ones. Ignored with --dist-save-video. "
+            "(default: 0, delete every video)"
+        ),
+        type=parse_size,
+        default=0,
+    )
+    parser.add_argument(
+        "--mezzanine-budget",
+        help=(
+            "Decode each reference once into a lossless FFV1 mezzanine on tmpfs "
+            "(/dev/shm) that software decodes and VMAF read instead of the MPEG-2 "
+            "source, using up to this size (e.g. 32G). (default: 0, disabled)"
+        ),
+        type=parse_size,
+        default=0,
+    )
+    parser.add_argument(
+        "--mezzanine-dir",
+        help="Directory of the mezzanines. (default: /dev/shm/ffvqe-mezzanine)",
+        type=str,
+        default=None,
+    )
+    parser.add_argument(
+        "--shared-frames-budget",
+        help=(
+            "Decode each reference once into raw frames on tmpfs (/dev/shm) that "
+            "concurrent VMAF jobs read instead of decoding it again, using up to this "
+            "size (e.g. 48G). (default: 0, disabled)"
+        ),
+        type=parse_size,
+        default=0,
+    )
+    parser.add_argument(
+        "--no-result-cache",
+        help=(
+            "Queue every job instead of reusing results of the same job (same id) "
+            "completed by other config files. (default: False)"
+        ),
+        action="store_true",
+    )
     parser.add_argument(
         "--auto-download-references",
         help="Automatically download reference files without prompting. (default: False)",
@@ -106,166 +234,348 @@ def create_argument_parser() -> argparse.ArgumentParser:
     return parser
 
 
+def _build_pipeline(args: argparse.Namespace) -> "Pipeline[EncodeJob]":
+    """Build the job pipeline from command line arguments.
+
+    Without ``--pipeline`` every job runs encode, probe and VMAF back-to-back on one
+    worker (``--jobs`` workers in total). With ``--pipeline`` each stage gets its
+    own worker pool, so encodes overlap with the probe/VMAF of earlier jobs. With
+    ``--encode-batch`` and ``--vmaf-batch`` the encode and VMAF stages process jobs
+    of the same reference together; ``--encode-batch`` always splits the stages.
+
+    Args:
+        args: Command line arguments.
+
+    Returns:
+        Configured pipeline.
+    """
+    from ffvqe.encoding.jobs import encode_batch_key
+    from ffvqe.encoding.jobs import stage_all
+    from ffvqe.encoding.jobs import stage_encode
+    from ffvqe.encoding.jobs import stage_encode_batch
+    from ffvqe.encoding.jobs import stage_probe
+    from ffvqe.encoding.jobs import stage_result
+    from ffvqe.encoding.jobs import stage_vmaf
+    from ffvqe.encoding.jobs import stage_vmaf_batch
+    from ffvqe.encoding.pipeline import BatchStage
+    from ffvqe.encoding.pipeline import Pipeline
+    from ffvqe.encoding.pipeline import Stage
+    from ffvqe.encoding.scheduler import CoreBudget
+
+    __budget = CoreBudget(args.cpu_budget)
+    __threads: int = max(1, min(args.ffmpeg_threads, __budget.total))
+    __batch: int = getattr(args, "vmaf_batch", 1)
+    __encode_batch: int = getattr(args, "encode_batch", 1)
+    __workers: int = max(1, min(args.jobs, __budget.total // __threads))
+    __vmaf_workers: int = args.vmaf_jobs if args.pipeline else 1
+    __vmaf: Stage[EncodeJob] = (
+        BatchStage(
+            "vmaf",
+            partial(stage_vmaf_batch, args=args),
+            key=lambda job: job.encode["infile"]["filename"],
+            batch=__batch,
+            workers=__vmaf_workers,
+            cores=__threads,
+        )
+        if __batch > 1
+        else Stage("vmaf", partial(stage_vmaf, args=args), workers=__vmaf_workers, cores=__threads)
+    )
+    __result: Stage[EncodeJob] = Stage(
+        "result",
+        partial(stage_result, args=args),
+        workers=1,
+        cores=0,
+    )
+
+    if not args.pipeline and __encode_batch <= 1:
+        if __batch > 1:
+            # エンコードと probe までを各ジョブで行い、VMAF はまとめて計算する
+            return Pipeline(
+                [
+                    Stage(
+                        "job",
+                        partial(stage_all, args=args, batched=True),
+                        workers=__workers,
+                        cores=__threads,
+                    ),
+                    __vmaf,
+                    __result,
+                ],
+                __budget,
+            )
+        return Pipeline(
+            [Stage("job", partial(stage_all, args=args), workers=__workers, cores=__threads)],
+            __budget,
+        )
+
+    __encode: Stage[EncodeJob] = (
+        BatchStage(
+            "encode",
+            partial(stage_encode_batch, args=args),
+            key=partial(encode_batch_key, args=args),
+            batch=__encode_batch,
+            workers=args.jobs if args.pipeline else __workers,
+            cores=__threads,
+        )
+        if __encode_batch > 1
+        else Stage("encode", partial(stage_encode, args=args), workers=args.jobs, cores=__threads)
+    )
+    return Pipeline(
+        [
+            __encode,
+            Stage(
+                "probe",
+                partial(stage_probe, args=args),
+                workers=args.probe_jobs if args.pipeline else 1,
+                cores=1,
+            ),
+            __vmaf,
+            __result,
+        ],
+        __budget,
+    )
+
+
+def _job_seconds(encode: dict[str, Any]) -> float:
+    """Get the total processing time recorded for a finished job.
+
+    Args:
+        encode: Encode configuration including results.
+
+    Returns:
+        Sum of encode, probe and VMAF seconds.
+    """
+    return float(
+        encode["results"]["encode"]["second"]
+        + encode["results"]["probe"]["second"]
+        + encode["results"]["vmaf"]["second"],
+    )
+
+
+def _shared_references(config: dict[str, Any], args: argparse.Namespace) -> dict[str, Any]:
+    """Create the reference caches shared by the jobs of a run.
+
+    Args:
+        config: Configuration dictionary.
+        args: Command line arguments.
+
+    Returns:
+        Keyword arguments of ``EncodeJob``: ``probes``, ``mezzanines`` and
+        ``frames`` (None unless enabled by their budget).
+    """
+    from ffvqe.encoding.mezzanine import Mezzanines
+    from ffvqe.encoding.mezzanine import TmpfsReservations
+    from ffvqe.encoding.reference_probe import ReferenceProbes
+    from ffvqe.encoding.shared_frames import SharedFrames
+
+    # リファレンスの FFprobe ログは basehash ごとに 1 回だけ読み込む
+    __probes = ReferenceProbes(
+        {
+            __ref["basefile"]: __ref["basehash"]
+            for __ref in config["configs"].get("references", [])
+            if "basefile" in __ref and "basehash" in __ref
+        },
+    )
+    # メザニンと共有フレームは同じ tmpfs に書くので、デコード中のサイズを共有する
+    __reservations = TmpfsReservations()
+    # リファレンスのデコードを 1 回にする (--mezzanine-budget 指定時)
+    __mezzanines: Mezzanines | None = None
+    if getattr(args, "mezzanine_budget", 0) > 0:
+        __mezzanines = Mezzanines(
+            __probes,
+            args.mezzanine_budget,
+            root=Path(args.mezzanine_dir) if getattr(args, "mezzanine_dir", None) else None,
+            threads=args.ffmpeg_threads,
+            reservations=__reservations,
+        )
+    # 同時に実行する VMAF でリファレンスのフレームを共有する (--shared-frames-budget 指定時)
+    __frames: SharedFrames | None = None
+    if getattr(args, "shared_frames_budget", 0) > 0:
+        __frames = SharedFrames(
+            __probes,
+            args.shared_frames_budget,
+            threads=args.ffmpeg_threads,
+            reservations=__reservations,
+        )
+
+    return {"probes": __probes, "mezzanines": __mezzanines, "frames": __frames}
+
+
+def _queue_order(encode_cfg: list[dict[str, Any]], args: argparse.Namespace) -> list[int]:
+    """Get the order in which the jobs are queued.
+
+    Args:
+        encode_cfg: Encode configurations of the datafile.
+        args: Command line arguments.
+
+    Returns:
+        Job indexes; with ``--encode-batch`` or ``--vmaf-batch`` the jobs of a
+        reference (and hwaccels and infile option) are queued together so that
+        they can be encoded or scored in one batch.
+    """
+    __order: list[int] = list(range(len(encode_cfg)))
+    if getattr(args, "vmaf_batch", 1) > 1 or getattr(args, "encode_batch", 1) > 1:
+        __order.sort(
+            key=lambda index: (
+                encode_cfg[index]["infile"]["filename"],
+                encode_cfg[index]["hwaccels"],
+                encode_cfg[index]["infile"]["option"],
+            ),
+        )
+    return __order
+
+
+def _print_job_header(pipeline: "Pipeline", count: int, length: int, rapt: float) -> None:
+    """Print the progress of the run before a datafile entry is queued.
+
+    Args:
+        pipeline: Pipeline running the jobs.
+        count: Number of entries queued so far.
+        length: Number of entries of the datafile.
+        rapt: Seconds per finished job.
+    """
+    # ステージが重なるので、最も遅いステージの処理時間から ETA を求める
+    __eta: float = pipeline.eta(length - count) or (
+        rapt * (length - count) / pipeline.max_in_flight
+    )
+    print(  # noqa: T201
+        "=" * 155
+        + f"\n{count + 1:0>4}/{length:0>4} ({(count + 1) / length:>7.2%})\t"
+        + f"Lap time: {format_seconds(int(rapt))} ({int(rapt)}s)\t"
+        + f"ETA: {format_seconds(int(__eta))}\t"
+        + f"Stages: {pipeline.status()}\n",
+    )
+
+
+def _needs_encode(encode: dict[str, Any]) -> bool:
+    """Check whether a datafile entry still has to run, printing its state.
+
+    Args:
+        encode: Encode configuration of a datafile entry.
+
+    Returns:
+        True if the job has no output yet and was not pruned.
+    """
+    # abort ルールで止めたジョブは再実行しない
+    __pruned: bool = "pruned" in encode
+    __encode_exec_flg: bool = encode["outfile"]["hash"] == "" and not __pruned
+    print(f"outfile hash:  {encode['outfile']['hash']}")  # noqa: T201
+    print(f"outfile cache: {not __encode_exec_flg}")  # noqa: T201
+    if __pruned:
+        print(f"outfile pruned: {encode['pruned']}")  # noqa: T201
+    return __encode_exec_flg
+
+
+def _expect_frames(encode_cfg: list[dict[str, Any]], frames: "SharedFrames | None") -> None:
+    """Register the jobs that will score against the shared reference frames.
+
+    Args:
+        encode_cfg: Encode configurations of the datafile.
+        frames: Shared frames of the run, or None.
+    """
+    if frames is None:
+        return
+    # 共有フレームは各リファレンスの最後のジョブが終わるまで残す
+    for __encode in encode_cfg:
+        if __encode["outfile"]["hash"] == "" and "pruned" not in __encode:
+            frames.expect(__encode["infile"]["filename"])
+
+
+def _record_job(
+    job: "EncodeJob",
+    store: "JobStore",
+    results: "ResultCache",
+    shared: dict[str, Any],
+) -> None:
+    """Write a finished job to the job store and share its result.
+
+    Args:
+        job: Finished encode job.
+        store: Job store of the datafile.
+        results: Results of every experiment.
+        shared: Shared reference state of the run (see ``_shared_references``).
+    """
+    __basefile: str = job.encode["infile"]["filename"]
+    store.update(job.index, job.encode)
+    # 他の設定ファイルの同じジョブが流用できるように登録する
+    results.put(shared["probes"].basehashes.get(__basefile, ""), job.encode)
+    if shared["frames"] is not None:
+        shared["frames"].done(__basefile)
+
+
 def main_encode(config: dict[str, Any], args: argparse.Namespace) -> None:
     """Main encoding function.
 
     Processes encoding configurations and executes encoding and VMAF evaluation.
+    Jobs run through a pipeline whose stages share ``--cpu-budget`` cores (see
+    ``_build_pipeline``). Every finished stage is written to the job store as a
+    single-row update, so an interrupted job resumes at its first unfinished
+    stage. Jobs pruned by an abort rule are kept with their partial statistics
+    and not queued again. The JSON datafile is exported from the store when the
+    run ends.
 
     Args:
         config: Configuration dictionary.
         args: Command line arguments.
     """
+    from ffvqe.data.job_store import JobStore
+    from ffvqe.data.result_cache import ResultCache
+    from ffvqe.encoding.jobs import EncodeJob
+
     __datafile: str = config["configs"]["datafile"]
-    with Path(__datafile).open("r") as file:
-        __encode_cfg = json.load(file)
+    __store = JobStore(__datafile)
+    __encode_cfg = __store.load()
 
     __length: int = len(__encode_cfg)
-    __rapt: int = 0
-    for __index, __encode in enumerate(__encode_cfg):
-        print(  # noqa: T201
-            "=" * 155
-            + f"\n{__index + 1:0>4}/{__length:0>4} ({(__index + 1) / __length:>7.2%})\t"
-            + f"Lap time: {format_seconds(int(__rapt))} ({int(__rapt)}s)\t"
-            + f"ETA: {format_seconds(int(__rapt * (__length - __index)))}\n",
-        )
-        __basefile: str = __encode["infile"]["filename"]
-        with Path(f"{__basefile.replace(Path(__basefile).suffix, '_ffprobe.json', 1)}").open(
-            "r",
-        ) as file:
-            __base_probe_log = json.load(file)
-
-        __encode_exec_flg: bool = __encode["outfile"]["hash"] == ""
-        print(f"outfile hash:  {__encode['outfile']['hash']}")  # noqa: T201
-        print(f"outfile cache: {not __encode_exec_flg}")  # noqa: T201
-
-        """Batch encode start."""
-        if __encode_exec_flg:
-            try:
-                __encode_rep = encoding(
-                    encode_cfg=__encode,
-                    probe_timeout=int(float(__base_probe_log["format"]["duration"]) * 1.2),
-                    ffmpeg_threads=args.ffmpeg_threads,
-                )
-                __vmaf_rsp = getvmaf(encode_cfg=__encode)
-                __rapt = (
-                    __encode_rep["elapsed_time"]
-                    + __encode_rep["elapsed_prbt"]
-                    + __vmaf_rsp["elapsed_time"]
-                )
-            except (KeyboardInterrupt, Exception) as err:
-                """__datafile write."""
-                print(f"\n\n{err}: datafile writeing to {__datafile}")  # noqa: T201
-                with Path(__datafile).open("w") as file:
-                    json.dump(__encode_cfg, file)
-                    file.flush()
-                    fsync(file.fileno())
-                print("done.\n\n")  # noqa: T201
-                raise
-
-            """load filehash."""
-            __encode_hash = getfilehash(f"{__encode['outfile']['filename']}.mkv")
-
-            if args.dist_save_video is False:
-                Path(f"{__encode['outfile']['filename']}.mkv").unlink()
-                print(f"Automatically delete: {__encode['outfile']['filename']}.mkv")  # noqa: T201
-
-            """Load ffproble."""
-            with Path(f"{__encode['outfile']['filename']}_ffprobe.json").open("r") as file:
-                __probe_log = json.load(file)
-
-            """Load VMAF."""
-            with Path(f"{__encode['outfile']['filename']}_vmaf.json").open("r") as file:
-                __vmaf_log = json.load(file)
-
-            """Write parameters."""
-            __encode["infile"].update(
-                {
-                    "duration": float(__base_probe_log["format"]["duration"]),
-                    "size_kbyte": (
-                        int(
-                            __base_probe_log["format"]["size"],
-                        )
-                        / 1024
-                    ),
-                },
-            )
-            __encode["outfile"].update(
-                {
-                    "bit_rate_kbs": float(
-                        (int(__probe_log["format"]["bit_rate"]) / 1024),
-                    ),
-                    "duration": float(
-                        __probe_log["format"]["duration"],
-                    ),
-                    "hash": __encode_hash,
-                    "size_kbyte": (
-                        int(
-                            __probe_log["format"]["size"],
-                        )
-                        / 1024
-                    ),
-                    "stream": __encode_rep["stream"],
-                },
-            )
-            __encode.update(
-                {
-                    "commandline": __encode_rep["commandline"],
-                    "results": {
-                        "encode": {
-                            "second": __encode_rep["elapsed_time"],
-                            "time": strftime(
-                                "%H:%M:%S",
-                                gmtime(__encode_rep["elapsed_time"]),
-                            ),
-                            "fps": (
-                                int(__encode_rep["stream"]["frames"]["total"])
-                                / __encode_rep["elapsed_time"]
-                            ),
-                            "speed": (
-                                float(__probe_log["format"]["duration"])
-                                / __encode_rep["elapsed_time"]
-                            ),
-                        },
-                        "compression_ratio_persent": (
-                            1
-                            - (
-                                float(__probe_log["format"]["size"])
-                                / float(__base_probe_log["format"]["size"])
-                            )
-                        ),
-                        "probe": {
-                            "second": __encode_rep["elapsed_prbt"],
-                            "time": strftime(
-                                "%H:%M:%S",
-                                gmtime(__encode_rep["elapsed_time"]),
-                            ),
-                        },
-                        "vmaf": {
-                            "second": __vmaf_rsp["elapsed_time"],
-                            "time": strftime(
-                                "%H:%M:%S",
-                                gmtime(__vmaf_rsp["elapsed_time"]),
-                            ),
-                            "version": __vmaf_log["version"],
-                            "commandline": __vmaf_rsp["commandline"],
-                            "pooled_metrics": {
-                                "float_ssim": __vmaf_log["pooled_metrics"]["float_ssim"],
-                                "vmaf": __vmaf_log["pooled_metrics"]["vmaf"],
-                            },
-                        },
-                    },
-                },
-            )
+    __pipeline = _build_pipeline(args)
+    __rapt: float = 0.0
+    __lock = threading.Lock()
+    __shared = _shared_references(config, args)
+    _expect_frames(__encode_cfg, __shared["frames"])
 
-            "__datafile 書き込み"
-            with Path(__datafile).open("w") as file:
-                json.dump(__encode_cfg, file)
-        else:
-            __rapt = (
-                __encode["results"]["encode"]["second"]
-                + __encode["results"]["probe"]["second"]
-                + __encode["results"]["vmaf"]["second"]
-            )
+    def __checkpoint(job: "EncodeJob") -> None:
+        """Persist a finished stage of a job (called on worker threads)."""
+        with __lock:
+            __encode_cfg[job.index] = deepcopy(job.encode)
+        __store.update(job.index, job.encode)
+
+    __order: list[int] = _queue_order(__encode_cfg, args)
+
+    def __queue() -> Iterator["EncodeJob"]:
+        """Yield jobs that still need to be encoded."""
+        nonlocal __rapt
+        for __count, __index in enumerate(__order):
+            __encode = __encode_cfg[__index]
+            _print_job_header(__pipeline, __count, __length, __rapt)
+            if _needs_encode(__encode):
+                yield EncodeJob(__index, __encode, checkpoint=__checkpoint, **__shared)
+            elif "pruned" not in __encode:
+                __rapt = _job_seconds(__encode)
+
+    """Batch encode start."""
+    __results = ResultCache(config["configs"].get("environment", {}))
+    try:
+        for __job in __pipeline.run(__queue()):
+            # 完了間隔 (並列実行時は 1 ジョブあたりの実効時間)
+            __rapt = __pipeline.lap
+
+            "job store 書き込み"
+            with __lock:
+                __encode_cfg[__job.index] = __job.encode
+            _record_job(__job, __store, __results, __shared)
+    except (KeyboardInterrupt, Exception) as err:
+        """__datafile write."""
+        print(f"\n\n{err}: datafile writeing to {__datafile}")  # noqa: T201
+        __store.export_json(sync=True)
+        print("done.\n\n")  # noqa: T201
+        raise
+    else:
+        __store.export_json()
+    finally:
+        if __shared["frames"] is not None:
+            __shared["frames"].close()
+        __results.close()
+        __store.close()
 
 
 def main() -> None:
@@ -281,15 +591,23 @@ def main() -> None:
         sys.exit("\n\nCannot be specified together with '--encode' and '--archive'.")
 
     if args.archive:
+        from ffvqe.data.archive import archive
+
         archive(config_path=args.config, args=args)
         sys.exit("\n\n Archive done.")
 
     if args.summary:
+        from ffvqe.summary import main as summary_main
+
         summary_main(config_path=args.config, args=args)
         sys.exit("\n\n Summary done.")
 
+    from ffvqe.config.loader import load_config
+
     __configs: dict[str, Any] = load_config(configfile=args.config, args=args)
     if args.encode:
+        from ffvqe.data.csv_generator import getcsv
+
         main_encode(config=__configs, args=args)
         getcsv(datafile=__configs["configs"]["datafile"])
 
@@ -12,7 +12,7 @@ from typing import Any
 
 import duckdb
 
-from ffvqe.config.loader import load_config
+from ffvqe.config.loader import read_config
 
 logger = getLogger(__name__)
 logger.setLevel(INFO)
@@ -40,7 +40,11 @@ def create_temp_table(csvfile_type: str) -> None:
 
 
 def show_aggregated_results() -> None:
-    """Show aggregated results for entries with VMAF mean greater than or equal to 93.00."""
+    """Show aggregated results for entries with VMAF mean greater than or equal to 93.00.
+
+    Single-pass jobs are shown apart (``single_pass``): their ``enc_sec`` is
+    NULL in the CSV since the encode time includes libvmaf.
+    """
     duckdb.sql(
         """
         SELECT
@@ -52,9 +56,10 @@ def show_aggregated_results() -> None:
             ROUND(AVG(ssim_mean), 3)                 AS ssim_mean,
             ROUND(AVG(vmaf_min), 3)                  AS vmaf_min,
             ROUND(AVG(vmaf_mean), 3)                 AS vmaf_mean,
-            outfile_options
+            outfile_options,
+            single_pass
         FROM encodes
-        GROUP BY ref_type, outfile_options
+        GROUP BY ref_type, outfile_options, single_pass
         ORDER BY outfile_options DESC
         LIMIT 8
     """,
@@ -81,21 +86,22 @@ def show_aggregated_results() -> None:
                 ROUND(AVG(FP), 3), ' / ',
                 ROUND(AVG(FB), 3))                   AS "I/P/B frames",
             outfile_options,
+            single_pass,
         FROM encodes
         WHERE
             comp_ratio_persent >= 0.60 AND
             ssim_mean >= 0.99 AND
             vmaf_mean >= 93.00 AND
             vmaf_mean <= 100.00
-        GROUP BY codec, outfile_options
+        GROUP BY codec, outfile_options, single_pass
         ORDER BY pt DESC
         """,
     ).show()
 
 
-def main(config_path: str, args: object) -> None:
+def main(config_path: str, args: object) -> None:  # noqa: ARG001
     """Main function to parse arguments and execute the workflow."""
-    __configs: dict[str, Any] = load_config(configfile=config_path, args=args)
+    __configs: dict[str, Any] = read_config(configfile=config_path)
     __datafile: Path = Path(f"{__configs['configs']['datafile']}")
     csvfile_type: str = f"{__datafile}".replace(".json", "_gby_type.csv")
     create_temp_table(csvfile_type)
@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+# To add a new cell, type '# %%'
+# To add a new markdown cell, type '# %% [markdown]'
+# %%
+"""Persistent caches shared across invocations of FFmpeg video quality evaluations."""
+
+import json
+from os import environ
+from pathlib import Path
+import re
+import sqlite3
+from typing import Any
+
+# Environment variable overriding the cache directory
+CACHE_DIR_ENV: str = "FFVQE_CACHE_DIR"
+
+
+def cache_dir() -> Path:
+    """Get (and create) the directory holding the persistent caches.
+
+    ``$FFVQE_CACHE_DIR`` takes precedence, then ``$XDG_CACHE_HOME/ffvqe`` and
+    finally ``~/.cache/ffvqe``.
+
+    Returns:
+        Path of the cache directory.
+    """
+    if environ.get(CACHE_DIR_ENV):
+        directory = Path(environ[CACHE_DIR_ENV])
+    elif environ.get("XDG_CACHE_HOME"):
+        directory = Path(environ["XDG_CACHE_HOME"]) / "ffvqe"
+    else:
+        directory = Path.home() / ".cache" / "ffvqe"
+    directory.mkdir(parents=True, exist_ok=True)
+    return directory
+
+
+def connect(name: str) -> sqlite3.Connection:
+    """Open a cache database in WAL mode so several processes can share it.
+
+    Args:
+        name: File name of the database in the cache directory.
+
+    Returns:
+        An autocommit SQLite connection.
+    """
+    con = sqlite3.connect(cache_dir() / name, timeout=30, isolation_level=None)
+    con.execute("PRAGMA journal_mode=WAL")
+    return con
+
+
+def file_identity(path: Path) -> tuple[str, int, int, int]:
+    """Identify the current content of a file without reading it.
+
+    Args:
+        path: File to identify.
+
+    Returns:
+        Resolved path, inode, size and modification time in nanoseconds.
+    """
+    stat = path.stat()
+    return str(path.resolve()), stat.st_ino, stat.st_size, stat.st_mtime_ns
+
+
+class FileHashCache:
+    """SHA-256 digests of files keyed by (path, inode, size, mtime_ns).
+
+    A digest is only returned while the file still has the same inode, size and
+    modification time as when it was hashed, so replaced or modified files are
+    hashed again.
+    """
+
+    DATABASE: str = "filehash.sqlite3"
+
+    def __init__(self) -> None:
+        """Open the cache database."""
+        self._con = connect(self.DATABASE)
+        self._con.execute(
+            "CREATE TABLE IF NOT EXISTS filehash ("
+            " path TEXT PRIMARY KEY, inode INTEGER NOT NULL, size INTEGER NOT NULL,"
+            " mtime_ns INTEGER NOT NULL, sha256 TEXT NOT NULL)",
+        )
+
+    def close(self) -> None:
+        """Close the cache database."""
+        self._con.close()
+
+    @staticmethod
+    def _key(path: Path) -> tuple[str, int, int, int]:
+        return file_identity(path)
+
+    def get(self, path: Path) -> str | None:
+        """Look up the digest of an unchanged file.
+
+        Args:
+            path: File to look up.
+
+        Returns:
+            The cached hexadecimal digest, or None if unknown or changed.
+        """
+        row = self._con.execute(
+            "SELECT sha256 FROM filehash WHERE path = ? AND inode = ? AND size = ? AND mtime_ns = ?",
+            self._key(path),
+        ).fetchone()
+        return None if row is None else str(row[0])
+
+    def put(self, path: Path, digest: str) -> None:
+        """Remember the digest of a file.
+
+        Args:
+            path: Hashed file.
+            digest: Hexadecimal SHA-256 digest of the file.
+        """
+        self._con.execute(
+            "INSERT OR REPLACE INTO filehash (path, inode, size, mtime_ns, sha256)"
+            " VALUES (?, ?, ?, ?, ?)",
+            (*self._key(path), digest),
+        )
+
+
+class JsonCache:
+    """JSON documents keyed by a string, one table per kind of document.
+
+    Keys are built by the caller from everything the document depends on (e.g.
+    ``file_identity`` of the input files), so stale entries are never returned;
+    they are simply replaced when the same key is written again.
+    """
+
+    DATABASE: str = "cache.sqlite3"
+
+    def __init__(self, table: str) -> None:
+        """Open the cache database.
+
+        Args:
+            table: Name of the table holding this kind of document.
+
+        Raises:
+            ValueError: If ``table`` is not a valid identifier.
+        """
+        if re.fullmatch(r"[a-z_][a-z0-9_]*", table) is None:
+            msg = f"Invalid cache table name: {table}"
+            raise ValueError(msg)
+        self.table = table
+        self._con = connect(self.DATABASE)
+        self._con.execute(
+            f"CREATE TABLE IF NOT EXISTS {table} (key TEXT PRIMARY KEY, data TEXT NOT NULL)",
+        )
+
+    def close(self) -> None:
+        """Close the cache database."""
+        self._con.close()
+
+    def get(self, key: str) -> Any | None:  # noqa: ANN401
+        """Look up a document.
+
+        Args:
+            key: Key of the document.
+
+        Returns:
+            The decoded document, or None if unknown.
+        """
+        row = self._con.execute(
+            f"SELECT data FROM {self.table} WHERE key = ?",  # noqa: S608
+            (key,),
+        ).fetchone()
+        return None if row is None else json.loads(row[0])
+
+    def put(self, key: str, data: Any) -> None:  # noqa: ANN401
+        """Store a document.
+
+        Args:
+            key: Key of the document.
+            data: JSON serializable document.
+        """
+        self._con.execute(
+            f"INSERT OR REPLACE INTO {self.table} (key, data) VALUES (?, ?)",  # noqa: S608
+            (key, json.dumps(data)),
+        )
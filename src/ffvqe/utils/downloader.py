@@ -0,0 +1,276 @@
+#!/usr/bin/env python3
+# To add a new cell, type '# %%'
+# To add a new markdown cell, type '# %% [markdown]'
+# %%
+"""Parallel, resumable HTTP downloads for FFmpeg video quality evaluations."""
+
+from collections.abc import Callable
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
+import json
+import os
+from pathlib import Path
+import threading
+from typing import Any
+
+import requests
+
+from ffvqe.utils.exceptions import VQEError
+
+# Size of the chunks read from the network and written to the file
+DOWNLOAD_CHUNK_SIZE: int = 1024 * 1024
+
+# Maximum number of Range requests run in parallel for one file
+DOWNLOAD_SEGMENTS: int = 4
+
+# Files are not split into segments smaller than this
+MIN_SEGMENT_SIZE: int = 8 * 1024 * 1024
+
+# Seconds to wait for the server to connect or send data
+DOWNLOAD_TIMEOUT: int = 30
+
+
+class _OrderedHasher:
+    """SHA-256 of a file whose byte ranges are written out of order.
+
+    Bytes are hashed as soon as every byte before them has arrived. A chunk
+    that continues the hashed prefix is hashed from memory; chunks that arrived
+    ahead of it are read back from the file (still in the page cache) once the
+    gap before them is filled.
+    """
+
+    def __init__(self, fd: int) -> None:
+        """Initialize the hasher.
+
+        Args:
+            fd: Descriptor of the file being written.
+        """
+        self._fd = fd
+        self._sha = hashlib.sha256()
+        self._offset = 0
+        self._ahead: dict[int, int] = {}
+        self._lock = threading.Lock()
+
+    def written(self, start: int, end: int, data: bytes | None = None) -> None:
+        """Record that a byte range has been written to the file.
+
+        Args:
+            start: Offset of the first byte.
+            end: Offset after the last byte.
+            data: The bytes of the range, if still in memory.
+        """
+        if start == end:
+            return
+        with self._lock:
+            if start == self._offset and data is not None:
+                self._sha.update(data)
+                self._offset = end
+            else:
+                self._ahead[start] = end
+            while (ahead := self._ahead.pop(self._offset, None)) is not None:
+                self._read(self._offset, ahead)
+
+    def _read(self, start: int, end: int) -> None:
+        while start < end:
+            chunk = os.pread(self._fd, min(DOWNLOAD_CHUNK_SIZE, end - start), start)
+            if not chunk:
+                msg = "File is shorter than the bytes written to it"
+                raise OSError(msg)
+            self._sha.update(chunk)
+            start += len(chunk)
+        self._offset = end
+
+    def hexdigest(self, size: int) -> str:
+        """Get the digest once the whole file has been written.
+
+        Args:
+            size: Size of the file.
+
+        Returns:
+            The hexadecimal SHA-256 digest.
+
+        Raises:
+            OSError: If some bytes of the file have not been written.
+        """
+        if self._offset != size:
+            msg = f"Only {self._offset} of {size} bytes were hashed"
+            raise OSError(msg)
+        return self._sha.hexdigest()
+
+
+class _SegmentState:
+    """Progress of every segment, persisted next to the partial file for resuming."""
+
+    def __init__(self, path: Path, url: str, size: int | None, segments: list[list[int]]) -> None:
+        self.path = path
+        self.url = url
+        self.size = size
+        # [start, end, downloaded bytes]
+        self.segments = segments
+        self._lock = threading.Lock()
+
+    @classmethod
+    def load(cls, path: Path, url: str, size: int | None) -> "_SegmentState | None":
+        """Load the state of a previous download of the same URL and size, if any."""
+        try:
+            state: dict[str, Any] = json.loads(path.read_text())
+        except (OSError, ValueError):
+            return None
+        if state.get("url") != url or state.get("size") != size or size is None:
+            return None
+        return cls(path, url, size, [list(segment) for segment in state["segments"]])
+
+    def advance(self, index: int, length: int) -> None:
+        """Record downloaded bytes of a segment and save the state."""
+        with self._lock:
+            self.segments[index][2] += length
+            __tmp = self.path.with_name(f"{self.path.name}.tmp")
+            __tmp.write_text(
+                json.dumps({"url": self.url, "size": self.size, "segments": self.segments}),
+            )
+            __tmp.replace(self.path)
+
+
+def _split(size: int | None, segments: int) -> list[list[int]]:
+    """Split a file into segments of ``[start, end, downloaded bytes]``."""
+    if size is None:
+        return [[0, -1, 0]]
+    count = max(1, min(segments, size // MIN_SEGMENT_SIZE))
+    bounds = [size * index // count for index in range(count + 1)]
+    return [[bounds[index], bounds[index + 1], 0] for index in range(count)]
+
+
+def _probe(url: str, size: int | None) -> tuple[int | None, bool]:
+    """Ask the server for the file size and whether it accepts Range requests."""
+    response = requests.head(url, allow_redirects=True, timeout=DOWNLOAD_TIMEOUT)
+    response.raise_for_status()
+    if size is None and response.headers.get("Content-Length", "").isdigit():
+        size = int(response.headers["Content-Length"])
+    return size, response.headers.get("Accept-Ranges", "").lower() == "bytes"
+
+
+def _fetch_segment(  # noqa: PLR0913
+    url: str,
+    fd: int,
+    index: int,
+    *,
+    state: _SegmentState,
+    hasher: _OrderedHasher,
+    progress: Callable[[int], None] | None,
+) -> None:
+    """Download the remaining bytes of one segment."""
+    start, end, downloaded = state.segments[index]
+    position = start + downloaded
+    if end >= 0 and position >= end:
+        return
+
+    # ファイル全体を先頭から取得する場合は Range を付けない (Range 非対応のサーバー向け)
+    whole = position == 0 and end == state.size
+    headers = {} if end < 0 or whole else {"Range": f"bytes={position}-{end - 1}"}
+    with requests.get(url, headers=headers, stream=True, timeout=DOWNLOAD_TIMEOUT) as response:
+        response.raise_for_status()
+        if headers and response.status_code != requests.codes.partial_content:
+            msg = f"Server ignored the Range request: {url}"
+            raise requests.ConnectionError(msg)
+        for chunk in response.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+            if end >= 0:
+                chunk = chunk[: end - position]  # noqa: PLW2901
+            os.pwrite(fd, chunk, position)
+            hasher.written(position, position + len(chunk), chunk)
+            position += len(chunk)
+            state.advance(index, len(chunk))
+            if progress is not None:
+                progress(len(chunk))
+
+    if end >= 0 and position < end:
+        msg = f"Connection closed after {position - start} of {end - start} bytes: {url}"
+        raise ConnectionError(msg)
+
+
+def download_file(  # noqa: PLR0913
+    url: str,
+    dest: Path,
+    *,
+    size: int | None = None,
+    sha256: str | None = None,
+    segments: int = DOWNLOAD_SEGMENTS,
+    progress: Callable[[int], None] | None = None,
+) -> str:
+    """Download a file with parallel Range requests, hashing it on the fly.
+
+    The file is written to ``<dest>.part`` and split into up to ``segments``
+    segments fetched in parallel when the server accepts Range requests. The
+    progress of every segment is saved to ``<dest>.part.json`` after each
+    chunk, so an interrupted download resumes where it stopped. The SHA-256 is
+    computed while the bytes arrive, so the file is not read again afterwards.
+
+    Args:
+        url: URL of the file.
+        dest: Destination path.
+        size: Size of the file, if known. Otherwise it is asked from the server.
+        sha256: Expected hexadecimal SHA-256 digest.
+        segments: Maximum number of parallel Range requests.
+        progress: Callback receiving the number of bytes downloaded (including
+            the bytes already present when resuming).
+
+    Returns:
+        The hexadecimal SHA-256 digest of the downloaded file.
+
+    Raises:
+        VQEError: If the digest does not match ``sha256``; the partial download
+            is removed.
+    """
+    partial = dest.with_name(f"{dest.name}.part")
+    state_path = dest.with_name(f"{dest.name}.part.json")
+    size, ranges = _probe(url, size)
+
+    state = _SegmentState.load(state_path, url, size) if ranges and partial.exists() else None
+    if state is None:
+        state = _SegmentState(state_path, url, size, _split(size, segments if ranges else 1))
+        partial.unlink(missing_ok=True)
+
+    dest.parent.mkdir(parents=True, exist_ok=True)
+    fd = os.open(partial, os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        if size is not None:
+            os.ftruncate(fd, size)
+        hasher = _OrderedHasher(fd)
+        # 前回までにダウンロード済みの範囲をハッシュに含める
+        for start, _end, downloaded in state.segments:
+            hasher.written(start, start + downloaded)
+        if progress is not None:
+            progress(sum(segment[2] for segment in state.segments))
+
+        with ThreadPoolExecutor(
+            max_workers=len(state.segments),
+            thread_name_prefix="ffvqe-download",
+        ) as pool:
+            futures = [
+                pool.submit(
+                    _fetch_segment,
+                    url,
+                    fd,
+                    index,
+                    state=state,
+                    hasher=hasher,
+                    progress=progress,
+                )
+                for index in range(len(state.segments))
+            ]
+            for future in futures:
+                future.result()
+
+        digest = hasher.hexdigest(size if size is not None else state.segments[0][2])
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+    if sha256 is not None and digest != sha256:
+        partial.unlink(missing_ok=True)
+        state_path.unlink(missing_ok=True)
+        msg = f"Downloaded file hash {digest} does not match expected hash {sha256}"
+        raise VQEError(msg)
+
+    partial.replace(dest)
+    state_path.unlink(missing_ok=True)
+    return digest
@@ -4,6 +4,8 @@
 # %%
 """Exception classes for FFmpeg video quality evaluations."""
 
+from typing import Any
+
 
 class VQEError(Exception):
     """Base exception class for VQE errors.
@@ -18,3 +20,21 @@ class VQEError(Exception):
             message: The error message to display.
         """
         super().__init__(f"Error: {message}")
+
+
+class JobPrunedError(VQEError):
+    """Raised when an abort rule stops a job that cannot reach its target.
+
+    The partial statistics measured when the rule fired are kept on the
+    exception so that the job can be recorded as pruned.
+    """
+
+    def __init__(self, message: str, stats: dict[str, Any]) -> None:
+        """Initialize the exception with the partial statistics of the job.
+
+        Args:
+            message: The error message to display.
+            stats: Partial statistics of the job, including the stage and rule.
+        """
+        super().__init__(message)
+        self.stats = stats
@@ -4,25 +4,62 @@
 # %%
 """File operation utilities for FFmpeg video quality evaluations."""
 
+from collections.abc import Callable
 import hashlib
 from pathlib import Path
 import tarfile
 
+from ffvqe.utils.cache import FileHashCache
 
-def getfilehash(filename: str) -> str:
+# Read size used when hashing files, so memory use does not depend on the file size
+HASH_CHUNK_SIZE: int = 4 * 1024 * 1024
+
+
+def getfilehash(
+    filename: str,
+    *,
+    cache: bool = False,
+    progress: Callable[[int], None] | None = None,
+) -> str:
     """Calculate SHA-256 hash of a file.
 
+    The file is read in ``HASH_CHUNK_SIZE`` chunks. With ``cache`` the digest is
+    looked up in (and stored to) the persistent ``FileHashCache``, so an
+    unchanged file is only hashed once across invocations.
+
     Args:
         filename: Path to the file to hash.
+        cache: Whether to use the persistent file-hash cache.
+        progress: Callback receiving the number of bytes hashed after every chunk
+            (the whole file size on a cache hit). An exception raised by the
+            callback aborts hashing.
 
     Returns:
         The hexadecimal digest of the file's SHA-256 hash.
     """
-    with Path(f"{filename}").open("rb") as file:
-        __hasher = hashlib.sha256()
-        __hasher.update(file.read())
+    __path = Path(f"{filename}")
+    __cache = FileHashCache() if cache and __path.is_file() else None
+    try:
+        if __cache is not None and (__digest := __cache.get(__path)) is not None:
+            if progress is not None:
+                progress(__path.stat().st_size)
+            return __digest
 
-    return f"{__hasher.hexdigest()}"
+        __hasher = hashlib.sha256()
+        with __path.open("rb") as file:
+            while __chunk := file.read(HASH_CHUNK_SIZE):
+                __hasher.update(__chunk)
+                if progress is not None:
+                    progress(len(__chunk))
+        __digest = __hasher.hexdigest()
+
+        if __cache is not None:
+            __cache.put(__path, __digest)
+    finally:
+        if __cache is not None:
+            __cache.close()
+
+    return f"{__digest}"
 
 
 def split_large_file(file_path: Path, max_size_mb: int = 80) -> list[Path]:
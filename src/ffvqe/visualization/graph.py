@@ -25,6 +25,8 @@ from bokeh.models.widgets import MultiChoice
 from bokeh.plotting import figure
 import duckdb
 
+from ffvqe.data.job_store import exported_json
+from ffvqe.data.job_store import last_modified
 from ffvqe.utils.yaml_handler import create_yaml_handler
 
 if TYPE_CHECKING:
@@ -92,6 +94,8 @@ class GraphVisualizer:
     def load_data_with_duckdb(self, datafile: str) -> MyAny:
         """Load data using DuckDB.
 
+        The data is read from the job store of the datafile if there is one.
+
         Args:
             datafile: Path to the JSON data file.
 
@@ -100,7 +104,8 @@ class GraphVisualizer:
         """
         con = duckdb.connect(database=":memory:")
         # パラメータ化されたクエリを使用
-        con.execute("CREATE TABLE encodes AS SELECT * FROM read_json(?)", [datafile])
+        with exported_json(datafile) as jsonfile:
+            con.execute("CREATE TABLE encodes AS SELECT * FROM read_json(?)", [jsonfile])
         query = """
         SELECT
             row_number() OVER () - 1                               AS index,
@@ -235,7 +240,7 @@ class GraphVisualizer:
     def update_data(self) -> None:
         """Update data if the YAML file has been modified."""
         try:
-            current_mod_time = Path(self.datafile).stat().st_mtime
+            current_mod_time = last_modified(self.datafile)
         except FileNotFoundError:
             # ファイルが存在しない場合の処理
             logger.exception("File not found: %s", self.datafile)
@@ -14,6 +14,10 @@ sys.path.append(str(Path(__file__).parent.parent / "src"))
 
 
 @pytest.fixture(autouse=True)
-def setup_test_env() -> None:
+def setup_test_env(
+    monkeypatch: pytest.MonkeyPatch,
+    tmp_path_factory: pytest.TempPathFactory,
+) -> None:
     """Set up test environment."""
-    return
+    # 永続キャッシュをテストごとの一時ディレクトリに向ける
+    monkeypatch.setenv("FFVQE_CACHE_DIR", str(tmp_path_factory.mktemp("cache")))
@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+# To add a new cell, type '# %%'
+# To add a new markdown cell, type '# %% [markdown]'
+# %%
+"""Tests for early-abort rules."""
+
+import json
+from pathlib import Path
+from typing import Any
+from unittest.mock import MagicMock
+
+import pytest
+from pytest_mock import MockerFixture
+
+from ffvqe.config.loader import SaveConfigsParams
+from ffvqe.config.loader import _apply_abort_rules
+from ffvqe.config.loader import _generate_encoding_configs
+from ffvqe.config.loader import _save_configs
+from ffvqe.data.job_store import JobStore
+from ffvqe.encoding.abort import AbortRules
+from ffvqe.encoding.jobs import EncodeJob
+from ffvqe.encoding.jobs import stage_encode
+from ffvqe.encoding.jobs import stage_result
+from ffvqe.encoding.jobs import stage_vmaf
+from ffvqe.encoding.reference_probe import ReferenceProbes
+from ffvqe.encoding.runner import ProcessResult
+from ffvqe.encoding.scheduler import JobSlot
+from ffvqe.utils.exceptions import JobPrunedError
+from ffvqe.utils.exceptions import VQEError
+
+
+def _job(tmp_path: Path, abort: dict[str, Any]) -> EncodeJob:
+    basefile = f"{tmp_path / 'ref.m2ts'}"
+    probes = ReferenceProbes({basefile: "ref"})
+    probes._probes["ref"] = {"format": {"duration": "10.0"}}  # noqa: SLF001
+    encode = {
+        "codec": "libx264",
+        "hwaccels": "",
+        "infile": {"filename": basefile, "option": ""},
+        "outfile": {"filename": f"{tmp_path / 'out'}", "hash": ""},
+        "abort": abort,
+    }
+    return EncodeJob(0, encode, checkpoint=MagicMock(), probes=probes)
+
+
+def _progress(second: float, size: int) -> list[bytes]:
+    return [f"total_size={size}\n".encode(), f"out_time_us={int(second * 1_000_000)}\n".encode()]
+
+
+def test_rules_validated() -> None:
+    with pytest.raises(VQEError, match="unknown rules"):
+        AbortRules({"after": 5, "max_bitrate": 100})
+    with pytest.raises(VQEError, match="'after'"):
+        AbortRules({"min_vmaf": 80})
+    assert AbortRules({}).bitrate_watcher() is None
+
+
+def test_bitrate_watcher_raises_after_seconds() -> None:
+    watch = AbortRules({"after": 2, "max_bitrate_kbs": 100}).bitrate_watcher()
+    assert watch is not None
+
+    # after 秒までは判定しない
+    for line in _progress(1.0, 128 * 1024):
+        watch(line)
+    for line in _progress(2.0, 16 * 1024):
+        watch(line)
+    size, out_time = _progress(4.0, 64 * 1024)
+    watch(size)
+    with pytest.raises(JobPrunedError) as err:
+        watch(out_time)
+
+    assert err.value.stats["stage"] == "encode"
+    assert err.value.stats["rule"] == "max_bitrate_kbs"
+    assert err.value.stats["bit_rate_kbs"] == 128.0
+
+
+def test_encode_stage_prunes_job(tmp_path: Path, mocker: MockerFixture) -> None:
+    job = _job(tmp_path, {"after": 1, "max_bitrate_kbs": 100})
+
+    def _encode(**kwargs: Any) -> dict[str, Any]:  # noqa: ANN401
+        for line in _progress(1.0, 1024 * 1024):
+            kwargs["on_stdout"](line)
+        return {}
+
+    mocker.patch("ffvqe.encoding.jobs.encode_video", side_effect=_encode)
+    Path(f"{job.outfile}.mkv").write_bytes(b"partial")
+    args = MagicMock(jobs=1, pipeline=False, single_pass=False, encode_chunks=1)
+
+    job = stage_encode(job, JobSlot(cores=4, position=1), args)
+
+    assert job.pruned
+    assert not job.done("encoded")
+    assert job.encode["pruned"]["bit_rate_kbs"] == 8192.0
+    job._checkpoint.assert_called_once_with(job)  # type: ignore[union-attr]  # noqa: SLF001
+
+    # 打ち切った出力は削除し、結果は書き込まない
+    args.dist_save_video = False
+    assert stage_result(job, JobSlot(cores=0, position=1), args) is job
+    assert not Path(f"{job.outfile}.mkv").exists()
+    assert "results" not in job.encode
+
+
+def test_vmaf_stage_prunes_job_after_first_seconds(tmp_path: Path, mocker: MockerFixture) -> None:
+    job = _job(tmp_path, {"after": 2, "min_vmaf": 90})
+    job.probe_rep = {"stream": {"frames": {"total": 100}}}
+
+    def _run(commands: list[list[str]], **_: Any) -> list[ProcessResult]:  # noqa: ANN401
+        for cmd in commands:
+            lavfi = cmd[cmd.index("-lavfi") + 1]
+            end = int(lavfi.split("end_frame=")[1].split(",")[0])
+            Path(lavfi.split("log_path=")[1].split(":")[0]).write_text(
+                json.dumps(
+                    {"frames": [{"frameNum": n, "metrics": {"vmaf": 70.0}} for n in range(end)]},
+                ),
+            )
+        return [ProcessResult(cmd, 0, b"", "", 1.0) for cmd in commands]
+
+    mock_run = mocker.patch("ffvqe.encoding.vmaf_chunks.run_processes", side_effect=_run)
+    frames = {"pts": [frame / 10 for frame in range(100)], "keyframes": [0]}
+    mocker.patch("ffvqe.encoding.vmaf_chunks._probe_frames", return_value=frames)
+    mocker.patch("ffvqe.encoding.vmaf_chunks.reference_frames", return_value=frames)
+    args = MagicMock(jobs=1, pipeline=False, vmaf_chunks=1)
+
+    job = stage_vmaf(job, JobSlot(cores=4, position=1), args)
+
+    # 先頭 2 秒 (20 フレーム) だけを計測し、残りは計測しない
+    mock_run.assert_called_once()
+    command = mock_run.call_args.args[0][0]
+    assert "trim=start_frame=0:end_frame=22," in command[command.index("-lavfi") + 1]
+    assert job.pruned
+    assert not job.done("scored")
+    assert job.encode["pruned"]["frames"] == 20
+    assert job.encode["pruned"]["vmaf"]["mean"] == 70.0
+    assert list(tmp_path.glob("out_vmaf*")) == []
+
+
+def test_rule_change_requeues_pruned_job() -> None:
+    encode: dict[str, Any] = {"abort": {"after": 5, "min_vmaf": 90}, "pruned": {"stage": "vmaf"}}
+
+    assert _apply_abort_rules(encode, {"abort": {"after": 5, "min_vmaf": 90}}) is encode
+
+    changed = _apply_abort_rules(encode, {"abort": {"after": 5, "min_vmaf": 85}})
+    assert changed == {"abort": {"after": 5, "min_vmaf": 85}}
+    # datafile の元の設定は変更しない (保存時に差分として検出する)
+    assert "pruned" in encode
+
+    assert _apply_abort_rules(changed, {}) == {}
+
+
+def test_rule_change_saved_to_job_store(tmp_path: Path) -> None:
+    configs: dict[str, Any] = {
+        "configs": {
+            "patterns": [
+                {
+                    "codec": "libx264",
+                    "type": "crf",
+                    "comments": "abort",
+                    "presets": ["medium"],
+                    "hwaccels": "",
+                    "infile": {"option": ""},
+                    "outfile": {"options": ["-crf 23"]},
+                    "abort": {"after": 5, "min_vmaf": 90},
+                },
+            ],
+            "references": [
+                {
+                    "name": "ref",
+                    "type": "anime",
+                    "basefile": f"{tmp_path / 'ref.m2ts'}",
+                    "basehash": "0" * 64,
+                },
+            ],
+        },
+    }
+    configfile = f"{tmp_path / 'abort.yml'}"
+    datafile = f"{tmp_path / 'data.json'}"
+    args = MagicMock(ffmpeg_threads=4, no_result_cache=True)
+
+    def _save(encode_cfg: list[dict[str, Any]]) -> None:
+        results_list = _generate_encoding_configs(configs, encode_cfg, configfile, args)
+        _save_configs(
+            SaveConfigsParams(
+                configs=configs,
+                results_list=results_list,
+                configfile=configfile,
+                datafile=datafile,
+                config_flag=False,
+                existing_encodes={encode["id"]: encode for encode in encode_cfg},
+            ),
+        )
+
+    _save([])
+    with JobStore(datafile) as store:
+        store.update(0, {**store.load()[0], "pruned": {"stage": "vmaf"}})
+        encode_cfg = store.load()
+
+    # ルールを変更すると、打ち切ったジョブを再実行するよう保存する
+    configs["configs"]["patterns"][0]["abort"] = {"after": 5, "min_vmaf": 85}
+    _save(encode_cfg)
+    with JobStore(datafile) as store:
+        (saved,) = store.load()
+    assert saved["abort"] == {"after": 5, "min_vmaf": 85}
+    assert "pruned" not in saved
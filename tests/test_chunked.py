@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+# To add a new cell, type '# %%'
+# To add a new markdown cell, type '# %% [markdown]'
+# %%
+"""Tests for chunked (segment-parallel) encoding."""
+
+import json
+from pathlib import Path
+from typing import Any
+
+import pytest
+from pytest_mock import MockerFixture
+
+from ffvqe.encoding.chunked import _build_chunk_command
+from ffvqe.encoding.chunked import _build_concat_command
+from ffvqe.encoding.chunked import encode_video_chunked
+from ffvqe.encoding.chunked import plan_chunks
+from ffvqe.encoding.chunked import reference_frames
+from ffvqe.encoding.chunked import supports_chunking
+from ffvqe.encoding.runner import ProcessResult
+
+# 30 フレーム、 10 フレームごとにキーフレーム (パケットはデコード順)
+PACKETS: dict[str, Any] = {
+    "packets": [
+        {"pts_time": f"{1.0 + index / 10:.6f}", "flags": "K__" if index % 10 == 0 else "___"}
+        for index in (0, 2, 1, 3, 5, 4, 6, 8, 7, 9, *range(10, 30))
+    ],
+    "format": {"start_time": "1.000000"},
+}
+
+
+def _encode_cfg(tmp_path: Path) -> dict[str, Any]:
+    reference = tmp_path / "ref.m2ts"
+    reference.write_bytes(b"ref")
+    return {
+        "codec": "libx265",
+        "preset": "slow",
+        "hwaccels": "",
+        "infile": {"filename": f"{reference}", "option": ""},
+        "outfile": {"filename": f"{tmp_path / 'dist' / 'out'}", "options": "-crf 20"},
+    }
+
+
+def test_plan_chunks_cuts_at_keyframes() -> None:
+    frames = {"pts": [index / 10 for index in range(30)], "keyframes": [0, 10, 20]}
+
+    assert plan_chunks(frames, 3) == [(0.0, 10), (1.0, 10), (2.0, 10)]
+    # キーフレームより多くは分割しない
+    assert plan_chunks(frames, 8) == [(0.0, 10), (1.0, 10), (2.0, 10)]
+    assert plan_chunks({"pts": frames["pts"], "keyframes": [0]}, 4) == [(0.0, 30)]
+
+
+def test_reference_frames_sorted_and_cached(tmp_path: Path, mocker: MockerFixture) -> None:
+    mock_run = mocker.patch(
+        "ffvqe.encoding.chunked.run_process",
+        return_value=ProcessResult([], 0, json.dumps(PACKETS).encode(), "", 0.1),
+    )
+    basefile = _encode_cfg(tmp_path)["infile"]["filename"]
+
+    frames = reference_frames(basefile)
+    assert reference_frames(basefile) == frames
+
+    mock_run.assert_called_once()
+    # 表示順に並べ替え、ファイル先頭からの時間にする
+    assert frames["pts"][:3] == pytest.approx([0.0, 0.1, 0.2])
+    assert frames["keyframes"] == [0, 10, 20]
+
+
+def test_chunk_command_is_frame_exact(tmp_path: Path) -> None:
+    cmd = _build_chunk_command(_encode_cfg(tmp_path), (1.0, 10), tmp_path / "0001.mkv", 2)
+
+    assert cmd[cmd.index("-ss") + 1] == "1.000000"
+    assert cmd.index("-ss") < cmd.index("-i")
+    assert cmd[cmd.index("-frames:v") + 1] == "10"
+    assert cmd[cmd.index("-crf") + 1] == "20"
+    assert cmd[-2:] == ["-an", f"{tmp_path / '0001.mkv'}"]
+    assert "-benchmark" in cmd
+    # -threads はデコーダーとエンコーダーの両方に指定する
+    threads = [index for index, arg in enumerate(cmd) if arg == "-threads"]
+    assert [cmd[index + 1] for index in threads] == ["2", "2"]
+    assert threads[0] < cmd.index("-i") < threads[1] < cmd.index("-c:v")
+
+
+@pytest.mark.parametrize(
+    ("options", "expected"),
+    [
+        ("-crf 20", True),
+        ("-crf 20 -vf yadif", True),
+        ("-crf 20 -vf scale=1280:-2,yadif=0", True),
+        ("-crf 20 -vf yadif=1", False),
+        ("-crf 20 -vf bwdif=mode=send_field", False),
+        ("-crf 20 -r 24000/1001", False),
+        ("-crf 20 -vf fps=30", False),
+        ("-crf 20 -an", True),
+        ("-crf 20 -c:a aac -b:a 128k", True),
+        ("-crf 20 -map 0", False),
+        ("-crf 20 -c copy", False),
+    ],
+)
+def test_supports_chunking_needs_same_frames(
+    tmp_path: Path,
+    options: str,
+    *,
+    expected: bool,
+) -> None:
+    encode_cfg = _encode_cfg(tmp_path)
+    encode_cfg["outfile"]["options"] = options
+
+    assert supports_chunking(encode_cfg) is expected
+
+
+@pytest.mark.parametrize(
+    ("options", "audio"),
+    [
+        ("-crf 20", ["-map", "1:a:0?"]),
+        (
+            "-crf 20 -c:a aac -b:a 128k -ac 2",
+            ["-map", "1:a:0?", "-c:a", "aac", "-b:a", "128k", "-ac", "2"],
+        ),
+        ("-an -crf 20", ["-an"]),
+    ],
+)
+def test_concat_command_applies_audio_options(
+    tmp_path: Path,
+    options: str,
+    audio: list[str],
+) -> None:
+    encode_cfg = _encode_cfg(tmp_path)
+    encode_cfg["outfile"]["options"] = options
+
+    concat = _build_concat_command(encode_cfg, tmp_path / "chunks.txt")
+    outputs = concat[concat.index("-map") :]
+    assert outputs == ["-map", "0:v:0", *audio, "-c:v", "copy", f"{tmp_path / 'dist' / 'out'}.mkv"]
+    # -an なら音声のためにリファレンスを入力しない
+    assert (encode_cfg["infile"]["filename"] in concat) is (audio != ["-an"])
+
+
+def test_encode_video_chunked(tmp_path: Path, mocker: MockerFixture) -> None:
+    encode_cfg = _encode_cfg(tmp_path)
+    mocker.patch(
+        "ffvqe.encoding.chunked.reference_frames",
+        return_value={"pts": [index / 10 for index in range(30)], "keyframes": [0, 10, 20]},
+    )
+
+    def _run_chunks(commands: list[list[str]], **kwargs: Any) -> list[ProcessResult]:  # noqa: ANN401
+        for own in kwargs["per_command"]:
+            own["progress"](100.0)
+            own["on_stderr"](b"bench: utime=3.000s stime=1.000s rtime=2.000s\n")
+        return [ProcessResult(cmd, 0, b"", "", 2.0 + index) for index, cmd in enumerate(commands)]
+
+    mock_chunks = mocker.patch("ffvqe.encoding.chunked.run_processes", side_effect=_run_chunks)
+    mock_concat = mocker.patch(
+        "ffvqe.encoding.chunked.run_process",
+        return_value=ProcessResult([], 0, b"", "", 0.5),
+    )
+
+    result = encode_video_chunked(encode_cfg, chunks=3, ffmpeg_threads=12)
+
+    commands = mock_chunks.call_args.args[0]
+    assert len(commands) == 3
+    assert all(cmd[cmd.index("-threads") + 1] == "4" for cmd in commands)
+    concat = mock_concat.call_args.args[0]
+    assert concat[concat.index("-c:v") + 1] == "copy"
+    assert concat[-1] == f"{tmp_path / 'dist' / 'out'}.mkv"
+    # 実時間は最も遅いチャンクと結合、 CPU 時間はチャンクの合計
+    assert result["elapsed_time"] == 4.5
+    assert result["cpu_time"] == 12.0
+    assert result["chunks"] == 3
+    assert not (tmp_path / "dist" / "out_chunks").exists()
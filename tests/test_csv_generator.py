@@ -5,7 +5,10 @@
 """Test CSV generation functionality."""
 
 from collections.abc import Generator
+import csv
+import json
 from pathlib import Path
+from typing import Any
 from unittest.mock import MagicMock
 from unittest.mock import patch
 
@@ -108,3 +111,67 @@ def test_getcsv_generates_correct_filenames(
     # Check that each expected file was used in a write_csv call
     for expected_file in expected_files:
         mock_write_csv.assert_any_call(expected_file)
+
+
+def _csv_entry(options: str, results_encode: dict[str, Any]) -> dict[str, Any]:
+    return {
+        "codec": "libx264",
+        "type": "crf",
+        "preset": "medium",
+        "threads": 4,
+        "infile": {"name": "ref", "type": "anime", "option": ""},
+        "outfile": {
+            "filename": f"out{options}.mkv",
+            "size_kbyte": 100.0,
+            "bit_rate_kbs": 1000.0,
+            "options": options,
+            "stream": {
+                "gop": 250,
+                "has_b_frames": 2,
+                "refs": 1,
+                "frames": {"I": 1, "P": 10, "B": 20, "total": 31},
+            },
+        },
+        "results": {
+            "encode": results_encode,
+            "compression_ratio_persent": 0.9,
+            "vmaf": {
+                "pooled_metrics": {
+                    "float_ssim": {"min": 0.99, "harmonic_mean": 0.995},
+                    "vmaf": {"min": 90.0, "harmonic_mean": 95.0},
+                },
+            },
+        },
+    }
+
+
+def test_getcsv_marks_single_pass(tmp_path: Path) -> None:
+    """Test that single-pass jobs are marked and get no encode time."""
+    datafile = tmp_path / "data.json"
+    datafile.write_text(
+        json.dumps(
+            [
+                _csv_entry("-crf 23", {"second": 10.0, "time": "00:00:10", "speed": 2.0}),
+                _csv_entry(
+                    "-crf 28",
+                    {"second": 30.0, "time": "00:00:30", "speed": None, "includes_vmaf": True},
+                ),
+            ],
+        ),
+    )
+
+    getcsv(f"{datafile}")
+
+    with (tmp_path / "data_all.csv").open() as csvfile:
+        rows = {row["outfile_options"]: row for row in csv.DictReader(csvfile)}
+    columns = ("single_pass", "enc_sec", "enc_time")
+    assert [rows["-crf 23"][column] for column in columns] == ["false", "10.0", "00:00:10"]
+    assert [rows["-crf 28"][column] for column in columns] == ["true", "", ""]
+
+    # 単一パスのジョブを含まない datafile も読める
+    datafile.write_text(
+        json.dumps([_csv_entry("-crf 23", {"second": 10.0, "time": "00:00:10", "speed": 2.0})]),
+    )
+    getcsv(f"{datafile}")
+    with (tmp_path / "data_gby_option.csv").open() as csvfile:
+        assert [row["single_pass"] for row in csv.DictReader(csvfile)] == ["false"]
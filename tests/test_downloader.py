@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+# To add a new cell, type '# %%'
+# To add a new markdown cell, type '# %% [markdown]'
+# %%
+"""Tests for the parallel, resumable downloader against a local HTTP server."""
+
+from collections.abc import Generator
+import hashlib
+from http.server import BaseHTTPRequestHandler
+from http.server import ThreadingHTTPServer
+from pathlib import Path
+import re
+import threading
+
+import pytest
+from pytest_mock import MockerFixture
+import requests
+
+from ffvqe.utils.downloader import download_file
+from ffvqe.utils.exceptions import VQEError
+
+CONTENT: bytes = bytes(range(256)) * 4096
+
+
+class _Handler(BaseHTTPRequestHandler):
+    """Serve ``CONTENT`` with optional Range support and dropped connections."""
+
+    server: "_Server"
+
+    def log_message(self, *_: object) -> None:
+        pass
+
+    def _headers(self, status: int, start: int, end: int) -> None:
+        self.send_response(status)
+        self.send_header("Content-Length", f"{end - start}")
+        if self.server.ranges:
+            self.send_header("Accept-Ranges", "bytes")
+        if status == 206:
+            self.send_header("Content-Range", f"bytes {start}-{end - 1}/{len(CONTENT)}")
+        self.end_headers()
+
+    def do_HEAD(self) -> None:
+        self._headers(200, 0, len(CONTENT))
+
+    def do_GET(self) -> None:
+        start, end, status = 0, len(CONTENT), 200
+        match = re.fullmatch(r"bytes=(\d+)-(\d+)", self.headers.get("Range", ""))
+        if match is not None and self.server.ranges:
+            start, end, status = int(match.group(1)), int(match.group(2)) + 1, 206
+        self.server.requests.append((start, end))
+        self._headers(status, start, end)
+
+        # 指定バイト数を送ったところで接続を切る
+        if self.server.drop_after is not None:
+            end = min(end, start + self.server.drop_after)
+        self.server.served += end - start
+        self.wfile.write(CONTENT[start:end])
+
+
+class _Server(ThreadingHTTPServer):
+    ranges: bool = True
+    drop_after: int | None = None
+    served: int = 0
+
+    def __init__(self) -> None:
+        super().__init__(("127.0.0.1", 0), _Handler)
+        self.requests: list[tuple[int, int]] = []
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}/ref.m2ts"
+
+
+@pytest.fixture
+def server(mocker: MockerFixture) -> Generator[_Server, None, None]:
+    """Run a local HTTP server and split downloads into 64 KiB segments."""
+    mocker.patch("ffvqe.utils.downloader.MIN_SEGMENT_SIZE", 64 * 1024)
+    mocker.patch("ffvqe.utils.downloader.DOWNLOAD_CHUNK_SIZE", 16 * 1024)
+    httpd = _Server()
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def test_download_in_parallel_segments(server: _Server, tmp_path: Path) -> None:
+    dest = tmp_path / "ref.m2ts"
+    progress: list[int] = []
+
+    digest = download_file(
+        server.url,
+        dest,
+        sha256=hashlib.sha256(CONTENT).hexdigest(),
+        progress=progress.append,
+    )
+
+    assert digest == hashlib.sha256(CONTENT).hexdigest()
+    assert dest.read_bytes() == CONTENT
+    assert sum(progress) == len(CONTENT)
+    assert len(server.requests) == 4
+    assert sorted(path.name for path in tmp_path.iterdir()) == ["ref.m2ts"]
+
+
+def test_download_resumes_partial_file(server: _Server, tmp_path: Path) -> None:
+    dest = tmp_path / "ref.m2ts"
+    server.drop_after = 96 * 1024
+    with pytest.raises(requests.RequestException):
+        download_file(server.url, dest)
+    assert Path(f"{dest}.part").exists()
+    assert Path(f"{dest}.part.json").exists()
+
+    server.drop_after = None
+    server.served = 0
+    digest = download_file(server.url, dest, sha256=hashlib.sha256(CONTENT).hexdigest())
+
+    assert digest == hashlib.sha256(CONTENT).hexdigest()
+    assert dest.read_bytes() == CONTENT
+    # 再開時は残りのバイトだけを取得する
+    assert server.served == len(CONTENT) - 4 * 96 * 1024
+
+
+def test_download_without_range_support(server: _Server, tmp_path: Path) -> None:
+    server.ranges = False
+    dest = tmp_path / "ref.m2ts"
+
+    assert download_file(server.url, dest) == hashlib.sha256(CONTENT).hexdigest()
+    assert server.requests == [(0, len(CONTENT))]
+    assert dest.read_bytes() == CONTENT
+
+
+def test_download_hash_mismatch(server: _Server, tmp_path: Path) -> None:
+    dest = tmp_path / "ref.m2ts"
+
+    with pytest.raises(VQEError, match="does not match"):
+        download_file(server.url, dest, sha256="invalid_hash")
+
+    assert list(tmp_path.iterdir()) == []
@@ -4,17 +4,29 @@
 # %%
 """Tests for encoding functions."""
 
+from collections.abc import Generator
 import json
+from pathlib import Path
+from typing import Any
+from unittest.mock import MagicMock
 from unittest.mock import mock_open
 from unittest.mock import patch
 
 import pytest
 
+from ffvqe.encoding.encoder import _build_ffmpeg_command
+from ffvqe.encoding.encoder import encode_videos
 from ffvqe.encoding.encoder import encoding
 from ffvqe.encoding.encoder import get_versions
 from ffvqe.encoding.encoder import getprobe
 from ffvqe.encoding.encoder import getvmaf
+from ffvqe.encoding.encoder import getvmaf_batch
+from ffvqe.encoding.encoder import probe_video
+from ffvqe.encoding.encoder import supports_single_pass
+from ffvqe.encoding.frame_info import FrameTypeCounter
+from ffvqe.encoding.frame_info import TraceHeadersParser
 from ffvqe.encoding.frame_info import getframeinfo
+from ffvqe.encoding.runner import ProcessResult
 
 
 @pytest.fixture
@@ -31,6 +43,23 @@ def mock_probe_log() -> dict:
     }
 
 
+@pytest.fixture
+def mock_run_process() -> Generator[MagicMock, None, None]:
+    """Mock the subprocess runner, reporting progress like FFmpeg."""
+
+    def _run(args: list[str], **kwargs: Any) -> ProcessResult:  # noqa: ANN401
+        if kwargs.get("progress") is not None:
+            for percent in (0.0, 50.0, 100.0):
+                kwargs["progress"](percent)
+        if kwargs.get("on_stdout") is not None:
+            for line in (b"I\n", b"P\n", b"B\n", b"I\n"):
+                kwargs["on_stdout"](line)
+        return ProcessResult(args, 0, b"", "", 1.0)
+
+    with patch("ffvqe.encoding.encoder.run_process", side_effect=_run) as mock:
+        yield mock
+
+
 @pytest.fixture
 def mock_encode_cfg() -> dict:
     """Create a mock encoding configuration for testing."""
@@ -55,40 +84,245 @@ def test_getframeinfo(mock_probe_log: dict) -> None:
         assert result["refs"] == 1
 
 
-def test_encoding(mock_encode_cfg: dict, mock_probe_log: dict) -> None:
-    """Test encoding function."""
+def _trace_log(packets: list[tuple[int, int]]) -> list[bytes]:
+    """Build trace_headers log lines for HEVC packets given as (pts, slice_type)."""
+    lines: list[bytes] = []
+    for pts, slice_type in packets:
+        lines.extend(
+            [
+                f"[trace_headers @ 0x55d0] Packet: 1234 bytes, pts {pts}, dts {pts - 2}.".encode(),
+                b"[trace_headers @ 0x55d0] 0           first_slice_segment_in_pic_flag   1 = 1",
+                f"[trace_headers @ 0x55d0] 17          slice_type  {slice_type:03b} = {slice_type}".encode(),
+                b"[trace_headers @ 0x55d0] 20          slice_temporal_mvp_enabled_flag   1 = 1",
+            ],
+        )
+    return lines
+
+
+def test_trace_headers_parser_matches_decoded_frames() -> None:
+    """Test that slice header picture types give the same result as decoding."""
+    # デコード順: I0 P4 B2 B1 B3 | CRA8 の先行 B (open GOP) B6 B5 B7 | P12
+    decode_order = [
+        (0, 2),
+        (4, 1),
+        (2, 0),
+        (1, 0),
+        (3, 0),
+        (8, 2),
+        (6, 0),
+        (5, 0),
+        (7, 0),
+        (12, 1),
+    ]
+    parser = TraceHeadersParser("hevc", FrameTypeCounter())
+    for line in _trace_log(decode_order):
+        parser.feed(line)
+    traced = parser.finish().stream({"has_b_frames": 2, "refs": 1})
+
+    decoded = FrameTypeCounter()
+    for _pts, slice_type in sorted(decode_order):
+        decoded.add({0: "B", 1: "P", 2: "I"}[slice_type])
+
+    assert traced == decoded.stream({"has_b_frames": 2, "refs": 1})
+    assert traced["gop"] == 8
+    assert traced["frames"] == {"I": 2, "P": 2, "B": 6, "total": 10}
+
+
+def test_trace_headers_parser_reads_captured_packet_lines() -> None:
+    """Test packet lines with the flags the trace_headers filter prints."""
+    # ffmpeg -bsf:v trace_headers の H.264 の出力から抜粋
+    log = b"""\
+[trace_headers @ 0x5619f4a2c4c0] Packet: 51267 bytes, key frame, pts 0, dts -2, duration 1.
+[trace_headers @ 0x5619f4a2c4c0] Slice Header
+[trace_headers @ 0x5619f4a2c4c0] 0           first_mb_in_slice                 1 = 0
+[trace_headers @ 0x5619f4a2c4c0] 1           slice_type                  0001000 = 7
+[trace_headers @ 0x5619f4a2c4c0] Packet: 9123 bytes, corrupt, pts 2, dts -1, duration 1.
+[trace_headers @ 0x5619f4a2c4c0] Slice Header
+[trace_headers @ 0x5619f4a2c4c0] 0           first_mb_in_slice                 1 = 0
+[trace_headers @ 0x5619f4a2c4c0] 1           slice_type                    00110 = 5
+[trace_headers @ 0x5619f4a2c4c0] Packet: 2211 bytes, no pts, dts 0, duration 1.
+[trace_headers @ 0x5619f4a2c4c0] Slice Header
+[trace_headers @ 0x5619f4a2c4c0] 0           first_mb_in_slice                 1 = 0
+[trace_headers @ 0x5619f4a2c4c0] 1           slice_type                    00111 = 6
+"""
+    parser = TraceHeadersParser("h264", FrameTypeCounter())
+    for line in log.splitlines(keepends=True):
+        parser.feed(line)
+
+    assert parser.finish().frames == {"I": 1, "P": 1, "B": 1}
+
+
+def test_probe_video_fast(mock_encode_cfg: dict) -> None:
+    """Test fast probe reads picture types from slice headers."""
+    probe_log = {"streams": [{"codec_name": "hevc", "has_b_frames": 2, "refs": 1}]}
+
+    def _run(args: list[str], **kwargs: Any) -> ProcessResult:  # noqa: ANN401
+        if kwargs.get("on_stderr") is not None:
+            for line in _trace_log([(0, 2), (2, 1), (1, 0)]):
+                kwargs["on_stderr"](line)
+        return ProcessResult(args, 0, b"", "", 1.0)
+
     with (
-        patch("subprocess.Popen") as mock_popen,
-        patch(
-            "ffmpeg_progress_yield.FfmpegProgress.run_command_with_progress",
-            return_value=[0, 50, 100],
-        ),
-        patch("pathlib.Path.open", mock_open(read_data=json.dumps(mock_probe_log))),
+        patch("ffvqe.encoding.encoder.run_process", side_effect=_run) as mock_run,
+        patch("pathlib.Path.open", mock_open(read_data=json.dumps(probe_log))),
     ):
-        mock_popen.return_value.poll.return_value = 0
+        result = probe_video(mock_encode_cfg, 10, fast=True)
+
+    probe_call, trace_call = mock_run.call_args_list
+    assert "frame=pict_type" not in probe_call.args[0]
+    assert "trace_headers" in trace_call.args[0]
+    assert result["elapsed_prbt"] == 2.0
+    assert result["stream"] == {
+        "gop": 3,
+        "has_b_frames": 2,
+        "refs": 1,
+        "frames": {"I": 1, "P": 1, "B": 1, "total": 3},
+    }
+
+
+def test_encoding(
+    mock_encode_cfg: dict,
+    mock_probe_log: dict,
+    mock_run_process: MagicMock,
+) -> None:
+    """Test encoding function."""
+    with patch("pathlib.Path.open", mock_open(read_data=json.dumps(mock_probe_log))):
         result = encoding(mock_encode_cfg, 10, 4)
         assert "commandline" in result
         assert "elapsed_time" in result
         assert "elapsed_prbt" in result
-        assert "stream" in result
+        assert result["stream"]["frames"] == {"I": 2, "P": 1, "B": 1, "total": 4}
+        assert result["stream"]["gop"] == 3
+
+    # エンコードは進捗付き、 probe はタイムアウト付きで実行される
+    encode_call, probe_call, frames_call = mock_run_process.call_args_list
+    assert encode_call.kwargs["env"]["FFREPORT"] == "file=output.log:level=40"
+    assert encode_call.kwargs["progress"] is not None
+    assert probe_call.args[0][0] == "ffprobe"
+    assert probe_call.kwargs["timeout"] == 10
+    # フレーム情報は JSON に書き出さず、パイプからストリームで数える
+    assert "frame=pict_type" not in probe_call.args[0]
+    assert frames_call.args[0][frames_call.args[0].index("-print_format") + 1] == "csv=p=0"
+    assert frames_call.kwargs["on_stdout"] is not None
+
+
+def test_build_ffmpeg_command_limits_encoder_threads(mock_encode_cfg: dict) -> None:
+    """Test that a shared core budget limits the encoder, not only the decoder."""
+    encode_cfg = {**mock_encode_cfg, "outfile": {"options": "-crf 23", "filename": "output"}}
 
+    # 単独実行時は従来どおり入力の前 (デコーダー) にだけ指定する
+    cmd = _build_ffmpeg_command(encode_cfg, 4)
+    assert cmd.count("-threads") == 1
+    assert cmd.index("-threads") < cmd.index("-i")
 
-def test_getvmaf(mock_encode_cfg: dict) -> None:
+    # コアを分け合う場合は出力の前 (エンコーダー) にも指定する
+    cmd = _build_ffmpeg_command(encode_cfg, 4, encoder_threads=4)
+    threads = [index for index, arg in enumerate(cmd) if arg == "-threads"]
+    assert len(threads) == 2
+    assert threads[0] < cmd.index("-i") < threads[1] < cmd.index("-c:v")
+    assert cmd[threads[1] + 1] == "4"
+    assert cmd[-1] == "output.mkv"
+
+
+def test_build_ffmpeg_command_single_pass(mock_encode_cfg: dict) -> None:
+    """Test single-pass encode-and-score command."""
+    assert supports_single_pass(mock_encode_cfg)
+    assert not supports_single_pass({**mock_encode_cfg, "hwaccels": "-hwaccel qsv"})
+
+    cmd = _build_ffmpeg_command(mock_encode_cfg, 4, vmaf_cpu_count=8)
+    # リファレンスのデコードは 1 回のみ
+    assert cmd.count("-i") == 1
+    assert cmd[cmd.index("-dec") + 1] == "0:0"
+    assert cmd.index("output.mkv") < cmd.index("-dec")
+    # エンコード出力のストリーム選択は単独エンコードと同じで、音声も残す
+    assert cmd.index("-map") > cmd.index("output.mkv")
+    lavfi = cmd[cmd.index("-filter_complex") + 1]
+    assert lavfi.startswith("[dec:0]")
+    # getvmaf の入力の -r 29.97 と同じく、フレーム番号でタイムスタンプを付ける
+    assert "[0:v:0]settb=AVTB,setpts=N/(29.97*TB)" in lavfi
+    assert "log_path=output_vmaf.json:n_threads=8:" in lavfi
+    assert cmd[-3:] == ["-f", "null", "-"]
+
+    assert "-dec" not in _build_ffmpeg_command(mock_encode_cfg, 4)
+
+
+def test_encode_videos_splits_time_by_benchmark(mock_encode_cfg: dict, tmp_path: Path) -> None:
+    """Test encoding several outputs of one reference in one run."""
+    encode_cfgs = [
+        {
+            **mock_encode_cfg,
+            "outfile": {**mock_encode_cfg["outfile"], "filename": f"{tmp_path / f'out{i}'}"},
+            "preset": preset,
+        }
+        for i, preset in enumerate(("fast", "slow"))
+    ]
+
+    def _run(args: list[str], **kwargs: Any) -> ProcessResult:  # noqa: ANN401
+        Path(f"{tmp_path / 'out0'}.log").write_text("report")
+        for line in (
+            b"bench:     1000 user        0 sys     1000 real encode_video 0.0 \n",
+            b"bench:     3000 user        0 sys     3000 real encode_video 1.0 \n",
+            b"bench:      500 user        0 sys      500 real decode_video 0.0 \n",
+        ):
+            kwargs["on_stderr"](line)
+        return ProcessResult(args, 0, b"", "", 8.0)
+
+    with patch("ffvqe.encoding.encoder.run_process", side_effect=_run) as mock:
+        results = encode_videos(encode_cfgs, 4, encoder_threads=4)
+
+    cmd = mock.call_args.args[0]
+    # リファレンスのデコードは 1 回で、出力ごとにエンコーダーを指定する
+    assert cmd.count("-i") == 1
+    assert "-benchmark_all" in cmd
+    assert cmd.count("-c:v") == 2
+    # 入力の -threads 4 と、2 つのエンコーダーで分け合う -threads 2
+    assert [cmd[i + 1] for i, arg in enumerate(cmd) if arg == "-threads"] == ["4", "2", "2"]
+    assert cmd.index("fast") < cmd.index(f"{tmp_path / 'out0'}.mkv") < cmd.index("slow")
+    assert cmd[-1] == f"{tmp_path / 'out1'}.mkv"
+    # 実行時間をエンコード時間の比率で分ける
+    assert [result["elapsed_time"] for result in results] == [2.0, 6.0]
+    assert Path(f"{tmp_path / 'out1'}.log").read_text() == "report"
+
+
+def test_getvmaf(mock_encode_cfg: dict, mock_run_process: MagicMock) -> None:
     """Test getvmaf function."""
-    with patch(
-        "ffmpeg_progress_yield.FfmpegProgress.run_command_with_progress",
-        return_value=[0, 50, 100],
-    ):
-        result = getvmaf(mock_encode_cfg, 4)
-        assert "commandline" in result
-        assert "elapsed_time" in result
+    result = getvmaf(mock_encode_cfg, 4)
+    assert "commandline" in result
+    assert "elapsed_time" in result
+    assert mock_run_process.call_args.kwargs["progress"] is not None
+
+
+def test_getvmaf_batch(mock_encode_cfg: dict, mock_run_process: MagicMock) -> None:
+    """Test scoring several encodes of one reference in one run."""
+    encode_cfgs = [
+        {**mock_encode_cfg, "outfile": {**mock_encode_cfg["outfile"], "filename": f"out{i}"}}
+        for i in range(3)
+    ]
+    results = getvmaf_batch(encode_cfgs, 6)
+
+    mock_run_process.assert_called_once()
+    cmd = mock_run_process.call_args.args[0]
+    # リファレンスは最後の入力として 1 回だけデコードし、split で分ける
+    assert cmd.count("-i") == 4
+    assert cmd[cmd.index("-filter_complex") - 1] == mock_encode_cfg["infile"]["filename"]
+    lavfi = cmd[cmd.index("-filter_complex") + 1]
+    assert lavfi.startswith("[3:v]split=3[ref0][ref1][ref2];")
+    for i in range(3):
+        assert f"log_path=out{i}_vmaf.json:n_threads=2:" in lavfi
+        assert cmd.count(f"[vmaf{i}]") == 1
+    assert cmd.count("null") == 3
+    assert [result["commandline"] for result in results] == [" ".join(cmd)] * 3
 
 
-def test_getprobe() -> None:
+def test_getprobe(mock_run_process: MagicMock) -> None:
     """Test getprobe function."""
-    with patch("subprocess.run") as mock_run:
-        getprobe("dummy_video.mp4")
-        mock_run.assert_called_once()
+    getprobe("dummy_video.mp4")
+    mock_run_process.assert_called_once()
+    assert mock_run_process.call_args.args[0][-3:] == [
+        "-o",
+        "dummy_video_ffprobe.json",
+        "dummy_video.mp4",
+    ]
 
 
 def test_get_versions() -> None:
@@ -97,12 +331,34 @@ def test_get_versions() -> None:
         "program_version": "n7.1",
         "library_versions": [{"name": "libavcodec", "ident": "Lavc61.19.100"}],
     }
-    with (
-        patch("subprocess.run"),
-        patch("pathlib.Path.open", mock_open(read_data=json.dumps(mock_versions_log))),
-        patch("pathlib.Path.unlink"),
+    with patch(
+        "ffvqe.encoding.encoder.run_process",
+        return_value=ProcessResult([], 0, json.dumps(mock_versions_log).encode(), "", 0.1),
     ):
         result = get_versions("dummy_config")
         assert result["ffmpege"]["program_version"] == "n7.1"
         assert result["ffmpege"]["library_versions"][0]["name"] == "libavcodec"
         assert result["ffmpege"]["library_versions"][0]["ident"] == "Lavc61.19.100"
+
+
+def test_get_versions_cached_by_binary(tmp_path: Path) -> None:
+    """Test that get_versions runs ffprobe again only when the binary changes."""
+    ffprobe = tmp_path / "ffprobe"
+    ffprobe.write_bytes(b"v1")
+    versions_log = {"program_version": "n7.1", "library_versions": []}
+
+    with (
+        patch("ffvqe.encoding.encoder.shutil.which", return_value=f"{ffprobe}"),
+        patch(
+            "ffvqe.encoding.encoder.run_process",
+            return_value=ProcessResult([], 0, json.dumps(versions_log).encode(), "", 0.1),
+        ) as mock_run,
+    ):
+        first = get_versions("dummy_config")
+        assert get_versions("dummy_config") == first
+        assert mock_run.call_count == 1
+
+        # バイナリが更新されたら取り直す
+        ffprobe.write_bytes(b"v2-updated")
+        get_versions("dummy_config")
+        assert mock_run.call_count == 2
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+# To add a new cell, type '# %%'
+# To add a new markdown cell, type '# %% [markdown]'
+# %%
+"""Tests for the transactional job store."""
+
+from contextlib import closing
+import json
+import os
+from pathlib import Path
+import sqlite3
+import time
+
+from ffvqe.data.job_store import JobStore
+from ffvqe.data.job_store import exported_json
+from ffvqe.data.job_store import read_encodes
+from ffvqe.data.job_store import store_path
+
+
+def _encodes() -> list[dict]:
+    return [
+        {"id": "a", "outfile": {"hash": ""}},
+        {"id": "b", "outfile": {"hash": ""}},
+    ]
+
+
+def test_store_is_seeded_from_json_datafile(tmp_path: Path) -> None:
+    datafile = tmp_path / "data.json"
+    datafile.write_text(json.dumps(_encodes()))
+
+    with JobStore(datafile) as store:
+        assert store.path == tmp_path / "data.sqlite3"
+        assert store.load() == _encodes()
+
+
+def test_update_writes_single_entry_and_export_keeps_json(tmp_path: Path) -> None:
+    datafile = tmp_path / "data.json"
+    datafile.write_text(json.dumps(_encodes()))
+
+    with JobStore(datafile) as store:
+        store.update(1, {"id": "b", "outfile": {"hash": "done"}})
+        # エクスポートするまで JSON は変わらない
+        assert json.loads(datafile.read_text()) == _encodes()
+        store.export_json()
+
+    expected = _encodes()
+    expected[1]["outfile"]["hash"] = "done"
+    assert json.loads(datafile.read_text()) == expected
+    assert read_encodes(datafile) == expected
+    assert sorted(path.name for path in tmp_path.iterdir()) == ["data.json", "data.sqlite3"]
+
+
+def test_store_wins_over_stale_json(tmp_path: Path) -> None:
+    datafile = tmp_path / "data.json"
+    datafile.write_text(json.dumps(_encodes()))
+    with JobStore(datafile) as store:
+        store.replace([{"id": "c"}])
+
+    assert read_encodes(datafile) == [{"id": "c"}]
+    with exported_json(datafile) as jsonfile:
+        assert jsonfile != str(datafile)
+        assert json.loads(Path(jsonfile).read_text()) == [{"id": "c"}]
+    assert not Path(jsonfile).exists()
+
+
+def test_read_encodes_without_store(tmp_path: Path) -> None:
+    datafile = tmp_path / "data.json"
+    datafile.write_text(json.dumps(_encodes()))
+
+    assert read_encodes(datafile) == _encodes()
+    with exported_json(datafile) as jsonfile:
+        assert jsonfile == str(datafile)
+    assert not store_path(datafile).exists()
+
+
+def test_changed_json_reseeds_store(tmp_path: Path) -> None:
+    datafile = tmp_path / "data.json"
+    datafile.write_text(json.dumps(_encodes()))
+    with JobStore(datafile) as store:
+        store.update(0, {"id": "a", "outfile": {"hash": "done"}})
+        store.export_json()
+
+    # 自分のエクスポートからは再読み込みしない
+    with JobStore(datafile) as store:
+        assert store.load()[0]["outfile"]["hash"] == "done"
+
+    # 編集 (git pull や復元) された JSON は古い store より優先する
+    datafile.write_text(json.dumps([{"id": "pulled"}]))
+    assert read_encodes(datafile) == [{"id": "pulled"}]
+    with exported_json(datafile) as jsonfile:
+        assert json.loads(Path(jsonfile).read_text()) == [{"id": "pulled"}]
+
+
+def _forget_datafile_hash(datafile: Path) -> None:
+    # ハッシュを記録する前に作られた store を再現する
+    with closing(sqlite3.connect(store_path(datafile))) as con, con:
+        con.execute("DELETE FROM meta")
+
+
+def test_store_without_recorded_hash_uses_newer_file(tmp_path: Path) -> None:
+    datafile = tmp_path / "data.json"
+    datafile.write_text(json.dumps(_encodes()))
+    with JobStore(datafile) as store:
+        store.replace([{"id": "store"}])
+    _forget_datafile_hash(datafile)
+
+    # store の方が新しければ store を使う
+    os.utime(datafile, (0, 0))
+    assert read_encodes(datafile) == [{"id": "store"}]
+
+    # JSON の方が新しければ JSON から作り直す
+    _forget_datafile_hash(datafile)
+    os.utime(datafile, (time.time() + 60, time.time() + 60))
+    assert read_encodes(datafile) == _encodes()
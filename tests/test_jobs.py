@@ -0,0 +1,227 @@
+#!/usr/bin/env python3
+# To add a new cell, type '# %%'
+# To add a new markdown cell, type '# %% [markdown]'
+# %%
+"""Tests for per-job pipeline stages."""
+
+from argparse import Namespace
+import json
+from pathlib import Path
+from typing import Any
+from unittest.mock import MagicMock
+
+from pytest_mock import MockerFixture
+
+from ffvqe.encoding.jobs import EncodeJob
+from ffvqe.encoding.jobs import _encode_speed
+from ffvqe.encoding.jobs import _encoder_threads
+from ffvqe.encoding.jobs import encode_batch_key
+from ffvqe.encoding.jobs import stage_encode
+from ffvqe.encoding.jobs import stage_encode_batch
+from ffvqe.encoding.jobs import stage_probe
+from ffvqe.encoding.jobs import stage_vmaf
+from ffvqe.encoding.jobs import stage_vmaf_batch
+from ffvqe.encoding.reference_probe import ReferenceProbes
+from ffvqe.encoding.scheduler import JobSlot
+
+
+def _encode_cfg(outfile: Path) -> dict:
+    return {
+        "codec": "libx264",
+        "hwaccels": "",
+        "infile": {"filename": "input.m2ts", "option": ""},
+        "outfile": {"filename": f"{outfile}", "hash": ""},
+    }
+
+
+def test_resume_skips_finished_stages(tmp_path: Path, mocker: MockerFixture) -> None:
+    outfile = tmp_path / "out"
+    Path(f"{outfile}.mkv").write_bytes(b"mkv")
+    Path(f"{outfile}_ffprobe.json").write_text(json.dumps({"format": {}}))
+
+    encode = _encode_cfg(outfile)
+    encode["stages"] = {
+        "encoded": {
+            "done": True,
+            "artifact": f"{outfile}.mkv",
+            "commandline": "ffmpeg",
+            "elapsed_time": 10.0,
+        },
+        "probed": {
+            "done": True,
+            "artifact": f"{outfile}_ffprobe.json",
+            "elapsed_prbt": 1.0,
+            "stream": {"frames": {"total": 1}},
+        },
+        # VMAF ログが無いので scored はやり直し
+        "scored": {"done": True, "artifact": f"{outfile}_vmaf.json"},
+    }
+    checkpoint = MagicMock()
+    job = EncodeJob(0, encode, checkpoint=checkpoint)
+
+    assert job.done("encoded")
+    assert job.done("probed")
+    assert not job.done("scored")
+    assert job.encode_rep == {"commandline": "ffmpeg", "elapsed_time": 10.0}
+
+    mock_encode = mocker.patch("ffvqe.encoding.jobs.encode_video")
+    mock_probe = mocker.patch("ffvqe.encoding.jobs.probe_video")
+    mocker.patch("ffvqe.encoding.jobs.getfilehash", return_value="hash")
+    mock_vmaf = mocker.patch(
+        "ffvqe.encoding.jobs.getvmaf",
+        return_value={"commandline": "vmaf", "elapsed_time": 2.0},
+    )
+    slot = JobSlot(cores=4, position=1)
+    args = MagicMock(jobs=1, pipeline=False, single_pass=False)
+    for stage in (stage_encode, stage_probe, stage_vmaf):
+        job = stage(job, slot, args)
+
+    mock_encode.assert_not_called()
+    mock_probe.assert_not_called()
+    mock_vmaf.assert_called_once()
+    assert job.hash == "hash"
+    assert job.encode["stages"]["scored"]["elapsed_time"] == 2.0
+    # hashed と scored の 2 回チェックポイントされる
+    assert checkpoint.call_count == 2
+
+
+def test_resume_reencodes_when_output_is_missing(tmp_path: Path) -> None:
+    outfile = tmp_path / "out"
+    Path(f"{outfile}_ffprobe.json").write_text(json.dumps({"format": {}}))
+
+    encode = _encode_cfg(outfile)
+    encode["stages"] = {
+        "encoded": {"done": True, "artifact": f"{outfile}.mkv"},
+        "probed": {"done": True, "artifact": f"{outfile}_ffprobe.json"},
+    }
+    job = EncodeJob(0, encode)
+
+    assert encode["stages"]["encoded"]["done"] is True
+    assert job.encode["stages"] == {}
+
+
+def test_encode_stage_hashes_output(tmp_path: Path, mocker: MockerFixture) -> None:
+    outfile = tmp_path / "out"
+    job = EncodeJob(0, _encode_cfg(outfile))
+    job.base_probe = {"format": {"duration": "1.0"}}
+
+    mocker.patch(
+        "ffvqe.encoding.jobs.encode_video",
+        return_value={"commandline": "ffmpeg", "elapsed_time": 1.0},
+    )
+    mocker.patch("ffvqe.encoding.jobs.probe_video", return_value={"stream": {}})
+    mock_hash = mocker.patch("ffvqe.encoding.jobs.getfilehash", return_value="hash")
+    slot = JobSlot(cores=4, position=1)
+    args = MagicMock(jobs=1, pipeline=False, single_pass=False, fast_probe=False, encode_chunks=1)
+
+    job = stage_encode(job, slot, args)
+    # エンコード直後にハッシュを計算する
+    assert job.done("hashed")
+    assert job.hash == "hash"
+
+    job = stage_probe(job, slot, args)
+    mock_hash.assert_called_once_with(f"{outfile}.mkv")
+
+
+def test_single_pass_does_not_report_encode_speed(tmp_path: Path, mocker: MockerFixture) -> None:
+    job = EncodeJob(0, {**_encode_cfg(tmp_path / "out"), "preset": "medium"})
+    job.base_probe = {"format": {"duration": "1.0"}}
+    mocker.patch(
+        "ffvqe.encoding.jobs.encode_video",
+        return_value={"commandline": "ffmpeg", "elapsed_time": 4.0},
+    )
+    mocker.patch("ffvqe.encoding.jobs.getfilehash", return_value="hash")
+    args = MagicMock(jobs=1, pipeline=False, single_pass=True, encode_chunks=1)
+
+    job = stage_encode(job, JobSlot(cores=4, position=1), args)
+
+    assert job.done("scored")
+    # 実行時間に VMAF も含まれるので、エンコード速度は記録しない
+    assert _encode_speed(job, 1.0) == {"fps": None, "speed": None, "includes_vmaf": True}
+
+
+def test_encoder_threads_only_when_cores_are_shared() -> None:
+    def _args(**kwargs: Any) -> Namespace:  # noqa: ANN401
+        return Namespace(**{"jobs": 1, "pipeline": False, "cpu_budget": None, **kwargs})
+
+    # 単独実行時はエンコーダーにスレッド数を指定しない
+    assert _encoder_threads(_args(ffmpeg_threads=8)) is None
+    assert _encoder_threads(_args(ffmpeg_threads=8, jobs=2)) == 8
+    assert _encoder_threads(_args(ffmpeg_threads=8, pipeline=True)) == 8
+    assert _encoder_threads(_args(ffmpeg_threads=8, cpu_budget=16)) == 8
+
+
+def test_encode_batch_encodes_software_jobs_in_one_run(
+    tmp_path: Path,
+    mocker: MockerFixture,
+) -> None:
+    jobs = [EncodeJob(index, _encode_cfg(tmp_path / f"out{index}")) for index in range(2)]
+    for job in jobs:
+        job.base_probe = {"format": {"duration": "1.0"}}
+    mock_batch = mocker.patch(
+        "ffvqe.encoding.jobs.encode_videos",
+        return_value=[{"commandline": "ffmpeg", "elapsed_time": 1.0}] * 2,
+    )
+    mocker.patch("ffvqe.encoding.jobs.getfilehash", return_value="hash")
+    args = MagicMock(
+        jobs=1,
+        pipeline=True,
+        single_pass=False,
+        ffmpeg_threads=4,
+        encode_chunks=1,
+    )
+
+    # QSV コーデックや single-pass のジョブはまとめない
+    assert encode_batch_key(jobs[0], args) == ("input.m2ts", "", "")
+    assert encode_batch_key(EncodeJob(2, {**jobs[0].encode, "codec": "hevc_qsv"}), args) is None
+    assert encode_batch_key(jobs[0], MagicMock(single_pass=True, encode_chunks=1)) is None
+
+    assert stage_encode_batch(jobs, JobSlot(cores=4, position=1), args) == jobs
+    mock_batch.assert_called_once()
+    assert len(mock_batch.call_args.kwargs["encode_cfgs"]) == 2
+    assert mock_batch.call_args.kwargs["encoder_threads"] == 4
+    assert all(job.done("hashed") and job.hash == "hash" for job in jobs)
+
+
+def test_vmaf_batch_scores_unscored_jobs_in_one_run(tmp_path: Path, mocker: MockerFixture) -> None:
+    jobs = [EncodeJob(index, _encode_cfg(tmp_path / f"out{index}")) for index in range(3)]
+    Path(f"{tmp_path / 'out0'}_vmaf.json").write_text("{}")
+    jobs[0].mark("scored", artifact=f"{tmp_path / 'out0'}_vmaf.json", elapsed_time=9.0)
+
+    mock_batch = mocker.patch(
+        "ffvqe.encoding.jobs.getvmaf_batch",
+        return_value=[{"commandline": "vmaf", "elapsed_time": 1.0}] * 2,
+    )
+    mock_vmaf = mocker.patch("ffvqe.encoding.jobs.getvmaf")
+    args = MagicMock(jobs=1, pipeline=True, single_pass=False)
+
+    assert stage_vmaf_batch(jobs, JobSlot(cores=4, position=1), args) == jobs
+
+    # 計測済みのジョブを除いた 2 件を 1 回の FFmpeg で計測する
+    mock_vmaf.assert_not_called()
+    encode_cfgs = mock_batch.call_args.kwargs["encode_cfgs"]
+    assert [cfg["outfile"]["filename"] for cfg in encode_cfgs] == [
+        f"{tmp_path / 'out1'}",
+        f"{tmp_path / 'out2'}",
+    ]
+    assert mock_batch.call_args.kwargs["cpu_count"] == 4
+    assert all(job.done("scored") for job in jobs[1:])
+    assert jobs[0].encode["stages"]["scored"]["elapsed_time"] == 9.0
+
+
+def test_reference_probe_parsed_once_and_shared_by_basehash(tmp_path: Path) -> None:
+    basefile = tmp_path / "ref.m2ts"
+    probe_path = tmp_path / "ref_ffprobe.json"
+    probe_path.write_text(json.dumps({"format": {"duration": "60.0", "size": "1000"}}))
+    basehash = "0" * 63 + "1"
+
+    probes = ReferenceProbes({f"{basefile}": basehash})
+    first = probes.get(f"{basefile}")
+    # 1 回目で読み込んだ後は ffprobe.json を消しても memo から返る
+    probe_path.unlink()
+    assert probes.get(f"{basefile}") is first
+    assert first["format"]["duration"] == "60.0"
+
+    # 別の実験で別のパスにある同じリファレンスはキャッシュから読み込む
+    moved = ReferenceProbes({f"{tmp_path / 'moved' / 'ref.m2ts'}": basehash})
+    assert moved.get(f"{tmp_path / 'moved' / 'ref.m2ts'}") == first
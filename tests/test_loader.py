@@ -6,8 +6,11 @@ This module verifies correct behavior of load_config under various scenarios.
 
 from collections.abc import Callable
 from collections.abc import Generator
+import hashlib
 import json
+import os
 from pathlib import Path
+import time
 from typing import Any
 from typing import TypeVar
 from unittest.mock import MagicMock
@@ -15,7 +18,11 @@ from unittest.mock import patch
 
 import pytest
 
+from ffvqe.config.loader import _generate_encoding_configs
+from ffvqe.config.loader import _verify_references
 from ffvqe.config.loader import load_config
+from ffvqe.config.loader import read_config
+from ffvqe.data.result_cache import ResultCache
 from ffvqe.utils.exceptions import VQEError
 from tests.file_io_helpers import cleanup_blacklisted_files
 from tests.file_io_helpers import create_dummy_exists
@@ -32,6 +39,7 @@ class Args:
         ffmpeg_threads (int): Number of ffmpeg threads, default is 4.
         overwrite (bool): Whether to allow overwriting files, default is False.
         auto_download_references (bool): Whether to automatically download reference files, default is False.
+        no_result_cache (bool): Whether to ignore results of other configs, default is False.
     """
 
     def __init__(self) -> None:
@@ -40,6 +48,7 @@ class Args:
         self.ffmpeg_threads: int = 4
         self.overwrite: bool = False
         self.auto_download_references: bool = False
+        self.no_result_cache: bool = False
 
 
 def is_blacklisted_file(path: Path) -> bool:
@@ -93,14 +102,14 @@ def _setup_mock_exists(original_exists: Callable[[Path], bool]) -> Callable[[Pat
     return mock_exists
 
 
-def _create_mock_getfilehash() -> Callable[[str], str]:
+def _create_mock_getfilehash() -> Callable[..., str]:
     """getfilehash 関数のモックを作成する。
 
     Returns:
         モック化された getfilehash 関数
     """
 
-    def mock_getfilehash(filename: str) -> str:
+    def mock_getfilehash(filename: str, **_: object) -> str:
         # リファレンスファイルのハッシュ値を辞書で管理
         hash_map = {
             "ABBB_MPEG-2_1920x1080_30p.m2ts": "f005791ab9cabdc4468317d5d58becf3eb6228a49c6fad09e0923685712af769",
@@ -145,8 +154,11 @@ def disable_file_io(monkeypatch: pytest.MonkeyPatch) -> None:
     # getfilehash 関数をモック
     monkeypatch.setattr("ffvqe.utils.file_operations.getfilehash", _create_mock_getfilehash())
 
+    # JobStore をモック (SQLite ファイルを作成しない)
+    monkeypatch.setattr("ffvqe.config.loader.JobStore", MagicMock())
+
     # getprobe 関数をモック
-    with patch("ffvqe.config.loader.getprobe") as mock_getprobe:
+    with patch("ffvqe.encoding.encoder.getprobe") as mock_getprobe:
         mock_getprobe.return_value = None
 
     cleanup_blacklisted_files()
@@ -473,3 +485,248 @@ def test_load_config_with_codec_and_all_types(
     assert len(patterns) > 0
     assert all(p["codec"] == "h264_qsv" for p in patterns)
     assert len({p["type"] for p in patterns}) > 1
+
+
+@pytest.fixture
+def real_exists(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Let Path.exists see the real files instead of the mocked references."""
+    monkeypatch.setattr(Path, "exists", os.path.exists)
+
+
+@pytest.mark.usefixtures("real_exists")
+def test_verify_references_in_parallel(tmp_path: Path) -> None:
+    """Test that every reference is hashed and probed."""
+    references = []
+    for name in ("a", "b", "c"):
+        basefile = tmp_path / f"{name}.mp4"
+        basefile.write_bytes(name.encode())
+        references.append(
+            {
+                "name": name,
+                "basefile": f"{basefile}",
+                "basehash": hashlib.sha256(name.encode()).hexdigest(),
+            },
+        )
+
+    with patch("ffvqe.encoding.encoder.getprobe") as mock_getprobe:
+        _verify_references({"configs": {"references": references}})
+
+    assert sorted(call.kwargs["videofile"] for call in mock_getprobe.call_args_list) == [
+        ref["basefile"] for ref in references
+    ]
+
+
+@pytest.mark.usefixtures("real_exists")
+def test_verify_references_fails_fast(tmp_path: Path) -> None:
+    """Test that a hash mismatch cancels the references still being hashed."""
+    references = []
+    for name in ("slow", "bad"):
+        basefile = tmp_path / f"{name}.mp4"
+        basefile.write_bytes(b"x")
+        references.append({"name": name, "basefile": f"{basefile}", "basehash": "expected"})
+    aborted: list[str] = []
+
+    def slow_getfilehash(filename: str, *, progress: Callable[[int], None], **_: object) -> str:
+        if filename.endswith("bad.mp4"):
+            return "mismatch"
+        deadline = time.monotonic() + 5
+        try:
+            while time.monotonic() < deadline:
+                progress(0)
+                time.sleep(0.01)
+        except Exception:
+            aborted.append(filename)
+            raise
+        return "expected"
+
+    with (
+        patch("ffvqe.config.loader.getfilehash", side_effect=slow_getfilehash),
+        patch("ffvqe.encoding.encoder.getprobe") as mock_getprobe,
+        pytest.raises(VQEError, match="bad, basehash not match"),
+    ):
+        _verify_references({"configs": {"references": references}})
+
+    assert aborted == [references[0]["basefile"]]
+    mock_getprobe.assert_not_called()
+
+
+@pytest.mark.usefixtures("real_exists")
+def test_verify_references_reuses_cached_probe(tmp_path: Path) -> None:
+    """Test that a reference probed under one path is not probed again under another."""
+    content = b"reference probed once"
+    basehash = hashlib.sha256(content).hexdigest()
+    references = []
+    for directory in ("first", "second"):
+        basefile = tmp_path / directory / "ref.mp4"
+        basefile.parent.mkdir()
+        basefile.write_bytes(content)
+        references.append({"name": directory, "basefile": f"{basefile}", "basehash": basehash})
+
+    def fake_getprobe(videofile: str) -> None:
+        Path(videofile).with_name("ref_ffprobe.json").write_text(
+            json.dumps({"format": {"filename": videofile, "duration": "60.0"}}),
+        )
+
+    with patch("ffvqe.encoding.encoder.getprobe", side_effect=fake_getprobe) as mock_getprobe:
+        for ref in references:
+            _verify_references({"configs": {"references": [ref]}})
+
+    mock_getprobe.assert_called_once_with(videofile=references[0]["basefile"])
+    restored = json.loads((tmp_path / "second" / "ref_ffprobe.json").read_text())
+    assert restored["format"] == {"filename": references[1]["basefile"], "duration": "60.0"}
+
+
+def test_read_config_is_read_only(tmp_path: Path) -> None:
+    """Test that read_config only parses the YAML file."""
+    configfile = tmp_path / "settings.yml"
+    configfile.write_text(
+        "configs:\n"
+        "  datafile: ./videos/dist/settings/data0123.json\n"
+        "  references:\n"
+        "    - name: ref\n"
+        "      basefile: ./videos/source/ref.m2ts\n"
+        "      basehash: abc\n",
+    )
+    before = configfile.stat().st_mtime_ns
+
+    with (
+        patch("ffvqe.config.loader.getfilehash") as mock_getfilehash,
+        patch("ffvqe.encoding.encoder.getprobe") as mock_getprobe,
+        patch("ffvqe.encoding.encoder.get_versions") as mock_get_versions,
+    ):
+        result = read_config(f"{configfile}")
+
+    assert result["datafile"] == "./videos/dist/settings/data0123.json"
+    assert result["configs"]["references"][0]["name"] == "ref"
+    mock_getfilehash.assert_not_called()
+    mock_getprobe.assert_not_called()
+    mock_get_versions.assert_not_called()
+    assert configfile.stat().st_mtime_ns == before
+    assert [path.name for path in tmp_path.iterdir()] == ["settings.yml"]
+
+
+def test_read_config_requires_datafile(tmp_path: Path) -> None:
+    """Test that read_config fails instead of creating a configuration."""
+    with pytest.raises(VQEError, match="Config file not found"):
+        read_config(f"{tmp_path / 'missing.yml'}")
+
+    configfile = tmp_path / "settings.yml"
+    configfile.write_text("configs:\n  datafile: ''\n")
+    with pytest.raises(VQEError, match="datafile is not specified"):
+        read_config(f"{configfile}")
+
+
+def _result_cache_configs(
+    comments: str,
+    basefile: str = "./videos/source/result_cache.mp4",
+    program_version: str = "result_cache_version",
+) -> dict[str, Any]:
+    return {
+        "configs": {
+            "environment": {
+                "ffmpege": {"program_version": program_version, "library_versions": []},
+                "packages": {},
+            },
+            "patterns": [
+                {
+                    "codec": "libx264",
+                    "type": "crf",
+                    "comments": comments,
+                    "presets": ["medium"],
+                    "hwaccels": "",
+                    "infile": {"option": ""},
+                    "outfile": {"options": ["-crf 23 -result-cache-test"]},
+                },
+            ],
+            "references": [
+                {
+                    "name": "ref",
+                    "type": "anime",
+                    "basefile": basefile,
+                    "basehash": "0" * 64,
+                },
+            ],
+        },
+    }
+
+
+def test_generate_encoding_configs_reuses_results(mock_args: Args) -> None:
+    """Test that a job completed by one config is filled in for another config."""
+    first = _generate_encoding_configs(_result_cache_configs("first"), [], "first.yml", mock_args)
+    assert first[0]["outfile"]["hash"] == ""
+    first[0]["outfile"]["hash"] = "outhash"
+    first[0]["results"]["vmaf"]["pooled_metrics"]["vmaf"]["mean"] = 95.0
+    first[0]["commandline"] = (
+        f"ffmpeg -i {first[0]['infile']['filename']} {first[0]['outfile']['filename']}"
+    )
+    with ResultCache(_result_cache_configs("first")["configs"]["environment"]) as result_cache:
+        result_cache.put("0" * 64, first[0])
+
+    second = _generate_encoding_configs(
+        _result_cache_configs("second"),
+        [],
+        "second.yml",
+        mock_args,
+    )
+    assert second[0]["id"] == first[0]["id"]
+    assert second[0]["outfile"]["hash"] == "outhash"
+    assert second[0]["results"]["vmaf"]["pooled_metrics"]["vmaf"]["mean"] == 95.0
+    assert second[0]["comments"] == "second"
+    # 出力先はこの設定ファイルのもの
+    assert second[0]["outfile"]["filename"].startswith("videos/dist/second/")
+    assert second[0]["commandline"].endswith(second[0]["outfile"]["filename"])
+
+    # 別のパスに置いた同じ内容のリファレンスでも流用する
+    moved = _generate_encoding_configs(
+        _result_cache_configs("moved", "./videos/source/moved/result_cache.mp4"),
+        [],
+        "moved.yml",
+        mock_args,
+    )
+    assert moved[0]["id"] != first[0]["id"]
+    assert moved[0]["outfile"]["hash"] == "outhash"
+    assert moved[0]["infile"]["filename"] == "./videos/source/moved/result_cache.mp4"
+    assert "./videos/source/moved/result_cache.mp4" in moved[0]["commandline"]
+
+    # 別の FFmpeg でビルドした環境の結果は流用しない
+    upgraded = _generate_encoding_configs(
+        _result_cache_configs("upgraded", program_version="other_version"),
+        [],
+        "upgraded.yml",
+        mock_args,
+    )
+    assert upgraded[0]["outfile"]["hash"] == ""
+
+    # 完了済みの datafile の結果は、生成した環境が分からないため登録しない
+    upgraded[0]["outfile"]["hash"] = "stalehash"
+    _generate_encoding_configs(
+        _result_cache_configs("upgraded", program_version="other_version"),
+        upgraded,
+        "upgraded.yml",
+        mock_args,
+    )
+    copied = _generate_encoding_configs(
+        _result_cache_configs("copied", program_version="other_version"),
+        [],
+        "copied.yml",
+        mock_args,
+    )
+    assert copied[0]["outfile"]["hash"] == ""
+
+    # datafile に残っている未完了のジョブも埋める
+    pending = _generate_encoding_configs(
+        _result_cache_configs("second"),
+        [first[0] | {"outfile": {**first[0]["outfile"], "hash": ""}}],
+        "x.yml",
+        mock_args,
+    )
+    assert pending[0]["outfile"]["hash"] == "outhash"
+
+    mock_args.no_result_cache = True
+    ignored = _generate_encoding_configs(
+        _result_cache_configs("third"),
+        [],
+        "third.yml",
+        mock_args,
+    )
+    assert ignored[0]["outfile"]["hash"] == ""
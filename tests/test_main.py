@@ -11,6 +11,11 @@ from unittest.mock import mock_open
 import pytest
 from pytest_mock import MockerFixture
 
+# main は各サブコマンドのモジュールを遅延 import するため、pathlib.Path を
+# モックするテストより前に読み込んでおく (duckdb の import が Path を参照する)
+import ffvqe.config.loader
+import ffvqe.data.archive
+import ffvqe.data.csv_generator  # noqa: F401
 from ffvqe.main import create_argument_parser
 from ffvqe.main import main
 from ffvqe.main import main_encode
@@ -38,7 +43,23 @@ def test_create_argument_parser() -> None:
         "overwrite",
         "encode",
         "ffmpeg_threads",
+        "jobs",
+        "cpu_budget",
+        "pipeline",
+        "probe_jobs",
+        "vmaf_jobs",
+        "encode_batch",
+        "encode_chunks",
+        "vmaf_batch",
+        "vmaf_chunks",
+        "single_pass",
+        "fast_probe",
         "dist_save_video",
+        "dist_budget",
+        "mezzanine_budget",
+        "mezzanine_dir",
+        "shared_frames_budget",
+        "no_result_cache",
         "help",
     }
     assert expected_optional_args.issubset(optional_args)
@@ -155,7 +176,7 @@ def mock_vmaf_response() -> dict:
     }
 
 
-def test_main_encode(  # noqa: PLR0913
+def test_main_encode(  # noqa: PLR0913, PLR0917
     mocker: MockerFixture,
     mock_config: dict,
     mock_encode_cfg: list,
@@ -173,16 +194,16 @@ def test_main_encode(  # noqa: PLR0913
     mocker.patch(
         "json.load",
         side_effect=[
-            mock_encode_cfg,  # 最初の呼び出し(datafile)
-            mock_base_probe_log,  # 2番目の呼び出し(base_probe_log)
-            mock_probe_log,  # 3番目の呼び出し(probe_log)
-            mock_vmaf_log,  # 4番目の呼び出し(vmaf_log)
-            mock_base_probe_log,  # 5番目の呼び出し(2回目のループでのbase_probe_log)
+            mock_base_probe_log,  # 1番目の呼び出し(base_probe_log)
+            mock_probe_log,  # 2番目の呼び出し(probe_log)
+            mock_vmaf_log,  # 3番目の呼び出し(vmaf_log)
+            mock_base_probe_log,  # 4番目の呼び出し(2回目のループでのbase_probe_log)
         ],
     )
 
-    # json.dumpのモック
-    mock_json_dump = mocker.patch("json.dump")
+    # JobStoreのモック
+    mock_store = mocker.patch("ffvqe.data.job_store.JobStore").return_value
+    mock_store.load.return_value = mock_encode_cfg
 
     # Path.openのモック
     mocker.patch("pathlib.Path.open", mock_file_open)
@@ -193,34 +214,61 @@ def test_main_encode(  # noqa: PLR0913
     # Path.unlinkのモック
     mock_unlink = mocker.patch("pathlib.Path.unlink")
 
-    # encodingとgetvmafのモック
-    mock_encoding = mocker.patch("ffvqe.main.encoding", return_value=mock_encode_response)
-    mock_getvmaf = mocker.patch("ffvqe.main.getvmaf", return_value=mock_vmaf_response)
+    # encode_video, probe_video と getvmaf のモック
+    mock_encoding = mocker.patch(
+        "ffvqe.encoding.jobs.encode_video",
+        return_value={
+            "commandline": mock_encode_response["commandline"],
+            "elapsed_time": mock_encode_response["elapsed_time"],
+        },
+    )
+    mock_probe = mocker.patch(
+        "ffvqe.encoding.jobs.probe_video",
+        return_value={
+            "elapsed_prbt": mock_encode_response["elapsed_prbt"],
+            "stream": mock_encode_response["stream"],
+        },
+    )
+    mock_getvmaf = mocker.patch("ffvqe.encoding.jobs.getvmaf", return_value=mock_vmaf_response)
 
     # getfilehashのモック
-    mock_getfilehash = mocker.patch("ffvqe.main.getfilehash", return_value="new_hash")
-
-    # fsyncのモック (使用されていないが、将来的に使用される可能性があるため残す)
-    mocker.patch("ffvqe.main.fsync")
+    mock_getfilehash = mocker.patch("ffvqe.encoding.jobs.getfilehash", return_value="new_hash")
 
     # 引数の準備
     args = MagicMock()
     args.ffmpeg_threads = 4
+    args.jobs = 1
+    args.cpu_budget = None
+    args.pipeline = False
     args.dist_save_video = False
+    args.dist_budget = 0
+    args.mezzanine_budget = 0
+    args.shared_frames_budget = 0
+    args.vmaf_batch = 1
+    args.encode_batch = 1
+    args.encode_chunks = 1
+    args.vmaf_chunks = 1
 
     # 関数の実行
     main_encode(mock_config, args)
 
     # 検証
     assert mock_encoding.call_count == 1
+    assert mock_probe.call_count == 1
     assert mock_getvmaf.call_count == 1
     assert mock_getfilehash.call_count == 1
 
     # ファイルが削除されたことを確認
     assert mock_unlink.call_count == 1
 
-    # json.dumpが呼ばれたことを確認
-    assert mock_json_dump.call_count == 1
+    # job store が 1 行ずつ更新されたことを確認 (ステージ 4 回 + 完了時 1 回)
+    assert mock_store.update.call_count == 5
+    assert {call.args[0] for call in mock_store.update.call_args_list} == {0}
+    assert mock_store.update.call_args.args[1]["stages"]["scored"]["done"] is True
+
+    # 完了時に JSON がエクスポートされたことを確認
+    mock_store.export_json.assert_called_once_with()
+    mock_store.close.assert_called_once()
 
     # エンコード設定が更新されたことを確認
     # 注: 実際のテストでは、mock_json_dumpの引数を検証することで
@@ -241,13 +289,13 @@ def test_main_encode_with_exception(
     mocker.patch(
         "json.load",
         side_effect=[
-            mock_encode_cfg,  # 最初の呼び出し(datafile)
-            mock_base_probe_log,  # 2番目の呼び出し(base_probe_log)
+            mock_base_probe_log,  # 1番目の呼び出し(base_probe_log)
         ],
     )
 
-    # json.dumpのモック
-    mock_json_dump = mocker.patch("json.dump")
+    # JobStoreのモック
+    mock_store = mocker.patch("ffvqe.data.job_store.JobStore").return_value
+    mock_store.load.return_value = mock_encode_cfg
 
     # Path.openのモック
     mocker.patch("pathlib.Path.open", mock_file_open)
@@ -257,24 +305,61 @@ def test_main_encode_with_exception(
 
     # encodingが例外を発生させるようにモック (変数は使用されていないが、モックは必要)
     mocker.patch(
-        "ffvqe.main.encoding",
+        "ffvqe.encoding.jobs.encode_video",
         side_effect=Exception("Test exception"),
     )
 
-    # fsyncのモック
-    mock_fsync = mocker.patch("ffvqe.main.fsync")
-
     # 引数の準備
     args = MagicMock()
     args.ffmpeg_threads = 4
+    args.jobs = 1
+    args.cpu_budget = None
+    args.pipeline = False
+    args.mezzanine_budget = 0
+    args.shared_frames_budget = 0
+    args.vmaf_batch = 1
+    args.encode_batch = 1
+    args.encode_chunks = 1
+    args.vmaf_chunks = 1
 
     # 関数の実行と例外の検証
     with pytest.raises(Exception, match="Test exception"):
         main_encode(mock_config, args)
 
-    # 例外発生時にjson.dumpが呼ばれたことを確認
-    assert mock_json_dump.call_count == 1
-    assert mock_fsync.call_count == 1
+    # 例外発生時に JSON が fsync 付きでエクスポートされたことを確認
+    mock_store.export_json.assert_called_once_with(sync=True)
+    mock_store.close.assert_called_once()
+
+
+def test_main_encode_skips_pruned_jobs(
+    mocker: MockerFixture,
+    mock_config: dict,
+    mock_encode_cfg: list,
+) -> None:
+    """Test main_encode does not queue jobs pruned by an abort rule."""
+    mock_encode_cfg[0]["pruned"] = {"stage": "encode", "rule": "max_bitrate_kbs"}
+    mock_store = mocker.patch("ffvqe.data.job_store.JobStore").return_value
+    mock_store.load.return_value = mock_encode_cfg
+    mock_encoding = mocker.patch("ffvqe.encoding.jobs.encode_video")
+
+    args = MagicMock()
+    args.ffmpeg_threads = 4
+    args.jobs = 1
+    args.cpu_budget = None
+    args.pipeline = False
+    args.mezzanine_budget = 0
+    args.shared_frames_budget = 0
+    args.vmaf_batch = 1
+    args.encode_batch = 1
+    args.encode_chunks = 1
+    args.vmaf_chunks = 1
+
+    main_encode(mock_config, args)
+
+    # 打ち切ったジョブは再実行しない
+    mock_encoding.assert_not_called()
+    mock_store.update.assert_not_called()
+    mock_store.export_json.assert_called_once_with()
 
 
 def test_main_with_archive(mocker: MockerFixture) -> None:
@@ -296,14 +381,14 @@ def test_main_with_archive(mocker: MockerFixture) -> None:
     mock_path.return_value.exists.return_value = False
 
     # archiveのモック
-    mock_archive = mocker.patch("ffvqe.main.archive")
+    mock_archive = mocker.patch("ffvqe.data.archive.archive")
 
     # summaryのモック
-    mocker.patch("ffvqe.main.summary_main")
+    mocker.patch("ffvqe.summary.main")
 
     # load_configのモック
     mock_config = {"configs": {"datafile": "dummy_datafile.json"}}
-    mocker.patch("ffvqe.main.load_config", return_value=mock_config)
+    mocker.patch("ffvqe.config.loader.load_config", return_value=mock_config)
 
     # sys.exitのモック
     mock_exit = mocker.patch("sys.exit")
@@ -340,13 +425,13 @@ def test_main_with_encode(mocker: MockerFixture) -> None:
 
     # load_configのモック
     mock_config = {"configs": {"datafile": "/path/to/datafile.json"}}
-    mocker.patch("ffvqe.main.load_config", return_value=mock_config)
+    mocker.patch("ffvqe.config.loader.load_config", return_value=mock_config)
 
     # main_encodeのモック
     mock_main_encode = mocker.patch("ffvqe.main.main_encode")
 
     # getcsvのモック
-    mock_getcsv = mocker.patch("ffvqe.main.getcsv")
+    mock_getcsv = mocker.patch("ffvqe.data.csv_generator.getcsv")
 
     # 関数の実行
     main()
@@ -370,7 +455,7 @@ def test_main_with_both_flags(mocker: MockerFixture) -> None:
     mocker.patch("argparse.ArgumentParser.parse_args", return_value=mock_args)
 
     # archiveのモック
-    mock_archive = mocker.patch("ffvqe.main.archive")
+    mock_archive = mocker.patch("ffvqe.data.archive.archive")
 
     # sys.exitのモック
     mock_exit = mocker.patch("sys.exit", side_effect=SystemExit)
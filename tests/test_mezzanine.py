@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+# To add a new cell, type '# %%'
+# To add a new markdown cell, type '# %% [markdown]'
+# %%
+"""Tests for reference mezzanines and shared reference frames."""
+
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+import threading
+from typing import Any
+from unittest.mock import MagicMock
+
+import pytest
+from pytest_mock import MockerFixture
+
+from ffvqe.encoding.jobs import EncodeJob
+from ffvqe.encoding.jobs import _reference
+from ffvqe.encoding.mezzanine import Mezzanines
+from ffvqe.encoding.mezzanine import TmpfsReservations
+from ffvqe.encoding.mezzanine import raw_frame_size
+from ffvqe.encoding.reference_probe import ReferenceProbes
+from ffvqe.encoding.shared_frames import SharedFrames
+
+PROBE: dict[str, Any] = {
+    "format": {"duration": "1.0"},
+    "streams": [{"codec_type": "video", "width": 16, "height": 16, "avg_frame_rate": "10/1"}],
+}
+
+
+def _mezzanines(tmp_path: Path, budget: int, names: tuple[str, ...] = ("ref",)) -> Mezzanines:
+    probes = ReferenceProbes({f"{tmp_path / name}.m2ts": name * 64 for name in names})
+    for name in names:
+        probes._probes[name * 64] = PROBE  # noqa: SLF001
+    return Mezzanines(probes, budget, root=tmp_path / "mezzanine")
+
+
+def _fake_decode(args: list[str], **_: object) -> None:
+    Path(args[-1]).write_bytes(b"f" * 1000)
+
+
+def _encode_cfg(tmp_path: Path, name: str = "ref", hwaccels: str = "") -> dict[str, Any]:
+    return {
+        "codec": "libx264",
+        "hwaccels": hwaccels,
+        "infile": {"filename": f"{tmp_path / name}.m2ts", "option": ""},
+        "outfile": {"filename": f"{tmp_path / 'out'}", "hash": ""},
+    }
+
+
+def test_mezzanine_decoded_once(tmp_path: Path, mocker: MockerFixture) -> None:
+    mock_run = mocker.patch("ffvqe.encoding.mezzanine.run_process", side_effect=_fake_decode)
+    mezzanines = _mezzanines(tmp_path, budget=10_000)
+
+    with mezzanines.reference(_encode_cfg(tmp_path)) as first:
+        pass
+    with mezzanines.reference(_encode_cfg(tmp_path)) as second:
+        pass
+
+    mock_run.assert_called_once()
+    assert "ffv1" in mock_run.call_args.args[0]
+    assert first["infile"]["filename"] == second["infile"]["filename"]
+    assert Path(first["infile"]["filename"]).read_bytes() == b"f" * 1000
+    assert first["infile"]["option"] == ""
+
+
+def test_mezzanine_only_for_software_decode(tmp_path: Path, mocker: MockerFixture) -> None:
+    mocker.patch("ffvqe.encoding.mezzanine.run_process", side_effect=_fake_decode)
+    mezzanines = _mezzanines(tmp_path, budget=10_000)
+    encode = _encode_cfg(tmp_path, hwaccels="-hwaccel qsv")
+    job = EncodeJob(0, encode, mezzanines=mezzanines)
+
+    # QSV でデコードするエンコードは元のファイル、 libvmaf はメザニンを読む
+    with _reference(job, encode=True) as encode_cfg:
+        assert encode_cfg["infile"]["filename"] == encode["infile"]["filename"]
+    with _reference(job, encode=False) as encode_cfg:
+        assert encode_cfg["infile"]["filename"].endswith(f"{'ref' * 64}.mkv")
+
+
+def test_mezzanine_budget_keeps_references_in_use(tmp_path: Path, mocker: MockerFixture) -> None:
+    mocker.patch("ffvqe.encoding.mezzanine.run_process", side_effect=_fake_decode)
+    mezzanines = _mezzanines(tmp_path, budget=3000, names=("a", "b"))
+
+    with mezzanines.reference(_encode_cfg(tmp_path, "a")) as first:
+        # a の読み込み中は b を置く場所が無いので b は元のファイルを読む
+        with mezzanines.reference(_encode_cfg(tmp_path, "b")) as second:
+            assert second["infile"]["filename"] == f"{tmp_path / 'b'}.m2ts"
+        assert Path(first["infile"]["filename"]).is_file()
+
+    # a を使い終われば b のメザニンを作る
+    with mezzanines.reference(_encode_cfg(tmp_path, "b")) as second:
+        assert second["infile"]["filename"].endswith(f"{'b' * 64}.mkv")
+    assert not Path(first["infile"]["filename"]).exists()
+
+
+def test_shared_frames_decoded_once_for_concurrent_vmaf(
+    tmp_path: Path,
+    mocker: MockerFixture,
+) -> None:
+    mock_run = mocker.patch("ffvqe.encoding.shared_frames.run_process", side_effect=_fake_decode)
+    probes = _mezzanines(tmp_path, budget=0).probes
+    frames = SharedFrames(probes, budget=10_000, root=tmp_path / "frames")
+    mezzanines = Mezzanines(probes, budget=10_000, root=tmp_path / "mezzanine")
+    jobs = [
+        EncodeJob(index, _encode_cfg(tmp_path), mezzanines=mezzanines, frames=frames)
+        for index in range(2)
+    ]
+    for job in jobs:
+        frames.expect(job.encode["infile"]["filename"])
+
+    both_reading = threading.Barrier(2, timeout=5)
+
+    def score(job: EncodeJob) -> str:
+        with _reference(job, encode=False) as encode_cfg:
+            both_reading.wait()
+            return str(encode_cfg["infile"]["filename"])
+
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        paths = list(pool.map(score, jobs))
+
+    # 2 つの VMAF が同じフレームを読み、メザニンは作らない
+    mock_run.assert_called_once()
+    assert "yuv4mpegpipe" in mock_run.call_args.args[0]
+    assert paths[0] == paths[1]
+    assert paths[0].endswith(".y4m")
+
+    frames.done(jobs[0].encode["infile"]["filename"])
+    assert Path(paths[0]).is_file()
+    # 最後のジョブが終わるとフレームを削除する
+    frames.done(jobs[1].encode["infile"]["filename"])
+    assert not Path(paths[0]).exists()
+
+
+@pytest.mark.parametrize(
+    ("pix_fmt", "expected"),
+    [
+        ("yuv420p", 384),
+        ("yuv420p10le", 768),
+        ("yuv422p", 512),
+        ("yuv444p12le", 1536),
+        ("nv12", 384),
+        ("p010le", 768),
+        ("gray", 256),
+    ],
+)
+def test_raw_frame_size_follows_pix_fmt(pix_fmt: str, expected: int) -> None:
+    assert raw_frame_size({"width": 16, "height": 16, "pix_fmt": pix_fmt}) == expected
+
+
+def test_shared_frames_leave_room_for_mezzanine_decode(
+    tmp_path: Path,
+    mocker: MockerFixture,
+) -> None:
+    mocker.patch("ffvqe.encoding.shared_frames.run_process", side_effect=_fake_decode)
+    mocker.patch(
+        "ffvqe.encoding.shared_frames.shutil.disk_usage",
+        return_value=MagicMock(free=10_000),
+    )
+    reservations = TmpfsReservations()
+    probes = _mezzanines(tmp_path, budget=0).probes
+    frames = SharedFrames(
+        probes,
+        budget=10_000,
+        root=tmp_path / "frames",
+        reservations=reservations,
+    )
+    encode = _encode_cfg(tmp_path)
+    frames.expect(encode["infile"]["filename"])
+
+    # デコード中のメザニンが空き容量を使い切る予定なので、フレームは作らない
+    with reservations.writing(tmp_path / "mezzanine.partial.mkv", 9000):
+        assert frames.acquire(encode["infile"]["filename"]) is None
+
+    with frames.reference(encode) as encode_cfg:
+        assert encode_cfg["infile"]["filename"].endswith(".y4m")
@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+# To add a new cell, type '# %%'
+# To add a new markdown cell, type '# %% [markdown]'
+# %%
+"""Tests for the disk-budgeted output store."""
+
+from pathlib import Path
+
+import pytest
+from pytest_mock import MockerFixture
+
+from ffvqe.data.output_store import OutputStore
+from ffvqe.data.output_store import parse_size
+from ffvqe.encoding.jobs import EncodeJob
+
+
+def _output(tmp_path: Path, name: str, size: int) -> Path:
+    path = tmp_path / "dist" / f"{name}.mkv"
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(name.encode() * size)
+    return path
+
+
+def test_parse_size() -> None:
+    assert parse_size("1024") == 1024
+    assert parse_size("500M") == 500 * 1024**2
+    assert parse_size("1.5GiB") == int(1.5 * 1024**3)
+    with pytest.raises(ValueError, match="Invalid size"):
+        parse_size("lots")
+
+
+def test_output_store_evicts_least_recently_used(tmp_path: Path) -> None:
+    with OutputStore(budget=300, root=tmp_path / "store") as store:
+        first = store.put(_output(tmp_path, "a", 100), "a" * 64)
+        second = store.put(_output(tmp_path, "b", 100), "b" * 64)
+        # a を使ったので、次に追加したときは b が削除される
+        assert store.get("a" * 64) == first
+        third = store.put(_output(tmp_path, "c", 150), "c" * 64)
+
+        assert first is not None
+        assert first.is_file()
+        assert second is not None
+        assert not second.exists()
+        assert third is not None
+        assert third.is_file()
+        assert store.size() == 250
+        assert list((tmp_path / "dist").iterdir()) == []
+
+        # 予算を超える出力は残さない
+        assert store.put(_output(tmp_path, "d", 400), "d" * 64) is None
+
+
+def test_encode_job_restores_output_from_store(tmp_path: Path, mocker: MockerFixture) -> None:
+    root = tmp_path / "store"
+    mocker.patch("ffvqe.encoding.jobs.OUTPUT_STORE_DIR", root)
+    outfile = tmp_path / "dist" / "out"
+    with OutputStore(budget=1000, root=root) as store:
+        store.put(_output(tmp_path, "out", 10), "e" * 64)
+
+    encode = {
+        "infile": {"filename": "input.m2ts"},
+        "outfile": {"filename": f"{outfile}", "hash": ""},
+        "stages": {
+            "encoded": {"done": True, "artifact": f"{outfile}.mkv"},
+            "hashed": {"done": True, "artifact": f"{outfile}.mkv", "hash": "e" * 64},
+        },
+    }
+    job = EncodeJob(0, encode)
+
+    # VMAF をやり直すために .mkv がストアから戻される
+    assert job.done("encoded")
+    assert Path(f"{outfile}.mkv").read_bytes() == b"out" * 10
@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+# To add a new cell, type '# %%'
+# To add a new markdown cell, type '# %% [markdown]'
+# %%
+"""Tests for the asyncio subprocess runner."""
+
+from pathlib import Path
+import subprocess
+import sys
+import time
+
+import pytest
+
+from ffvqe.encoding.runner import run_process
+from ffvqe.encoding.runner import run_processes
+
+# -progress pipe:1 -nostats を受け取り、 FFmpeg と同じ形式で進捗を出力するスクリプト
+FAKE_FFMPEG = """
+import sys
+print("  Duration: 00:00:10.00, start: 0.000000, bitrate: 1 kb/s", file=sys.stderr)
+assert sys.argv[1:4] == ["-progress", "pipe:1", "-nostats"], sys.argv
+for us in (2_500_000, 5_000_000, 10_000_000):
+    print(f"out_time_us={us}")
+    print("progress=continue")
+print("progress=end")
+"""
+
+
+def test_run_process_reports_ffmpeg_progress(tmp_path: Path) -> None:
+    ffmpeg = tmp_path / "ffmpeg"
+    ffmpeg.write_text(f"#!{sys.executable}\n{FAKE_FFMPEG}")
+    ffmpeg.chmod(0o755)
+
+    percents: list[float] = []
+    result = run_process([f"{ffmpeg}", "-i", "in.mkv"], progress=percents.append)
+    assert result.returncode == 0
+    assert percents == [25.0, 50.0, 100.0, 100.0]
+
+
+def test_run_process_captures_stdout_and_raises_on_failure() -> None:
+    result = run_process([sys.executable, "-c", "print('ok')"], capture_stdout=True)
+    assert result.stdout == b"ok\n"
+
+    with pytest.raises(subprocess.CalledProcessError) as excinfo:
+        run_process([sys.executable, "-c", "import sys; sys.exit('boom')"])
+    assert excinfo.value.returncode == 1
+    assert "boom" in excinfo.value.stderr
+
+
+def test_run_process_timeout_terminates_process() -> None:
+    start = time.monotonic()
+    with pytest.raises(subprocess.TimeoutExpired):
+        run_process([sys.executable, "-c", "import time; time.sleep(30)"], timeout=0.5)
+    assert time.monotonic() - start < 10
+
+
+def test_run_processes_runs_concurrently() -> None:
+    start = time.monotonic()
+    results = run_processes(
+        [[sys.executable, "-c", f"import time; time.sleep(0.5); print({n})"] for n in range(4)],
+        capture_stdout=True,
+    )
+    assert [result.stdout for result in results] == [b"0\n", b"1\n", b"2\n", b"3\n"]
+    assert time.monotonic() - start < 2.0
+
+
+def test_run_process_streams_stdout_lines() -> None:
+    lines: list[bytes] = []
+    result = run_process(
+        [sys.executable, "-c", "print('I'); print('P'); print('B')"],
+        on_stdout=lines.append,
+    )
+    assert lines == [b"I\n", b"P\n", b"B\n"]
+    assert result.stdout == b""
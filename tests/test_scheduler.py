@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+# To add a new cell, type '# %%'
+# To add a new markdown cell, type '# %% [markdown]'
+# %%
+"""Tests for the core budget and the staged job pipeline."""
+
+import threading
+import time
+
+import pytest
+
+from ffvqe.encoding.pipeline import BatchStage
+from ffvqe.encoding.pipeline import Pipeline
+from ffvqe.encoding.pipeline import Stage
+from ffvqe.encoding.scheduler import CoreBudget
+from ffvqe.encoding.scheduler import JobSlot
+
+
+def test_core_budget_clamps_to_total() -> None:
+    budget = CoreBudget(4)
+    with budget.reserve(16) as cores:
+        assert cores == 4
+    with budget.reserve(0) as cores:
+        assert cores == 0
+
+
+def test_pipeline_respects_core_budget() -> None:
+    lock = threading.Lock()
+    running = 0
+    peak = 0
+
+    def worker(job: int, slot: JobSlot) -> int:
+        nonlocal running, peak
+        assert slot.cores == 4
+        with lock:
+            running += 1
+            peak = max(peak, running)
+        time.sleep(0.05)
+        with lock:
+            running -= 1
+        return job * 2
+
+    pipeline: Pipeline[int] = Pipeline([Stage("job", worker, workers=8, cores=4)], CoreBudget(8))
+    results = sorted(pipeline.run(range(6)))
+
+    assert results == [job * 2 for job in range(6)]
+    assert peak == 2
+
+
+def test_pipeline_overlaps_stages() -> None:
+    events: list[tuple[str, int]] = []
+    lock = threading.Lock()
+
+    def record(name: str) -> Stage[int]:
+        def func(job: int, slot: JobSlot) -> int:  # noqa: ARG001
+            with lock:
+                events.append((f"{name}-start", job))
+            time.sleep(0.05)
+            with lock:
+                events.append((f"{name}-end", job))
+            return job
+
+        return Stage(name, func, workers=1, cores=1)
+
+    pipeline: Pipeline[int] = Pipeline([record("encode"), record("vmaf")], CoreBudget(4))
+    assert sorted(pipeline.run(range(3))) == [0, 1, 2]
+
+    # job 1 の encode は job 0 の vmaf 終了前に開始している
+    assert events.index(("encode-start", 1)) < events.index(("vmaf-end", 0))
+    assert pipeline.eta(2) > 0
+    assert pipeline.status() == "encode 0/1, vmaf 0/1"
+
+
+def test_pipeline_propagates_stage_error() -> None:
+    def worker(job: int, slot: JobSlot) -> int:  # noqa: ARG001
+        if job == 1:
+            msg = "boom"
+            raise RuntimeError(msg)
+        return job
+
+    pipeline: Pipeline[int] = Pipeline([Stage("job", worker, workers=2)], CoreBudget(2))
+    with pytest.raises(RuntimeError, match="boom"):
+        list(pipeline.run(range(4)))
+
+
+def test_pipeline_batches_jobs_by_key() -> None:
+    batches: list[list[int]] = []
+
+    def score(jobs: list[int], slot: JobSlot) -> list[int]:  # noqa: ARG001
+        batches.append(sorted(jobs))
+        return jobs
+
+    pipeline: Pipeline[int] = Pipeline(
+        [
+            Stage("encode", lambda job, slot: job, workers=2),  # noqa: ARG005
+            BatchStage("vmaf", score, key=lambda job: job % 2, batch=3),
+        ],
+        CoreBudget(4),
+    )
+    assert sorted(pipeline.run(range(8))) == list(range(8))
+
+    # キーごとに 3 件ずつまとめ、残りはジョブが尽きた時点でまとめる
+    assert sorted(len(batch) for batch in batches) == [1, 1, 3, 3]
+    assert all(len({job % 2 for job in batch}) == 1 for batch in batches)
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+# To add a new cell, type '# %%'
+# To add a new markdown cell, type '# %% [markdown]'
+# %%
+"""Startup benchmark: import time and heavy dependencies of every subcommand.
+
+Run ``task bench_startup`` to print the import time of each subcommand.
+"""
+
+import os
+from pathlib import Path
+import subprocess
+import sys
+
+import pytest
+
+import ffvqe
+
+# Modules imported by each subcommand before it starts working
+SUBCOMMANDS: dict[str, str] = {
+    "cli": "import ffvqe.main; ffvqe.main.create_argument_parser()",
+    "summary": "import ffvqe.main; import ffvqe.summary",
+    "archive": "import ffvqe.main; import ffvqe.data.archive",
+    "encode": (
+        "import ffvqe.main; import ffvqe.config.loader; import ffvqe.encoding.jobs;"
+        " import ffvqe.encoding.pipeline"
+    ),
+}
+
+# Heavy modules that a subcommand must not import at startup
+FORBIDDEN: dict[str, set[str]] = {
+    "cli": {"duckdb", "requests", "tqdm", "ruamel", "bokeh", "asyncio"},
+    "summary": {"requests", "tqdm", "bokeh", "asyncio"},
+    "archive": {"duckdb", "requests", "tqdm", "bokeh", "asyncio"},
+    "encode": {"duckdb", "requests", "tqdm", "bokeh"},
+}
+
+
+# Generous upper bound of the argument parser startup; catches heavy imports creeping back
+CLI_BUDGET_MS: float = 250.0
+
+
+def _importtime(code: str) -> tuple[set[str], float]:
+    """Run ``code`` in a fresh interpreter and measure its imports.
+
+    Args:
+        code: Python code to run; its first import must be an ``ffvqe`` module.
+
+    Returns:
+        Names of all imported modules and the import time of ``code`` in ms.
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        capture_output=True,
+        check=True,
+        env={**os.environ, "PYTHONPATH": f"{Path(ffvqe.__file__).parent.parent}"},
+        text=True,
+    )
+    modules: set[str] = set()
+    total_us = 0
+    started = False
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line.removeprefix("import time:").split("|")
+        modules.add(name.strip())
+        # インタープリター起動時の import (site など) は除く
+        started = started or name.strip().startswith("ffvqe")
+        if started and not name.startswith("  "):
+            total_us += int(cumulative)
+    return modules, total_us / 1000
+
+
+@pytest.mark.parametrize("subcommand", SUBCOMMANDS)
+def test_startup_imports(subcommand: str) -> None:
+    modules, elapsed_ms = _importtime(SUBCOMMANDS[subcommand])
+    print(f"[STARTUP] {subcommand:8} import time: {elapsed_ms:8.1f} ms")  # noqa: T201
+
+    loaded = {name.split(".", 1)[0] for name in modules}
+    assert loaded & FORBIDDEN[subcommand] == set()
+    if subcommand == "cli":
+        assert elapsed_ms < CLI_BUDGET_MS
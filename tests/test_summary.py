@@ -8,6 +8,7 @@ from pathlib import Path
 from unittest.mock import MagicMock
 from unittest.mock import patch
 
+import duckdb
 import pytest
 
 from ffvqe.summary import create_temp_table
@@ -45,3 +46,22 @@ def test_show_aggregated_results() -> None:
         show_aggregated_results()
         assert mock_sql.call_count == 2
         assert mock_sql.return_value.show.call_count == 2
+
+
+def test_show_aggregated_results_marks_single_pass(
+    tmp_path: Path,
+    capsys: pytest.CaptureFixture[str],
+) -> None:
+    csv_file = tmp_path / "single_pass.csv"
+    csv_file.write_text(
+        "codec,ref_type,outfile_size_kbyte,outfile_bit_rate_kbs,enc_sec,comp_ratio_persent,"
+        "ssim_mean,vmaf_min,vmaf_mean,gop,has_b_frames,refs,fI,fP,fB,outfile_options,single_pass\n"
+        "libx264,type1,1000,2000,10,0.9,0.995,90,95,250,2,1,1,10,20,-crf 23,false\n"
+        "libx264,type1,1000,2000,,0.9,0.995,90,95,250,2,1,1,10,20,-crf 23,true\n",
+    )
+    with duckdb.connect() as connection, patch("ffvqe.summary.duckdb", connection):
+        create_temp_table(f"{csv_file}")
+        show_aggregated_results()
+
+    # 単一パスのジョブは別の行に集計する
+    assert capsys.readouterr().out.count("-crf 23") == 4
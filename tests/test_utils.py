@@ -25,6 +25,22 @@ def test_getfilehash() -> None:
         assert result == expected_hash
 
 
+def test_getfilehash_cache(tmp_path: Path) -> None:
+    """Test that unchanged files are not hashed again when cached."""
+    target = tmp_path / "reference.m2ts"
+    target.write_bytes(b"x" * 10_000_000)
+    expected_hash = hashlib.sha256(b"x" * 10_000_000).hexdigest()
+
+    assert getfilehash(f"{target}", cache=True) == expected_hash
+    with patch("hashlib.sha256") as mock_sha256:
+        assert getfilehash(f"{target}", cache=True) == expected_hash
+        mock_sha256.assert_not_called()
+
+    # 内容が変わったら再計算する
+    target.write_bytes(b"y")
+    assert getfilehash(f"{target}", cache=True) == hashlib.sha256(b"y").hexdigest()
+
+
 def test_split_large_file_not_exists() -> None:
     """Test split_large_file function when file does not exist."""
     with patch("pathlib.Path.exists", return_value=False):
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+# To add a new cell, type '# %%'
+# To add a new markdown cell, type '# %% [markdown]'
+# %%
+"""Tests for chunk-parallel VMAF."""
+
+import json
+from pathlib import Path
+from typing import Any
+
+import pytest
+from pytest_mock import MockerFixture
+
+from ffvqe.encoding.encoder import getvmaf
+from ffvqe.encoding.runner import ProcessResult
+from ffvqe.encoding.vmaf_chunks import merge_logs
+from ffvqe.encoding.vmaf_chunks import plan_ranges
+from ffvqe.encoding.vmaf_chunks import pool_metrics
+
+
+def _encode_cfg(tmp_path: Path) -> dict[str, Any]:
+    return {
+        "codec": "libx265",
+        "hwaccels": "",
+        "infile": {"filename": f"{tmp_path / 'ref.m2ts'}", "option": ""},
+        "outfile": {"filename": f"{tmp_path / 'out'}", "options": "-crf 20"},
+    }
+
+
+def _score(frame: int) -> float:
+    return 80.0 + frame % 7
+
+
+def _log(first: int, last: int) -> dict[str, Any]:
+    """VMAF log of a trimmed range, numbered from 0 as libvmaf writes it."""
+    return {
+        "version": "3.0.0",
+        "frames": [
+            {"frameNum": frame - first, "metrics": {"vmaf": _score(frame)}}
+            for frame in range(first, last)
+        ],
+        "pooled_metrics": {},
+    }
+
+
+def test_plan_ranges() -> None:
+    assert plan_ranges(10, 3) == [(0, 3), (3, 6), (6, 10)]
+    # フレームより多くは分割しない
+    assert plan_ranges(2, 4) == [(0, 1), (1, 2)]
+
+
+def test_pool_metrics_harmonic_mean() -> None:
+    pooled = pool_metrics([{"metrics": {"vmaf": 0.0}}, {"metrics": {"vmaf": 2.0}}])
+
+    assert pooled["vmaf"] == {"min": 0.0, "max": 2.0, "mean": 1.0, "harmonic_mean": 0.5}
+
+
+def test_merge_logs_drops_overlap() -> None:
+    ranges = [(0, 5), (5, 10)]
+    scored = [(0, 7), (3, 10)]
+    logs = [{**_log(*range_), "fps": 12.5, "aggregate_metrics": {}} for range_ in scored]
+
+    merged = merge_logs(logs, ranges, scored)
+
+    # 重ねて計測したフレームを捨て、全体を 1 回で計測した場合と同じになる
+    # (範囲ごとの fps などは含めない)
+    assert merged == {
+        "version": "3.0.0",
+        "frames": _log(0, 10)["frames"],
+        "pooled_metrics": pool_metrics(_log(0, 10)["frames"]),
+    }
+
+
+def test_getvmaf_chunked(tmp_path: Path, mocker: MockerFixture) -> None:
+    encode_cfg = _encode_cfg(tmp_path)
+    # エンコード結果は 0 秒から、リファレンスは 1 秒から 10 fps
+    mock_probe = mocker.patch(
+        "ffvqe.encoding.vmaf_chunks._probe_frames",
+        return_value={"pts": [frame / 10 for frame in range(100)], "keyframes": [0]},
+    )
+    mocker.patch(
+        "ffvqe.encoding.vmaf_chunks.reference_frames",
+        return_value={"pts": [1.0 + frame / 10 for frame in range(100)], "keyframes": [0]},
+    )
+
+    def _run_chunks(commands: list[list[str]], **kwargs: Any) -> list[ProcessResult]:  # noqa: ANN401
+        for cmd, own in zip(commands, kwargs["per_command"], strict=True):
+            own["progress"](100.0)
+            lavfi = cmd[cmd.index("-lavfi") + 1]
+            # シーク位置はフレームとその前のフレームの中間
+            first = round(float(cmd[cmd.index("-ss") + 1]) * 10 + 0.5) if "-ss" in cmd else 0
+            count = int(lavfi.split("end_frame=")[1].split(",")[0])
+            log_path = lavfi.split("log_path=")[1].split(":")[0]
+            Path(log_path).write_text(json.dumps(_log(first, first + count)))
+        return [ProcessResult(cmd, 0, b"", "", 2.0 + index) for index, cmd in enumerate(commands)]
+
+    mock_run = mocker.patch("ffvqe.encoding.vmaf_chunks.run_processes", side_effect=_run_chunks)
+
+    result = getvmaf(encode_cfg, cpu_count=8, chunks=4, frames=100)
+
+    mock_probe.assert_called_once_with(f"{tmp_path / 'out'}.mkv")
+    commands = mock_run.call_args.args[0]
+    assert len(commands) == 4
+    assert all("n_threads=2:" in cmd[cmd.index("-lavfi") + 1] for cmd in commands)
+    # 先頭の範囲はシークせず、残りは両方の入力を範囲の先頭フレームへシークする
+    assert "-ss" not in commands[0]
+    assert [commands[1][index + 1] for index, arg in enumerate(commands[1]) if arg == "-ss"] == [
+        "2.250000",
+        "3.250000",
+    ]
+    assert commands[1].index("-ss") < commands[1].index("-i")
+    lavfi = commands[1][commands[1].index("-lavfi") + 1]
+    assert "trim=start_frame=0:end_frame=29,settb=AVTB,setpts=N/(29.97*TB)" in lavfi
+    with (tmp_path / "out_vmaf.json").open() as file:
+        merged = json.load(file)
+    assert [frame["frameNum"] for frame in merged["frames"]] == list(range(100))
+    assert merged["pooled_metrics"]["vmaf"]["mean"] == pytest.approx(
+        sum(_score(frame) for frame in range(100)) / 100,
+    )
+    # 範囲ごとのログは削除し、実時間は最も遅い範囲
+    assert sorted(path.name for path in tmp_path.iterdir()) == ["out_vmaf.json"]
+    assert result["elapsed_time"] == 5.0